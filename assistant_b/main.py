@@ -2,7 +2,6 @@
 
 import os
 import sys
-import time
 import threading
 import asyncio
 from pathlib import Path
@@ -10,9 +9,11 @@ from dotenv import load_dotenv
 
 sys.path.append(str(Path(__file__).resolve().parent.parent))
 
+from common.admission import AdmissionController
 from common.messenger import Messenger
 from common.signaling_handshake import connect
-from common.agent import get_response_from_phi
+from common.agent import LLM_BACKEND, answer, intent_summary
+from utils.ollama_models import get_manager
 
 load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY")
@@ -20,77 +21,105 @@ SECRET_KEY = os.getenv("SECRET_KEY")
 NAME = Path(__file__).resolve().parent.name  # 'assistant_a' or 'assistant_b'
 PEER = "assistant_b" if NAME == "assistant_a" else "assistant_a"
 
-# Prepare asyncio loop
+# --fast-start: show the prompt immediately, negotiate WebRTC in the background
+FAST_START = "--fast-start" in sys.argv or os.getenv("PEERAI_FAST_START") == "1"
+# >0: decrypt inbound messages on this many worker processes (common/sharding.py)
+SHARDS = int(os.getenv("PEERAI_SHARDS", "0"))
+# record all (plaintext) traffic to this jsonl file for `python -m common.replay`
+CAPTURE = os.getenv("PEERAI_CAPTURE")
+
+# asyncio loop – runs in its own thread so aiortc, the path prober and the
+# delivery layer keep working while the prompt blocks on input()
 loop = asyncio.new_event_loop()
-asyncio.set_event_loop(loop)
 
-# ── Boot WebRTC ──
-print(f"[{NAME}] Using key {SECRET_KEY!r} – starting handshake…")
-outbound, inbound = loop.run_until_complete(connect(NAME, PEER, SECRET_KEY))
+from common.combined_transport import CombinedTransport
+from common.delivery import ReliableChannel
+from common.inbound import InboundPipeline
+from common.transport import FileTransport
 
 # ── Start Messenger ──
-from common.transport import BaseTransport  # type: ignore
-
-class CombinedTransport(BaseTransport):
-    def __init__(self, outbound, inbound):
-        self.outbound = outbound
-        self.inbound = inbound
-
-    async def send_message(self, *args, **kwargs):
-        return await self.outbound.send_message(*args, **kwargs)
-
-    async def receive_messages(self, recipient):
-        return await self.inbound.receive_messages(recipient)
-
-    def archive_inbox(self, recipient):
-        return
-
-    def clear_inbox(self, recipient):
-        return
-
-    def peek_messages(self, recipient):
-        return []
-
-transport = CombinedTransport(outbound, inbound)
-messenger = Messenger(self_name=NAME, shared_key=SECRET_KEY)
-
-# ── Background thread to poll messages ──
-def poll_for_incoming():
-    while True:
-        incoming = messenger.receive_messages()
-        for msg in incoming:
-            sender = msg["from"]
-            content = msg["plaintext"]
-            if msg.get("user_initiated", False):
-                print(f"\033[94m[{NAME}] 💬 {sender} says: {content}\033")
-                
-                # 🔥 Call local AI to generate response
-                response = get_response_from_phi(content)
-                print(f"\033[94m[{NAME}] 🤖 Responding with: {response}\033")
-                messenger.send_message(
-                    to=sender,
-                    message=response,
-                    user_initiated=False  # since it's an auto-reply
-                )
-            else:
-                print(f"\033[94m[{NAME}] 🤖 Got reply from {sender}: {content}\033")
-        time.sleep(1)
-
-threading.Thread(target=poll_for_incoming, daemon=True).start()
+# per‑peer rate limits + load shedding before any decryption (common/admission.py)
+admission = AdmissionController(NAME)
+file_transport = FileTransport()
+# AES‑GCM end to end; the shared inbox carries traffic until WebRTC is up
+capture = None
+if CAPTURE and __name__ == "__main__":
+    from common.replay import Recorder
+    capture = Recorder(CAPTURE)
+messenger = Messenger(self_name=NAME, shared_key=SECRET_KEY, admission=admission,
+                      transport=file_transport, capture=capture)
+messenger.peers.add(PEER)      # busy notices only go to peers we know
+# seq / ack / replay on top (common/delivery.py) – created in the main process
+# only, shard workers re‑import this file
+channel = ReliableChannel(messenger, NAME) if __name__ == "__main__" else None
+
+# ── Boot WebRTC ──
+transport_ready = threading.Event()
+
+def negotiate_transport():
+    print(f"[{NAME}] Using key {SECRET_KEY!r} – starting handshake…")
+    outbound, inbound = asyncio.run_coroutine_threadsafe(connect(NAME, PEER, SECRET_KEY), loop).result()
+    # WebRTC first, shared inbox directory as the fallback path
+    transport = CombinedTransport(outbound, inbound, fallbacks={"file": file_transport})
+    # a path the prober brings back gets everything that is still unacked
+    transport.on_recover.append(lambda peer, path: channel.replay(peer))
+    # ping/pong RTT per path; a failed path is re‑promoted only by a good probe
+    transport.start_prober([PEER], loop=loop)
+    messenger.transport = transport
+    asyncio.run_coroutine_threadsafe(channel.replay(PEER), loop)
+    transport_ready.set()
+
+# guarded: shard workers started with "spawn" re‑import this file
+if __name__ == "__main__":
+    threading.Thread(target=loop.run_forever, name="asyncio", daemon=True).start()
+    asyncio.run_coroutine_threadsafe(channel.run_retransmitter(), loop)
+    if FAST_START:
+        # the inbox fallback carries messages until the link is up
+        threading.Thread(target=negotiate_transport, daemon=True).start()
+    else:
+        negotiate_transport()
+
+# ── Receive loop (runs on the asyncio thread) ──
+async def handle_incoming(msg):
+    sender = msg.sender
+    content = msg.body
+    if msg.type == "busy":
+        print(f"\033[93m[{NAME}] ⏳ {sender} is busy: {content}\033")
+    elif msg.user_initiated:
+        print(f"\033[94m[{NAME}] 💬 {sender} says: {content}\033")
+
+        # 🔥 Intent router, then local AI for anything it can't answer
+        response = await loop.run_in_executor(None, answer, content, NAME)
+        print(f"\033[94m[{NAME}] 🤖 Responding with: {response}\033")
+        await channel.send(sender, response, user_initiated=False)  # auto-reply
+    else:
+        print(f"\033[94m[{NAME}] 🤖 Got reply from {sender}: {content}\033")
+
+async def receive_loop():
+    """Acks and notices inline, typed messages and replies on handler tasks."""
+    processor = None
+    if SHARDS:
+        from common.sharding import ShardedProcessor
+        processor = ShardedProcessor(SHARDS, shared_key=SECRET_KEY)
+    await InboundPipeline(messenger, channel, handle_incoming, processor).run()
 
 if __name__ == "__main__":
-    threading.Thread(target=poll_for_incoming, daemon=True).start()
+    if LLM_BACKEND == "ollama":
+        get_manager().start()       # preload + keep‑alive so the first reply is warm
+    asyncio.run_coroutine_threadsafe(receive_loop(), loop)
     print(f"\033[94m[{NAME}] You can start chatting with {PEER} (Ctrl+C to exit)\033")
 
     try:
         while True:
             user_input = input("> ").strip()
             if user_input:
-                messenger.send_message(
-                    to=PEER,
-                    message=user_input,
-                    user_initiated=True
-                )
+                # persisted in the outbox first, so a dead link only delays it
+                asyncio.run_coroutine_threadsafe(
+                    channel.send(PEER, user_input, user_initiated=True), loop)
     except KeyboardInterrupt:
         print("\n[Exit]")
-
+        if admission.summary():
+            print(f"📊 ingress: {admission.summary()}")
+        print(f"📊 intents: {intent_summary()}")
+        if LLM_BACKEND == "ollama" and get_manager().summary():
+            print(f"📊 models: {get_manager().summary()}")
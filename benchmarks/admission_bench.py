@@ -0,0 +1,70 @@
+# benchmarks/admission_bench.py
+"""
+One flooding peer vs one polite peer: inbound cost with and without
+common.admission in front of decryption.
+
+    python benchmarks/admission_bench.py --flood 20000 --polite 20
+
+The whole inbox is one poll; the time shown is how long the polite peer's
+messages wait behind the flood before they are decrypted.
+"""
+import argparse
+import hashlib
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from common.admission import AdmissionController
+from common.message import Message
+from common.messenger import decrypt_payload, encrypt_payload
+
+SECRET = "bench-secret"
+
+
+def make_inbox(flood: int, polite: int, size: int):
+    key = hashlib.sha256(SECRET.encode()).digest()
+    body = encrypt_payload(key, "x" * size)
+    msgs = [Message("flooder", "me", "user", body, encrypted=True, user_initiated=True)
+            for _ in range(flood)]
+    msgs += [Message("polite", "me", "user", body, encrypted=True, user_initiated=True)
+             for _ in range(polite)]
+    random.Random(0).shuffle(msgs)
+    return key, msgs
+
+
+def run(label: str, key: bytes, msgs, admission=None):
+    t0 = time.perf_counter()
+    if admission is not None:
+        msgs = admission.filter(msgs)
+    done = {"flooder": 0, "polite": 0}
+    for m in msgs:
+        decrypt_payload(key, m.body)
+        done[m.sender] += 1
+    elapsed = time.perf_counter() - t0
+    print(f"{label:<14} {elapsed * 1000:9.1f} ms   decrypted flooder={done['flooder']:<6} "
+          f"polite={done['polite']}")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--flood", type=int, default=20_000)
+    parser.add_argument("--polite", type=int, default=20)
+    parser.add_argument("--size", type=int, default=2048)
+    parser.add_argument("--max-pending", type=int, default=256)
+    args = parser.parse_args()
+
+    key, msgs = make_inbox(args.flood, args.polite, args.size)
+    run("no admission", key, msgs)
+    notices = []
+    admission = AdmissionController("me", max_pending=args.max_pending,
+                                    notify=lambda peer, body: notices.append(peer))
+    run("admission", key, msgs, admission)
+    print(admission.summary())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# benchmarks/group_bench.py
+"""
+Fan‑out cost to N peers: per‑recipient sends vs an encrypt‑once broadcast.
+
+    python benchmarks/group_bench.py --peers 1 8 64 256 --size 4096
+
+"per‑peer" encrypts the body for every recipient and writes each inbox on
+its own, like calling Messenger.send_message in a loop.  "broadcast" is
+common.groups: one encryption and one batched FileTransport.deliver_many.
+The crypto column shows how much of each run is spent encrypting.
+"""
+import argparse
+import asyncio
+import hashlib
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from common.groups import GroupManager
+from common.message import Message
+from common.messenger import encrypt_payload
+from common.transport import FileTransport
+
+SECRET = "bench-secret"
+
+
+def per_peer(transport: FileTransport, peers, body: str):
+    key = hashlib.sha256(SECRET.encode()).digest()
+    crypto = 0.0
+    for peer in peers:
+        t0 = time.perf_counter()
+        sealed = encrypt_payload(key, body)
+        crypto += time.perf_counter() - t0
+        transport.deliver(Message("bench", peer, "user", sealed, encrypted=True))
+    return crypto
+
+
+def broadcast(groups: GroupManager, transport: FileTransport, body: str):
+    t0 = time.perf_counter()
+    sends = groups.seal("bench", body)
+    crypto = time.perf_counter() - t0
+    transport.deliver_many(sends)
+    return crypto
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--peers", type=int, nargs="+", default=[1, 8, 64, 256])
+    parser.add_argument("--size", type=int, default=4096, help="plaintext bytes")
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+    body = "x" * args.size
+
+    print(f"{'peers':>6} {'mode':<10} {'ms/send':>9} {'crypto ms':>10} {'crypto %':>9}")
+    for n in args.peers:
+        peers = [f"peer{i:04d}" for i in range(n)]
+        for mode in ("per-peer", "broadcast"):
+            transport = FileTransport(tempfile.mkdtemp(prefix="peerai-groups-"))
+            groups = GroupManager("bench", SECRET, persist=False)
+            asyncio.run(groups.create("bench", peers, transport))
+            for p in peers:
+                transport.clear_inbox(p)
+
+            crypto = 0.0
+            t0 = time.perf_counter()
+            for _ in range(args.rounds):
+                if mode == "per-peer":
+                    crypto += per_peer(transport, peers, body)
+                else:
+                    crypto += broadcast(groups, transport, body)
+                for p in peers:                      # keep inbox size constant
+                    transport.clear_inbox(p)
+            total = time.perf_counter() - t0
+            print(f"{n:>6} {mode:<10} {total / args.rounds * 1000:9.2f} "
+                  f"{crypto / args.rounds * 1000:10.3f} {crypto / total * 100:8.1f}%")
+
+
+if __name__ == "__main__":
+    main()
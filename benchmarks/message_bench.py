@@ -0,0 +1,105 @@
+# benchmarks/message_bench.py
+"""
+Per‑message memory and codec cost: legacy dicts vs common.message.Message.
+
+    python benchmarks/message_bench.py                 # 1M messages
+    python benchmarks/message_bench.py --count 100000
+
+"legacy" is the dict FileTransport used to build per message, including a
+datetime.utcnow().isoformat() timestamp.  Sender/type strings are built
+from fresh objects each time, as they are when decoded off the wire.
+"""
+import argparse
+import gc
+import json
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from common.message import Message, decode, encode
+
+PEERS = ("assistant_a", "assistant_b")
+TYPES = ("user", "bot")
+
+
+def _fresh(s: str) -> str:
+    return "".join(list(s))        # new str object, like json.loads would give
+
+
+def build_legacy(n: int):
+    return [{
+        "from": _fresh(PEERS[i & 1]),
+        "message": "How are you today?",
+        "timestamp": datetime.utcnow().isoformat(),
+        "type": _fresh(TYPES[i & 1]),
+        "conversation_id": None,
+        "user_initiated": bool(i & 1),
+        "hmac_sig": None,
+    } for i in range(n)]
+
+
+def build_messages(n: int):
+    return [Message(_fresh(PEERS[i & 1]), _fresh(PEERS[~i & 1]), _fresh(TYPES[i & 1]),
+                    "How are you today?", user_initiated=bool(i & 1)) for i in range(n)]
+
+
+def measure(label: str, fn, n: int):
+    # time an untraced build – tracemalloc slows every allocation down
+    gc.collect()
+    t0 = time.perf_counter()
+    items = fn(n)
+    elapsed = time.perf_counter() - t0
+    del items
+    gc.collect()
+    tracemalloc.start()
+    items = fn(n)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<8} build {elapsed:6.2f} s   {current / n:7.1f} B/msg   "
+          f"{current / 2**20:8.1f} MiB total")
+    return items
+
+
+def codec_round_trip(label: str, enc, dec, items):
+    t0 = time.perf_counter()
+    blobs = [enc(m) for m in items]
+    t1 = time.perf_counter()
+    for b in blobs:
+        dec(b)
+    t2 = time.perf_counter()
+    size = sum(len(b) for b in blobs) / len(blobs)
+    n = len(items)
+    print(f"{label:<16} encode {(t1 - t0) / n * 1e6:6.2f} µs   decode {(t2 - t1) / n * 1e6:6.2f} µs   "
+          f"{size:6.1f} B/msg")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=1_000_000)
+    parser.add_argument("--codec-count", type=int, default=200_000,
+                        help="messages used for the encode/decode timings")
+    args = parser.parse_args()
+
+    print(f"── memory, {args.count:,} messages ──")
+    legacy = measure("legacy", build_legacy, args.count)
+    del legacy
+    messages = measure("Message", build_messages, args.count)
+
+    sample = messages[:args.codec_count]
+    legacy_sample = [{**m.to_dict(), "timestamp": m.timestamp} for m in sample]
+    print(f"\n── codecs, {len(sample):,} messages ──")
+    codec_round_trip("legacy json", lambda d: json.dumps(d), json.loads, legacy_sample)
+    for codec in ("json", "binary", "msgpack"):
+        try:
+            codec_round_trip(f"Message {codec}", lambda m: encode(m, codec),
+                             lambda b: decode(b, codec), sample)
+        except ImportError as e:
+            print(f"Message {codec:<8} skipped ({e})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+# benchmarks/semantic_cache_bench.py
+"""
+Lookup latency of utils.semantic_cache.SemanticCache as the index grows.
+
+    python benchmarks/semantic_cache_bench.py --entries 100000
+
+Synthetic random unit vectors are written straight into the matrix (the
+embedder is not what's being measured), then paraphrase‑style queries
+(stored vector + noise) are timed through the same search path lookups use.
+"""
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from utils.semantic_cache import SemanticCache, _normalise
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    cache = SemanticCache(capacity=args.entries)
+    cache._allocate(args.dim)
+    cache.vectors[:] = _normalise(rng.standard_normal((args.entries, args.dim), dtype=np.float32))
+    cache.size = args.entries
+    cache.prompts = [""] * args.entries
+    cache.responses = [str(i) for i in range(args.entries)]
+
+    t0 = time.perf_counter()
+    cache._rebuild_ivf()
+    print(f"index build: {(time.perf_counter() - t0) * 1000:.1f} ms "
+          f"({len(cache._lists)} lists, nprobe={cache.nprobe})")
+
+    rows = rng.integers(0, args.entries, args.queries)
+    noise = rng.standard_normal((args.queries, args.dim), dtype=np.float32) * 0.02
+    queries = _normalise(cache.vectors[rows] + noise)
+
+    timings, found = [], 0
+    for row, q in zip(rows, queries):
+        t = time.perf_counter()
+        hit, score = cache._search(q)
+        timings.append(time.perf_counter() - t)
+        found += hit == row
+    timings.sort()
+    print(f"{args.entries} entries × {args.dim}d: "
+          f"median {statistics.median(timings) * 1e6:.0f} µs, "
+          f"p99 {timings[int(len(timings) * 0.99)] * 1e6:.0f} µs, "
+          f"recall {found / args.queries:.1%}")
+
+    t = time.perf_counter()
+    full = cache.vectors[:args.entries] @ queries[0]
+    int(np.argmax(full))
+    print(f"brute-force scan for comparison: {(time.perf_counter() - t) * 1e6:.0f} µs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# benchmarks/sharding_bench.py
+"""
+Inbound throughput of common.sharding.ShardedProcessor vs shard count.
+
+    python benchmarks/sharding_bench.py --messages 50000 --conversations 64
+
+Messages are AES‑GCM encrypted and HMAC‑signed exactly like Messenger /
+agent.py produce them; bodies are padded to --size bytes so the per‑message
+crypto cost is realistic.  Run it on a multi‑core box – on one core every
+extra shard just adds IPC.
+"""
+import argparse
+import hashlib
+import hmac
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from common.message import Message
+from common.messenger import decrypt_payload, encrypt_payload, envelope_aad
+from common.sharding import ShardedProcessor
+
+SECRET = "bench-secret"
+HMAC_KEY = b"bench-hmac"
+
+
+def make_messages(n: int, conversations: int, size: int):
+    aes_key = hashlib.sha256(SECRET.encode()).digest()
+    body = "x" * size
+    out = []
+    for i in range(n):
+        sig = hmac.new(HMAC_KEY, body.encode(), hashlib.sha256).hexdigest()
+        msg = Message(f"peer{i % 8}", "me", "user", body,
+                      conversation_id=f"conv{i % conversations}", hmac_sig=sig)
+        msg.body, msg.encrypted = encrypt_payload(aes_key, body, envelope_aad(msg)), True
+        out.append(msg)
+    return out
+
+
+def inline_baseline(messages):
+    aes_key = hashlib.sha256(SECRET.encode()).digest()
+    for m in messages:
+        body = decrypt_payload(aes_key, m.body, envelope_aad(m))
+        hmac.compare_digest(hmac.new(HMAC_KEY, body.encode(), hashlib.sha256).hexdigest(), m.hmac_sig)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=50_000)
+    parser.add_argument("--conversations", type=int, default=64)
+    parser.add_argument("--size", type=int, default=2048, help="plaintext bytes per message")
+    parser.add_argument("--batch", type=int, default=2000, help="messages per poll")
+    parser.add_argument("--max-shards", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    messages = make_messages(args.messages, args.conversations, args.size)
+
+    t0 = time.perf_counter()
+    inline_baseline(messages)
+    base = args.messages / (time.perf_counter() - t0)
+    print(f"inline (single thread): {base:10.0f} msg/s")
+
+    shards = 1
+    while shards <= args.max_shards:
+        proc = ShardedProcessor(shards, shared_key=SECRET, hmac_key=HMAC_KEY)
+        proc.process(messages[:shards * 8])                 # warm the workers up
+        t0 = time.perf_counter()
+        for i in range(0, args.messages, args.batch):
+            proc.process(messages[i:i + args.batch])
+        rate = args.messages / (time.perf_counter() - t0)
+        proc.close()
+        print(f"{shards:>3} shard(s):           {rate:10.0f} msg/s  ({rate / base:4.2f}× inline)")
+        shards *= 2
+
+
+if __name__ == "__main__":
+    main()
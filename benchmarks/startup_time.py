@@ -0,0 +1,79 @@
+# benchmarks/startup_time.py
+"""
+Cold‑start → ready‑for‑input latency of the assistant entry points.
+
+    python benchmarks/startup_time.py                  # 5 runs, --fast-start
+    python benchmarks/startup_time.py --runs 10 --slow # blocking handshake
+    python benchmarks/startup_time.py --importtime 15  # top‑15 imports too
+
+Each run spawns a fresh interpreter (so nothing is cached in‑process),
+waits for the "You can start chatting" banner and kills the child.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+READY_MARKER = "You can start chatting"
+
+
+def time_to_ready(script: Path, fast: bool, timeout: float) -> float:
+    cmd = [sys.executable, "-u", str(script)] + (["--fast-start"] if fast else [])
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdin=subprocess.PIPE,
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    try:
+        deadline = t0 + timeout
+        for line in proc.stdout:
+            if READY_MARKER in line:
+                return time.perf_counter() - t0
+            if time.perf_counter() > deadline:
+                break
+        raise RuntimeError(f"{script} never became ready (exit={proc.poll()})")
+    finally:
+        proc.kill()
+        proc.wait()
+
+
+def import_profile(module: str, top: int):
+    """Parse ``-X importtime`` output and return the *top* slowest imports."""
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                         cwd=ROOT, capture_output=True, text=True).stderr
+    rows = []
+    for line in out.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cum_us, name = (p.strip() for p in line.split(":", 1)[1].split("|"))
+        rows.append((int(cum_us), int(self_us), name))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--assistant", default="assistant_a")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--slow", action="store_true", help="measure without --fast-start")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--importtime", type=int, metavar="N", default=0,
+                        help="also print the N slowest imports of common.agent")
+    args = parser.parse_args()
+
+    script = ROOT / args.assistant / "main.py"
+    samples = [time_to_ready(script, not args.slow, args.timeout) for _ in range(args.runs)]
+    mode = "blocking" if args.slow else "fast-start"
+    print(f"{args.assistant} ({mode}) ready-for-input over {args.runs} runs: "
+          f"min {min(samples) * 1000:.1f} ms, median {statistics.median(samples) * 1000:.1f} ms")
+
+    if args.importtime:
+        print(f"\n{'cumulative µs':>14} {'self µs':>10}  module")
+        for cum, self_us, name in import_profile("common.agent", args.importtime):
+            print(f"{cum:>14} {self_us:>10}  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+# common/admission.py
+"""
+Ingress admission control – runs on cleartext envelope fields, *before*
+any base64 / AES‑GCM / Fernet / HMAC work.
+
+    admission = AdmissionController(NAME)
+    messenger = Messenger(NAME, SECRET_KEY, admission=admission)
+
+Checks, cheapest first:
+
+* self‑sent, addressed to someone else, unknown ``type``, empty body,
+  oversized body, optionally not ``user_initiated``  → dropped silently
+* per‑peer token bucket (``rate`` msg/s, ``burst``)    → "rate_limited"
+* more than ``max_pending`` messages waiting: each peer keeps its fair
+  share of the budget (at least one message, known peers first when
+  there are more senders than room), the rest is shed  → "overload"
+
+Control traffic (acks, handshakes, ``busy``…) is never rate limited or
+shed.  Rate‑limited and shed peers get a ``busy`` notice with a
+``retry_after`` hint through the ``notify(peer, body)`` callback the
+transport installs: at most once per peer and ``max_notices`` in total per
+``notice_interval`` seconds, and only to peers ``reachable(peer)`` vouches
+for – a forged sender name must not make us encrypt and write an inbox.
+"""
+from __future__ import annotations
+
+import json
+import os
+import time
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Optional
+
+from common.message import Message
+from common.priority import CONTROL, CONTROL_TYPES, lane_for
+
+BUSY_TYPE = "busy"
+KNOWN_TYPES = frozenset({"user", "bot"}) | CONTROL_TYPES
+DEFAULT_RATE = float(os.getenv("PEERAI_PEER_RATE", "5"))        # messages / s per peer
+DEFAULT_BURST = float(os.getenv("PEERAI_PEER_BURST", "20"))
+DEFAULT_MAX_PENDING = int(os.getenv("PEERAI_MAX_PENDING", "256"))
+MAX_BODY = 64 * 1024       # encrypted/base64 body bytes
+NOTICE_INTERVAL_S = 5.0
+MAX_NOTICES = 8            # busy notices per NOTICE_INTERVAL_S, all peers together
+
+# reasons that tell the sender to back off; everything else is dropped quietly
+SHED_REASONS = frozenset({"rate_limited", "overload"})
+
+Notify = Callable[[str, str], None]
+Reachable = Callable[[str], bool]
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "stamp")
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = time.monotonic()
+
+    def take(self, now: float) -> bool:
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+    def retry_after(self) -> float:
+        return max(0.0, (1.0 - self.tokens) / self.rate) if self.rate else NOTICE_INTERVAL_S
+
+
+class AdmissionController:
+    def __init__(self, self_name: str, rate: float = DEFAULT_RATE, burst: float = DEFAULT_BURST,
+                 max_pending: int = DEFAULT_MAX_PENDING, max_body: int = MAX_BODY,
+                 known_types: Iterable[str] = KNOWN_TYPES,
+                 require_user_initiated: bool = False,
+                 notify: Optional[Notify] = None,
+                 notice_interval: float = NOTICE_INTERVAL_S,
+                 max_notices: int = MAX_NOTICES,
+                 reachable: Optional[Reachable] = None) -> None:
+        self.self_name = self_name
+        self.rate = rate
+        self.burst = burst
+        self.max_pending = max_pending
+        self.max_body = max_body
+        self.known_types = frozenset(known_types)
+        self.require_user_initiated = require_user_initiated
+        self.notify = notify
+        self.notice_interval = notice_interval
+        self.max_notices = max_notices
+        self.reachable = reachable      # peer → has a known inbox / link; None trusts all
+
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._last_notice: Dict[str, float] = {}
+        self._notice_window = (-notice_interval, 0)     # (start, notices sent in it)
+        self.counters: Counter = Counter()
+        self.per_peer: Dict[str, Counter] = {}
+
+    # ── cheap header checks ────────────────────────────────────────────────────
+    def _header_reject(self, msg: Message) -> Optional[str]:
+        if msg.sender == self.self_name:
+            return "self"
+        if msg.to is not None and msg.to != self.self_name:
+            return "misaddressed"
+        if msg.type not in self.known_types:
+            return "unknown_type"
+        if not msg.body or msg.body.isspace():
+            return "empty"
+        if len(msg.body) > self.max_body:
+            return "oversize"
+        if self.require_user_initiated and msg.type == "user" and not msg.user_initiated:
+            return "not_user_initiated"
+        return None
+
+    def _bucket(self, peer: str) -> TokenBucket:
+        bucket = self._buckets.get(peer)
+        if bucket is None:
+            bucket = self._buckets[peer] = TokenBucket(self.rate, self.burst)
+        return bucket
+
+    # ── decisions ──────────────────────────────────────────────────────────────
+    def check(self, msg: Message, pending: int = 0, over_share: bool = False) -> Optional[str]:
+        """
+        None if *msg* may proceed to decryption, else the rejection reason.
+        ``pending`` is how much work is already queued downstream;
+        ``over_share`` marks a peer that used up its part of the backlog.
+        """
+        reason = self._header_reject(msg)
+        if reason is None and lane_for(msg.type) != CONTROL:
+            if pending >= self.max_pending or over_share:
+                reason = "overload"
+            elif not self._bucket(msg.sender).take(time.monotonic()):
+                reason = "rate_limited"
+        self._count(msg.sender, reason)
+        if reason in SHED_REASONS:
+            self._notice(msg.sender, reason)
+        return reason
+
+    def admit(self, msg: Message, pending: int = 0) -> bool:
+        return self.check(msg, pending) is None
+
+    def filter(self, msgs: List[Message], pending: int = 0) -> List[Message]:
+        """
+        Admit a batch in order.  If the batch would push the backlog past
+        ``max_pending`` every peer gets an equal share of what is left, so
+        one flooding peer can't crowd the others out.  With more senders
+        than room each gets one message, peers we already know first – a
+        swarm of made‑up sender names can't shed everyone.
+        """
+        fair, seats = None, None
+        if pending + len(msgs) > self.max_pending:
+            room = max(0, self.max_pending - pending)
+            peers = list(dict.fromkeys(m.sender for m in msgs if lane_for(m.type) != CONTROL))
+            if peers and room >= len(peers):
+                fair = room // len(peers)
+            else:
+                fair = 1
+                peers.sort(key=lambda p: not self._known(p))    # stable: arrival order otherwise
+                seats = frozenset(peers[:room])
+
+        admitted: List[Message] = []
+        queued = 0
+        by_peer: Counter = Counter()
+        for msg in msgs:
+            over_share = fair is not None and (by_peer[msg.sender] >= fair or
+                                               (seats is not None and msg.sender not in seats))
+            if self.check(msg, pending + queued, over_share) is None:
+                admitted.append(msg)
+                if lane_for(msg.type) != CONTROL:
+                    queued += 1
+                    by_peer[msg.sender] += 1
+        return admitted
+
+    def _known(self, peer: str) -> bool:
+        return peer in self._buckets or (self.reachable is not None and self.reachable(peer))
+
+    # ── bookkeeping ────────────────────────────────────────────────────────────
+    def _count(self, peer: str, reason: Optional[str]) -> None:
+        key = "admitted" if reason is None else reason
+        self.counters[key] += 1
+        self.per_peer.setdefault(peer, Counter())[key] += 1
+
+    def _notice(self, peer: str, reason: str) -> None:
+        if self.notify is None or peer == self.self_name:
+            return
+        if self.reachable is not None and not self.reachable(peer):
+            return
+        now = time.monotonic()
+        if now - self._last_notice.get(peer, -self.notice_interval) < self.notice_interval:
+            return
+        start, sent = self._notice_window
+        if now - start >= self.notice_interval:
+            start, sent = now, 0
+        if sent >= self.max_notices:
+            return
+        self._notice_window = (start, sent + 1)
+        self._last_notice[peer] = now
+        self.counters["notices"] += 1
+        body = json.dumps({"reason": reason,
+                           "retry_after": round(self._bucket(peer).retry_after(), 2)})
+        try:
+            self.notify(peer, body)
+        except Exception as e:
+            print(f"[{self.self_name}] ⚠️ Could not send busy notice to {peer}: {e}")
+
+    def stats(self) -> Dict[str, object]:
+        return {"counters": dict(self.counters),
+                "peers": {p: dict(c) for p, c in self.per_peer.items()}}
+
+    def summary(self) -> str:
+        c = self.counters
+        rejected = sum(v for k, v in c.items() if k not in ("admitted", "notices"))
+        if not rejected:
+            return ""
+        top = sorted(((k, v) for k, v in c.items() if k not in ("admitted", "notices")),
+                     key=lambda kv: -kv[1])
+        return (f"{c['admitted']} admitted, {rejected} rejected ("
+                + ", ".join(f"{k} {v}" for k, v in top) + f"), {c['notices']} busy notices")
@@ -1,5 +1,5 @@
 # common/agent.py
-import requests
+import atexit
 import time
 import hmac
 import hashlib
@@ -11,13 +11,37 @@ from dotenv import load_dotenv
 sys.path.append(str(Path(__file__).resolve().parent.parent))
 
 from common.transport import FileTransport
+from common.message import Message
 from common.messenger import Messenger
+from common.priority import PriorityInbox
+from utils.nlp import router as intent_router
+from utils.ollama_models import get_manager
 
 # Load environment variables
 load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY", "fallbackkey").encode()
 OLLAMA_HOST = "http://localhost:11434"
 MODEL_NAME = "mistral"
+LLM_BACKEND = os.getenv("LLM_BACKEND", "ollama")   # "ollama" | "local" (llama.cpp, see utils/local_llm.py)
+SEMANTIC_CACHE = os.getenv("SEMANTIC_CACHE", "")   # "" (off) | "hash" | "ollama"
+
+_semantic_cache = None
+
+
+def get_semantic_cache():
+    """Near‑duplicate prompt cache (utils/semantic_cache.py), created on first use."""
+    global _semantic_cache
+    if _semantic_cache is None and SEMANTIC_CACHE:
+        from utils.semantic_cache import HashingEmbedder, OllamaEmbedder, SemanticCache
+        embedder = OllamaEmbedder(host=OLLAMA_HOST) if SEMANTIC_CACHE == "ollama" else HashingEmbedder()
+        cache_path = Path(__file__).resolve().parent.parent / "inbox" / "cache" / f"semantic_{SEMANTIC_CACHE}"
+        _semantic_cache = SemanticCache(
+            embedder,
+            threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.90")),
+            path=cache_path,
+        )
+        atexit.register(_semantic_cache.save)
+    return _semantic_cache
 
 
 def compute_hmac(message: str) -> str:
@@ -28,6 +52,22 @@ def get_response_from_phi(prompt: str) -> str:
     if not prompt.strip():
         return ""
 
+    cache = get_semantic_cache()
+    if cache is not None:
+        cached = cache.lookup(prompt)
+        if cached is not None:
+            return cached
+    return _generate_cached(prompt, cache)
+
+
+def _generate_cached(prompt: str, cache) -> str:
+    response = _generate(prompt)
+    if cache is not None and not response.startswith("⚠️ Error"):
+        cache.insert(prompt, response)
+    return response
+
+
+def _generate(prompt: str) -> str:
     SYSTEM_PROMPT = (
         "You are a concise, polite AI assistant. "
         "Reply in under 3 sentences. Avoid lists or greetings unless asked."
@@ -35,28 +75,49 @@ def get_response_from_phi(prompt: str) -> str:
 
     try:
         full_prompt = f"{SYSTEM_PROMPT}\n\nUser: {prompt}\nAssistant:"
-        resp = requests.post(
-            "http://localhost:11434/api/generate",
-            json={
-                "model": "mistral",
-                "prompt": full_prompt,
-                "stream": False,
-                "options": {
-                    "temperature": 0.6,
-                    "top_p": 0.9,
-                    "num_predict": 80  # keeps it short
-                }
+        if LLM_BACKEND == "local":
+            from utils.local_llm import get_model
+            return get_model().generate(full_prompt, max_tokens=80, temperature=0.6, top_p=0.9)
+        # resident‑model manager: keep_alive, warm‑up, swap scheduling
+        return get_manager().generate(
+            full_prompt,
+            model=MODEL_NAME,
+            options={
+                "temperature": 0.6,
+                "top_p": 0.9,
+                "num_predict": 80  # keeps it short
             },
             timeout=60,
         )
-        resp.raise_for_status()
-        data = resp.json()
-        return data.get("response", "").strip()
     except Exception as e:
         print(f"[ERROR] get_response_from_phi: {e}")
         return f"⚠️ Error: {e}"
 
 
+def answer(text: str, self_id: str) -> str:
+    """Intent router first; only unmatched messages pay for the LLM."""
+    hit = intent_router.route(text, assistant_name=self_id)
+    if hit:
+        return hit.response
+    if not text.strip():
+        return ""
+    cache = get_semantic_cache()
+    if cache is not None:
+        cached = cache.lookup(text)
+        if cached is not None:
+            return cached           # no model call – keep it out of the LLM timings
+    t0 = time.perf_counter()
+    response = _generate_cached(text, cache)
+    intent_router.record_llm_call(time.perf_counter() - t0)
+    return response
+
+
+def intent_summary() -> str:
+    st = intent_router.stats()
+    return (f"{st['hits']} hits / {st['misses']} misses ({st['hit_rate']:.0%}), "
+            f"~{st['llm_seconds_saved']:.1f}s of LLM time saved")
+
+
 def send_text(sender: str, to: str, text: str, user_initiated: bool = True, messenger: Messenger = None) -> None:
     if not text.strip():
         print(f"⚠️  {sender} tried to send empty message — skipped.")
@@ -64,36 +125,37 @@ def send_text(sender: str, to: str, text: str, user_initiated: bool = True, mess
 
     msg_type = "user" if user_initiated else "bot"
 
-    messenger.send(
+    messenger.send_message(
         to=to,
         message=text,
         msg_type=msg_type,
         user_initiated=user_initiated,
+        hmac_sig=compute_hmac(text),
     )
 
 
-def handle_handshake(self_id: str, peer_id: str, msg: dict, messenger: Messenger):
-    sender = msg.get("from")
-    message = msg.get("message")
-    sig = msg.get("hmac_sig")
+def handle_handshake(self_id: str, peer_id: str, msg: Message, messenger: Messenger):
+    sender = msg.sender
+    message = msg.body
+    sig = msg.hmac_sig
     if compute_hmac(message) != sig:
         print(f"🚨 {self_id} HMAC mismatch for handshake from {sender}")
         return
     print(f"🤝 {self_id} got handshake from {sender}")
-    messenger.send(
+    messenger.send_message(
         to=sender,
-        sender=self_id,
         message="Handshake ACK",
         msg_type="handshake",
+        hmac_sig=compute_hmac("Handshake ACK"),
     )
 
 
-def handle_bot_message(self_id: str, peer_id: str, msg: dict, messenger: Messenger):
-    sender = msg.get("from")
-    text = msg.get("message")
-    sig = msg.get("hmac_sig")
+def handle_bot_message(self_id: str, peer_id: str, msg: Message, messenger: Messenger):
+    sender = msg.sender
+    text = msg.body
+    sig = msg.hmac_sig
 
-    if sender == self_id or not msg.get("user_initiated", False):
+    if sender == self_id or not msg.user_initiated:
         return
 
     if compute_hmac(text) != sig:
@@ -101,19 +163,16 @@ def handle_bot_message(self_id: str, peer_id: str, msg: dict, messenger: Messeng
         return
 
     print(f"📩 {sender} → {self_id}: {text}")
-    response = get_response_from_phi(text)
+    response = answer(text, self_id)
     print(f"🧠 {self_id}: {response}")
-    messenger.send(
-        to=sender,  # reply to sender of original message
-        message=response,
-        msg_type="bot",
-        user_initiated=False,
-    )
+    send_text(self_id, sender, response, user_initiated=False,  # reply to sender of original message
+              messenger=messenger)
 
 
-def dispatch_message(self_id: str, peer_id: str, msg: dict, messenger: Messenger):
-    mtype = msg.get("type")
-    if not msg.get("message", "").strip():
+def dispatch_message(self_id: str, peer_id: str, msg: Message, messenger: Messenger):
+    msg = Message.coerce(msg)
+    mtype = msg.type
+    if not msg.body.strip():
         print(f"⚠️  {self_id} received empty message, ignoring.")
         return
 
@@ -121,6 +180,8 @@ def dispatch_message(self_id: str, peer_id: str, msg: dict, messenger: Messenger
         handle_handshake(self_id, peer_id, msg, messenger)
     elif mtype in ("bot", "user"):
         handle_bot_message(self_id, peer_id, msg, messenger)
+    elif mtype == "busy":
+        print(f"⏳ {msg.sender} is shedding load: {msg.body}")
     else:
         print(f"⚠️ {self_id}: Unknown message type {mtype}")
 
@@ -129,7 +190,10 @@ def run_loop(self_id: str, peer_id: str):
     global transport
     inbox_dir = Path(__file__).resolve().parent.parent / "inbox"
     transport = FileTransport(inbox_dir)
-    messenger = Messenger(name=self_id, transport=transport, secret_key=SECRET_KEY)
+    messenger = Messenger(self_id, SECRET_KEY.decode(), transport=transport)
+    inbox = PriorityInbox()
+    if LLM_BACKEND == "ollama":
+        get_manager().start()
 
     print(f"🟢 {self_id} ready. Talking to {peer_id}. Type /exit to quit.")
     try:
@@ -141,14 +205,19 @@ def run_loop(self_id: str, peer_id: str):
             if msg:
                 send_text(self_id, peer_id, msg, user_initiated=True, messenger=messenger)
 
-            # Process incoming
-            message = messenger.receive()
-            if message:
+            # Process incoming – drain first so control traffic can overtake replies
+            for message in messenger.receive_messages():
+                inbox.push(message)
+            while (message := inbox.pop()):
                 dispatch_message(self_id, peer_id, message, messenger)
                 time.sleep(1)
     except KeyboardInterrupt:
         print(f"\n👋 {self_id} interrupted. Exiting.")
 
+    print(f"📊 intents: {intent_summary()}")
+    if LLM_BACKEND == "ollama" and get_manager().summary():
+        print(f"📊 models: {get_manager().summary()}")
+
 
 if __name__ == "__main__":
     import argparse
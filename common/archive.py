@@ -0,0 +1,464 @@
+# common/archive.py
+"""
+Seekable compressed message archive.
+
+An archive is two files:
+
+    assistant_a.pza        compressed frames, appended one after another
+    assistant_a.pza.idx    one JSON line per frame: offset, length, message
+                           count, time range, senders, conversation ids
+
+Each frame holds up to ``FRAME_MESSAGES`` messages (compact JSON lines) and
+is compressed on its own – zstd when the optional ``zstandard`` package is
+installed, zlib otherwise – so a reader only decompresses the frames the
+index says can match:
+
+    with ArchiveWriter("inbox/logs/assistant_a.pza") as w:      # streaming
+        w.append(msg)
+
+    for msg in ArchiveReader(path).query(sender="assistant_b",
+                                          since=ts_ns, conversation_id="c1"):
+        ...
+
+Every frame starts with a small header (magic, codec, count, length) so the
+index can be rebuilt from the data file alone.  A writer opening an
+archive after a crash re‑indexes complete frames whose index line is torn
+or missing, and only cuts off a frame that is itself torn.
+
+While a writer is open it holds ``<archive>.lock`` (its pid); ``compact``
+refuses to swap an archive a live process is still appending to – stop
+the assistant, or compact a copy.
+
+Migrating the existing pretty JSON / jsonl logs and compacting archives:
+
+    python -m common.archive migrate inbox/logs/assistant_a*.json* -o inbox/logs/assistant_a.pza
+    python -m common.archive compact inbox/logs/assistant_a.pza
+    python -m common.archive query inbox/logs/assistant_a.pza --sender assistant_b
+    python -m common.archive stats inbox/logs/assistant_a.pza
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import struct
+import sys
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from common.message import Message, _parse_ts
+
+FRAME_MESSAGES = 256
+FRAME_BYTES = 1 << 20          # also cut a frame once this much JSON is buffered
+ZSTD_LEVEL = 3
+ZLIB_LEVEL = 6
+
+_HEADER = struct.Struct(">4sBII")      # magic, codec, message count, payload length
+_MAGIC = b"PZF1"
+_ZSTD, _ZLIB = 1, 2
+
+_zstd_module: Any = None
+
+
+def _zstd():
+    """The zstandard module, or None if it isn't installed."""
+    global _zstd_module
+    if _zstd_module is None:
+        try:
+            import zstandard
+            _zstd_module = zstandard
+        except ImportError:
+            _zstd_module = False
+    return _zstd_module or None
+
+
+def _compress(data: bytes, codec: int) -> bytes:
+    if codec == _ZSTD:
+        return _zstd().ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return zlib.compress(data, ZLIB_LEVEL)
+
+
+def _decompress(data: bytes, codec: int) -> bytes:
+    if codec == _ZSTD:
+        zstd = _zstd()
+        if zstd is None:
+            raise ImportError("this archive has zstd frames – pip install zstandard")
+        return zstd.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+def index_path(path: Union[str, Path]) -> Path:
+    path = Path(path)
+    return path.with_name(path.name + ".idx")
+
+
+def lock_path(path: Union[str, Path]) -> Path:
+    path = Path(path)
+    return path.with_name(path.name + ".lock")
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def writer_pid(path: Union[str, Path]) -> Optional[int]:
+    """Pid of a live process with a writer open on *path*, else None."""
+    try:
+        pid = int(lock_path(path).read_text().strip())
+    except (OSError, ValueError):
+        return None
+    return pid if _pid_alive(pid) else None
+
+
+# ───────────────────────────────── WRITER ─────────────────────────────────────
+class ArchiveWriter:
+    """Streaming, append‑only writer.  Messages are buffered into frames."""
+
+    def __init__(self, path: Union[str, Path], frame_messages: int = FRAME_MESSAGES,
+                 codec: Optional[str] = None, fsync: bool = False) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.frame_messages = frame_messages
+        if codec is None:
+            codec = "zstd" if _zstd() else "zlib"
+        if codec == "zstd" and not _zstd():
+            raise ImportError("codec 'zstd' needs the zstandard package")
+        self.codec = _ZSTD if codec == "zstd" else _ZLIB
+        self.fsync = fsync
+
+        self._buf: List[Message] = []
+        self._buf_bytes = 0
+        self._buf_since = 0.0           # monotonic time of the oldest buffered message
+        self._recover()
+        self._data = self.path.open("ab")
+        self._index = index_path(self.path).open("a")
+        lock_path(self.path).write_text(str(os.getpid()))
+
+    def _recover(self) -> None:
+        """
+        Trust index lines up to the first one that doesn't match the data,
+        scan frame headers from there, re‑index every complete frame, and
+        cut off only a frame that is genuinely torn.
+        """
+        size = self.path.stat().st_size if self.path.exists() else 0
+        idx = index_path(self.path)
+        entries = read_index(self.path)
+        valid: List[Dict[str, Any]] = []
+        end = 0
+        for e in entries:
+            if e["off"] != end or e["off"] + e["len"] > size:
+                break
+            valid.append(e)
+            end = e["off"] + e["len"]
+        found, end = _scan(self.path, end) if size > end else ([], end)
+
+        torn_index = idx.exists() and idx.stat().st_size and not idx.read_bytes().endswith(b"\n")
+        if (size and not idx.exists()) or torn_index or found or len(valid) != len(entries):
+            _write_index(self.path, valid + found)
+        if size > end:
+            print(f"⚠️ {self.path}: dropping {size - end} B of torn frame data")
+            with self.path.open("r+b") as fh:
+                fh.truncate(end)
+
+    def append(self, msg: Union[Message, Dict[str, Any]]) -> None:
+        msg = Message.coerce(msg)
+        if not self._buf:
+            self._buf_since = time.monotonic()
+        self._buf.append(msg)
+        self._buf_bytes += len(msg.body)
+        if len(self._buf) >= self.frame_messages or self._buf_bytes >= FRAME_BYTES:
+            self.flush()
+
+    def extend(self, msgs: Iterable[Union[Message, Dict[str, Any]]]) -> None:
+        for msg in msgs:
+            self.append(msg)
+
+    def flush_if_older(self, max_age: float) -> bool:
+        """flush() if the oldest buffered message has waited *max_age* seconds."""
+        if self._buf and time.monotonic() - self._buf_since >= max_age:
+            self.flush()
+            return True
+        return False
+
+    def flush(self) -> None:
+        """Write the buffered messages as one frame (no‑op if empty)."""
+        if not self._buf:
+            return
+        raw = "\n".join(json.dumps(m.to_dict(), separators=(",", ":")) for m in self._buf)
+        payload = _compress(raw.encode(), self.codec)
+        off = self._data.tell()
+        self._data.write(_HEADER.pack(_MAGIC, self.codec, len(self._buf), len(payload)))
+        self._data.write(payload)
+        self._data.flush()
+        if self.fsync:
+            os.fsync(self._data.fileno())
+
+        entry = _frame_entry(off, _HEADER.size + len(payload), self._buf)
+        self._index.write(json.dumps(entry, separators=(",", ":")) + "\n")
+        self._index.flush()
+        self._buf = []
+        self._buf_bytes = 0
+
+    def close(self) -> None:
+        if self._data.closed:
+            return
+        self.flush()
+        self._data.close()
+        self._index.close()
+        if writer_pid(self.path) == os.getpid():
+            lock_path(self.path).unlink(missing_ok=True)
+
+    def __enter__(self) -> "ArchiveWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def _frame_entry(off: int, length: int, msgs: List[Message]) -> Dict[str, Any]:
+    return {
+        "off": off,
+        "len": length,
+        "n": len(msgs),
+        "t0": min(m.ts for m in msgs),
+        "t1": max(m.ts for m in msgs),
+        "senders": sorted({m.sender for m in msgs}),
+        "convs": sorted({m.conversation_id for m in msgs if m.conversation_id}),
+    }
+
+
+# ───────────────────────────────── INDEX ──────────────────────────────────────
+def read_index(path: Union[str, Path]) -> List[Dict[str, Any]]:
+    idx = index_path(path)
+    if not idx.exists():
+        return []
+    entries = []
+    with idx.open() as fh:
+        for line in fh:
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                break                     # torn last line
+    return entries
+
+
+def _write_index(path: Union[str, Path], entries: List[Dict[str, Any]]) -> None:
+    idx = index_path(path)
+    tmp = idx.with_suffix(".tmp")
+    tmp.write_text("".join(json.dumps(e, separators=(",", ":")) + "\n" for e in entries))
+    os.replace(tmp, idx)
+
+
+def rebuild_index(path: Union[str, Path]) -> List[Dict[str, Any]]:
+    """Scan frame headers (decompressing each frame once) to recreate the index."""
+    return _scan(path)[0]
+
+
+def _scan(path: Union[str, Path], start: int = 0) -> Tuple[List[Dict[str, Any]], int]:
+    """Index entries for the complete frames from *start* on, and where they end."""
+    entries = []
+    end = start
+    with Path(path).open("rb") as fh:
+        fh.seek(start)
+        while True:
+            head = fh.read(_HEADER.size)
+            if len(head) < _HEADER.size:
+                break
+            magic, codec, _, length = _HEADER.unpack(head)
+            payload = fh.read(length)
+            if magic != _MAGIC or len(payload) < length:
+                break
+            try:
+                msgs = _decode_frame(payload, codec)
+            except ImportError:
+                raise                   # a zstd frame we can't read is not a torn one
+            except Exception:
+                break
+            entries.append(_frame_entry(end, _HEADER.size + length, msgs))
+            end += _HEADER.size + length
+    return entries, end
+
+
+def _decode_frame(payload: bytes, codec: int) -> List[Message]:
+    return [Message.from_dict(json.loads(line))
+            for line in _decompress(payload, codec).decode().split("\n") if line]
+
+
+# ───────────────────────────────── READER ─────────────────────────────────────
+class ArchiveReader:
+    """Random access by frame; queries only touch frames the index allows."""
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        self.path = Path(path)
+        self.frames = read_index(self.path)
+        if not self.frames and self.path.exists() and self.path.stat().st_size:
+            self.frames = rebuild_index(self.path)
+
+    def __len__(self) -> int:
+        return sum(e["n"] for e in self.frames)
+
+    def frame(self, i: int) -> List[Message]:
+        entry = self.frames[i]
+        with self.path.open("rb") as fh:
+            fh.seek(entry["off"])
+            head = fh.read(_HEADER.size)
+            magic, codec, _, length = _HEADER.unpack(head)
+            if magic != _MAGIC:
+                raise ValueError(f"{self.path}: no frame at offset {entry['off']}")
+            return _decode_frame(fh.read(length), codec)
+
+    def __iter__(self) -> Iterator[Message]:
+        for i in range(len(self.frames)):
+            yield from self.frame(i)
+
+    def query(self, since: Optional[int] = None, until: Optional[int] = None,
+              sender: Optional[str] = None,
+              conversation_id: Optional[str] = None) -> Iterator[Message]:
+        """``since``/``until`` are ns timestamps (inclusive), like Message.ts."""
+        for i, e in enumerate(self.frames):
+            if since is not None and e["t1"] < since:
+                continue
+            if until is not None and e["t0"] > until:
+                continue
+            if sender is not None and sender not in e["senders"]:
+                continue
+            if conversation_id is not None and conversation_id not in e["convs"]:
+                continue
+            for m in self.frame(i):
+                if since is not None and m.ts < since:
+                    continue
+                if until is not None and m.ts > until:
+                    continue
+                if sender is not None and m.sender != sender:
+                    continue
+                if conversation_id is not None and m.conversation_id != conversation_id:
+                    continue
+                yield m
+
+
+# ───────────────────────────────── MIGRATION ──────────────────────────────────
+def load_legacy(path: Union[str, Path]) -> List[Message]:
+    """A pretty JSON list (archive_inbox) or a jsonl log (receive_messages)."""
+    text = Path(path).read_text().strip()
+    if not text:
+        return []
+    if text[0] == "[":
+        return [Message.from_dict(d) for d in json.loads(text)]
+    return [Message.from_dict(json.loads(line)) for line in text.splitlines() if line.strip()]
+
+
+def migrate(sources: Iterable[Union[str, Path]], dest: Union[str, Path],
+            delete: bool = False, codec: Optional[str] = None) -> int:
+    sources = [Path(s) for s in sources]
+    msgs: List[Message] = []
+    for src in sources:
+        msgs += load_legacy(src)
+    msgs.sort(key=lambda m: m.ts)
+    with ArchiveWriter(dest, codec=codec) as w:
+        w.extend(msgs)
+    if delete:
+        for src in sources:
+            src.unlink()
+    return len(msgs)
+
+
+def compact(path: Union[str, Path], frame_messages: int = FRAME_MESSAGES,
+            codec: Optional[str] = None) -> int:
+    """
+    Rewrite an archive time‑ordered in full frames (atomic swap).  Raises
+    RuntimeError while a writer is open on it: its appends would go to the
+    replaced file and be lost.
+    """
+    path = Path(path)
+    pid = writer_pid(path)
+    if pid is not None:
+        raise RuntimeError(f"{path} is open for writing by pid {pid} – stop it first")
+    msgs = sorted(ArchiveReader(path), key=lambda m: m.ts)
+    tmp = path.with_name(path.name + ".compact")
+    for p in (tmp, index_path(tmp)):
+        p.unlink(missing_ok=True)
+    with ArchiveWriter(tmp, frame_messages=frame_messages, codec=codec) as w:
+        w.extend(msgs)
+    os.replace(tmp, path)
+    os.replace(index_path(tmp), index_path(path))
+    return len(msgs)
+
+
+# ───────────────────────────────── CLI ────────────────────────────────────────
+def _size(path: Path) -> int:
+    return sum(p.stat().st_size for p in (path, index_path(path)) if p.exists())
+
+
+def _ts_arg(value: Optional[str]) -> Optional[int]:
+    if not value:
+        return None
+    return int(value) if value.isdigit() else _parse_ts(value)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m common.archive")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    mig = sub.add_parser("migrate", help="pack JSON / jsonl logs into an archive")
+    mig.add_argument("sources", nargs="+")
+    mig.add_argument("-o", "--output", required=True)
+    mig.add_argument("--codec", choices=("zstd", "zlib"))
+    mig.add_argument("--delete", action="store_true", help="remove the sources afterwards")
+
+    com = sub.add_parser("compact", help="rewrite an archive in time order, full frames")
+    com.add_argument("archive")
+    com.add_argument("--frame-messages", type=int, default=FRAME_MESSAGES)
+    com.add_argument("--codec", choices=("zstd", "zlib"))
+
+    qry = sub.add_parser("query", help="print matching messages as jsonl")
+    qry.add_argument("archive")
+    qry.add_argument("--sender")
+    qry.add_argument("--conversation")
+    qry.add_argument("--since", help="ISO timestamp or ns")
+    qry.add_argument("--until", help="ISO timestamp or ns")
+
+    sta = sub.add_parser("stats", help="frame / size summary")
+    sta.add_argument("archive")
+
+    sub.add_parser("reindex", help="rebuild the .idx sidecar from the data file").add_argument("archive")
+
+    args = parser.parse_args(argv)
+
+    if args.cmd == "migrate":
+        before = sum(Path(s).stat().st_size for s in args.sources)
+        n = migrate(args.sources, args.output, delete=args.delete, codec=args.codec)
+        after = _size(Path(args.output))
+        print(f"📦 {n} messages: {before:,} B → {after:,} B ({args.output})")
+    elif args.cmd == "compact":
+        before = _size(Path(args.archive))
+        try:
+            n = compact(args.archive, args.frame_messages, args.codec)
+        except RuntimeError as e:
+            sys.exit(f"❌ {e}")
+        print(f"📦 {n} messages: {before:,} B → {_size(Path(args.archive)):,} B")
+    elif args.cmd == "query":
+        since, until = _ts_arg(args.since), _ts_arg(args.until)
+        for m in ArchiveReader(args.archive).query(since, until, args.sender, args.conversation):
+            print(json.dumps(m.to_dict()))
+    elif args.cmd == "stats":
+        reader = ArchiveReader(args.archive)
+        path = Path(args.archive)
+        print(f"{len(reader.frames)} frames, {len(reader)} messages, {_size(path):,} B on disk")
+    elif args.cmd == "reindex":
+        entries = rebuild_index(args.archive)
+        _write_index(args.archive, entries)
+        print(f"rebuilt index: {len(entries)} frames")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,263 @@
 # common/combined_transport.py
 """
-Combine two WebRTCTransport objects into one Transport interface.
+Composite transport that routes every send over the best healthy path.
+
+The original use‑case – gluing two WebRTCTransport objects together – is
+still the default:
 
 • outbound – the connection where *this* peer created the DataChannel
 • inbound  – the connection where the remote peer created the DataChannel
 
 send_message()  → outbound
 receive_messages() → inbound
+
+Any number of extra paths (FileTransport, a socket transport, …) can be
+registered as fallbacks.  Each path keeps an EWMA of its round‑trip time
+(measured by ``ping(peer)`` – a real ping/pong on WebRTC) and of its error
+rate *per peer*; sends go to the lowest‑latency healthy path and fail over
+to the next one without dropping the message.  A path that failed stays
+down until the background prober (``start_prober``) gets a successful ping
+through it – user messages are never used to test a link that is cooling
+down.  ``on_recover`` callbacks run when that happens (the assistants
+replay their unacked outbox there, see common/delivery.py).
 """
-from typing import Any, Dict, Optional, List
-from common.combined_transport import BaseTransport
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from common.transport import BaseTransport, maybe_await
+
+RTT_ALPHA        = 0.3     # EWMA weight for new RTT samples
+ERROR_ALPHA      = 0.2     # EWMA weight for success / failure samples
+RETRY_AFTER_S    = 1.0     # first cool‑down before a failed path is retried
+MAX_RETRY_S      = 30.0    # cool‑down cap after repeated failures
+PROBE_EVERY_S    = 10.0    # background re‑probe interval
+DEFAULT_RTT_S    = 0.050   # prior for paths that can't be pinged
+SEND_TIMEOUT_S   = 5.0     # a send slower than this counts as a failure
+
+
+# ───────────────────────────────── PATH STATS ─────────────────────────────────
+class PathStats:
+    """Rolling RTT / error‑rate estimate for one (path, peer) pair."""
+
+    __slots__ = ("rtt", "rtt_samples", "error_rate", "samples", "failures", "down_until",
+                 "last_error")
+
+    def __init__(self, rtt: float = DEFAULT_RTT_S) -> None:
+        self.rtt = rtt
+        self.rtt_samples = 0
+        self.error_rate = 0.0
+        self.samples = 0
+        self.failures = 0          # consecutive
+        self.down_until = 0.0
+        self.last_error: Optional[str] = None
+
+    def record_success(self, rtt: Optional[float] = None) -> None:
+        """``rtt`` only for real round trips; a plain successful send passes None."""
+        if rtt is not None:
+            self.rtt = rtt if self.rtt_samples == 0 else (1 - RTT_ALPHA) * self.rtt + RTT_ALPHA * rtt
+            self.rtt_samples += 1
+        self.error_rate *= (1 - ERROR_ALPHA)
+        self.samples += 1
+        self.failures = 0
+        self.down_until = 0.0
+
+    def record_failure(self, error: Exception) -> None:
+        self.error_rate = (1 - ERROR_ALPHA) * self.error_rate + ERROR_ALPHA
+        self.samples += 1
+        self.failures += 1
+        self.last_error = repr(error)
+        backoff = min(MAX_RETRY_S, RETRY_AFTER_S * 2 ** (self.failures - 1))
+        self.down_until = time.monotonic() + backoff
+
+    @property
+    def healthy(self) -> bool:
+        """Down after a failure until a probe succeeds again."""
+        return self.failures == 0
+
+    @property
+    def probe_due(self) -> bool:
+        return time.monotonic() >= self.down_until
+
+    def score(self) -> float:
+        """Lower is better: RTT inflated by the recent error rate."""
+        return self.rtt * (1.0 + 4.0 * self.error_rate)
 
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "rtt_ms": round(self.rtt * 1000, 3),
+            "rtt_samples": self.rtt_samples,
+            "error_rate": round(self.error_rate, 3),
+            "samples": self.samples,
+            "failures": self.failures,
+            "healthy": self.healthy,
+            "last_error": self.last_error,
+        }
 
+
+# ─────────────────────────────── COMBINED TRANSPORT ───────────────────────────
 class CombinedTransport(BaseTransport):
-    def __init__(self, outbound: BaseTransport, inbound: BaseTransport) -> None:
+    def __init__(self, outbound: BaseTransport, inbound: Optional[BaseTransport] = None,
+                 fallbacks: Optional[Dict[str, BaseTransport]] = None,
+                 send_timeout: float = SEND_TIMEOUT_S) -> None:
         self.outbound = outbound
         self.inbound = inbound
+        self.send_timeout = send_timeout
+
+        # name → transport, in registration order (= tie‑break preference)
+        self.paths: Dict[str, BaseTransport] = {"primary": outbound}
+        for name, path in (fallbacks or {}).items():
+            self.add_path(name, path)
+
+        # (path name, peer) → stats
+        self._stats: Dict[Tuple[str, str], PathStats] = {}
+        self._active: Dict[str, str] = {}
+        self._prober: Any = None          # asyncio / concurrent future of run_prober()
+        # callback(peer, path name) – may return an awaitable
+        self.on_recover: List[Callable[[str, str], Any]] = []
+
+    # ── path registry ──────────────────────────────────────────────────────────
+    def add_path(self, name: str, transport: BaseTransport) -> None:
+        if name in self.paths:
+            raise ValueError(f"transport path {name!r} already registered")
+        self.paths[name] = transport
+
+    def stats(self, name: str, peer: str) -> PathStats:
+        key = (name, peer)
+        if key not in self._stats:
+            self._stats[key] = PathStats()
+        return self._stats[key]
+
+    def ranked_paths(self, peer: str) -> List[str]:
+        """
+        Healthy paths ordered by score, then the ones that are down as a last
+        resort.  A down path only becomes healthy again through a successful
+        probe, which is how a recovered link gets re‑promoted.
+        """
+        order = list(self.paths)
+        healthy = [n for n in order if self.stats(n, peer).healthy]
+        healthy.sort(key=lambda n: (self.stats(n, peer).score(), order.index(n)))
+        rest = [n for n in order if n not in healthy]
+        rest.sort(key=lambda n: self.stats(n, peer).down_until)
+        return healthy + rest
+
+    def active_path(self, peer: str) -> Optional[str]:
+        return self._active.get(peer)
+
+    def route_table(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        table: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        for (name, peer), st in self._stats.items():
+            table.setdefault(peer, {})[name] = st.as_dict()
+        return table
+
+    # ── probing ────────────────────────────────────────────────────────────────
+    async def probe(self, peer: str, force: bool = False) -> Dict[str, Dict[str, Any]]:
+        """
+        Measure every path towards *peer*.  Transports with ``ping(peer)``
+        return the measured round trip in seconds; others only get a
+        liveness check (``peek_messages``) and keep the RTT prior.  Down
+        paths are skipped until their back‑off expires unless *force*.
+        """
+        for name, path in self.paths.items():
+            st = self.stats(name, peer)
+            if not st.healthy and not st.probe_due and not force:
+                continue
+            try:
+                ping = getattr(path, "ping", None)
+                if ping is not None:
+                    rtt = await asyncio.wait_for(maybe_await(ping(peer)), timeout=self.send_timeout)
+                else:
+                    await maybe_await(path.peek_messages(peer))
+                    rtt = None
+            except Exception as e:
+                st.record_failure(e)
+                continue
+            recovered = not st.healthy
+            st.record_success(rtt)
+            if recovered:
+                print(f"✅ path {name} to {peer} is back")
+                for callback in self.on_recover:
+                    try:
+                        await maybe_await(callback(peer, name))
+                    except Exception as e:
+                        print(f"⚠️ on_recover callback failed: {e}")
+        return {name: self.stats(name, peer).as_dict() for name in self.paths}
+
+    async def run_prober(self, peers: List[str], interval: float = PROBE_EVERY_S) -> None:
+        """Background task: keep RTT estimates fresh and re‑promote recovered paths."""
+        while True:
+            for peer in peers:
+                try:
+                    await self.probe(peer)
+                except Exception as e:
+                    print(f"⚠️ probe to {peer} failed: {e}")
+            # wake up early when a down path is due for its next probe
+            due = [st.down_until for st in self._stats.values() if not st.healthy]
+            wait = min([interval] + [max(0.0, d - time.monotonic()) for d in due])
+            await asyncio.sleep(max(wait, 0.1))
+
+    def start_prober(self, peers: List[str], loop: Optional[asyncio.AbstractEventLoop] = None,
+                     interval: float = PROBE_EVERY_S) -> None:
+        """
+        Start run_prober() once.  With *loop* (running in another thread) the
+        task is scheduled thread‑safely, otherwise on the current loop.
+        """
+        if self._prober is not None:
+            return
+        coro = self.run_prober(peers, interval)
+        if loop is not None:
+            self._prober = asyncio.run_coroutine_threadsafe(coro, loop)
+        else:
+            self._prober = asyncio.ensure_future(coro)
 
     # ── BaseTransport API ────────────────────────────────────────────
-    async def send_message(self, *args, **kw) -> None:        # type: ignore[override]
-        return await self.outbound.send_message(*args, **kw)
+    async def send_message(self, to: str, *args, **kw) -> None:   # type: ignore[override]
+        """
+        Try paths best‑first.  The message is only considered sent once a
+        path returns without raising, so a failing link never drops it.
+        """
+        last_error: Optional[Exception] = None
+        for name in self.ranked_paths(to):
+            st = self.stats(name, to)
+            was_down = not st.healthy
+            try:
+                result = await asyncio.wait_for(
+                    maybe_await(self.paths[name].send_message(to, *args, **kw)),
+                    timeout=self.send_timeout,
+                )
+            except Exception as e:
+                st.record_failure(e)
+                last_error = e
+                continue
+
+            # local send cost is not an RTT sample; a last‑resort send over a
+            # down path doesn't re‑promote it either – only a probe does
+            if not was_down:
+                st.record_success()
+            previous = self._active.get(to)
+            if previous != name:
+                if previous is not None:
+                    print(f"🔀 route to {to}: {previous} → {name}")
+                self._active[to] = name
+            return result
+
+        raise ConnectionError(f"no transport path could reach {to}") from last_error
 
-    def receive_messages(self, self_id: str) -> Optional[Dict[str, Any]]:  # type: ignore[override]
-        return self.inbound.receive_messages(self_id)
+    async def receive_messages(self, self_id: str) -> Optional[Dict[str, Any]]:  # type: ignore[override]
+        """Drain the inbound link first, then any fallback path."""
+        sources: List[BaseTransport] = [self.inbound] if self.inbound is not None else []
+        sources += [p for n, p in self.paths.items() if n != "primary"]
+        for source in sources:
+            try:
+                msg = await maybe_await(source.receive_messages(self_id))
+            except Exception as e:
+                print(f"⚠️ receive failed on {type(source).__name__}: {e}")
+                continue
+            if msg:
+                return msg
+        return None
 
     # the following are no‑ops for WebRTC use‑case
     def peek_messages(self, recipient: str) -> Optional[List[dict]]: return None
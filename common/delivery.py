@@ -0,0 +1,428 @@
+# common/delivery.py
+"""
+Reliable delivery on top of any BaseTransport.
+
+• every outbound message gets a per‑peer sequence number and is appended to
+  a persistent outbox *before* it is handed to the transport
+• the receiver runs the handler first, then records the sequence number and
+  acknowledges it – a crash inside the handler means no ack, so the sender
+  replays the message later
+• duplicates (retransmits, replays after reconnect) are dropped by sequence
+  number, so each message reaches the handler exactly once
+• acks are cumulative (``upto``) plus a short selective list for gaps, and
+  are batched: one ack per ``ack_every`` messages or ``ack_delay`` seconds
+• every header carries the sender's ``epoch`` (picked when its outbox is
+  created).  If the outbox is lost, numbering restarts at 1 under a new
+  epoch and the receiver resets its dedupe state for that peer instead of
+  dropping everything as a duplicate
+
+Both the outbox and the delivered‑set are append‑only jsonl journals that
+are compacted once most of their records are obsolete, so steady‑state cost
+is one small append per message instead of rewriting a whole JSON file.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Union
+
+from common.message import Message
+from common.transport import BaseTransport, maybe_await
+
+ACK_TYPE        = "ack"
+ACK_EVERY       = 8       # flush an ack after this many deliveries
+ACK_DELAY_S     = 0.5     # …or after this long, whichever comes first
+RETRANSMIT_S    = 3.0     # resend anything unacked for this long
+MAX_SACK        = 64      # cap on selective‑ack entries per ack
+COMPACT_RATIO   = 4       # compact a journal once it is N× its live size
+COMPACT_MIN     = 256     # …and has at least this many records
+
+
+def _default_state_dir() -> Path:
+    return Path(__file__).resolve().parent.parent / "inbox" / "delivery"
+
+
+# ───────────────────────────────── JOURNAL ────────────────────────────────────
+class _Journal:
+    """Append‑only jsonl file with atomic compaction."""
+
+    def __init__(self, path: Path, fsync: bool = False) -> None:
+        self.path = path
+        self.fsync = fsync
+        self.records = 0
+        self._fh = None
+
+    def load(self) -> List[Dict[str, Any]]:
+        if not self.path.exists():
+            return []
+        out = []
+        with self.path.open() as fh:
+            for line in fh:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    out.append(json.loads(line))
+                except json.JSONDecodeError:
+                    break          # torn final write – everything after is garbage
+        self.records = len(out)
+        return out
+
+    def append(self, record: Dict[str, Any]) -> None:
+        if self._fh is None:
+            self._fh = self.path.open("a")
+        self._fh.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self._fh.flush()
+        if self.fsync:
+            os.fsync(self._fh.fileno())
+        self.records += 1
+
+    def rewrite(self, records: List[Dict[str, Any]]) -> None:
+        self.close()
+        tmp = self.path.with_suffix(".tmp")
+        with tmp.open("w") as fh:
+            for r in records:
+                fh.write(json.dumps(r, separators=(",", ":")) + "\n")
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, self.path)
+        self.records = len(records)
+
+    def close(self) -> None:
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+
+# ───────────────────────────────── OUTBOX ─────────────────────────────────────
+class Outbox:
+    """Persistent per‑peer queue of sent‑but‑unacknowledged messages."""
+
+    def __init__(self, path: Path, fsync: bool = False) -> None:
+        self._journal = _Journal(path, fsync)
+        self.epoch = 0
+        self.next_seq: Dict[str, int] = {}
+        self.pending: Dict[str, Dict[int, Dict[str, Any]]] = {}
+        self.sent_at: Dict[tuple, float] = {}
+
+        for rec in self._journal.load():
+            if rec["op"] == "epoch":
+                self.epoch = rec["epoch"]
+                continue
+            peer = rec["peer"]
+            if rec["op"] == "send":
+                self.pending.setdefault(peer, {})[rec["seq"]] = rec["msg"]
+                self.next_seq[peer] = max(self.next_seq.get(peer, 1), rec["seq"] + 1)
+            elif rec["op"] == "ack":
+                self._drop(peer, rec.get("upto", 0), rec.get("sack", ()))
+            elif rec["op"] == "seq":
+                self.next_seq[peer] = max(self.next_seq.get(peer, 1), rec["next"])
+        if not self.epoch:
+            # fresh (or lost) outbox: wall‑clock ns, so a later one always compares newer
+            self.epoch = time.time_ns()
+            self._journal.append({"op": "epoch", "epoch": self.epoch})
+
+    def _drop(self, peer: str, upto: int, sack) -> int:
+        box = self.pending.get(peer, {})
+        gone = [s for s in box if s <= upto or s in sack]
+        for s in gone:
+            del box[s]
+            self.sent_at.pop((peer, s), None)
+        return len(gone)
+
+    def add(self, peer: str, msg: Dict[str, Any]) -> int:
+        seq = self.next_seq.get(peer, 1)
+        self.next_seq[peer] = seq + 1
+        self.pending.setdefault(peer, {})[seq] = msg
+        self._journal.append({"op": "send", "peer": peer, "seq": seq, "msg": msg})
+        return seq
+
+    def ack(self, peer: str, upto: int, sack: List[int] = ()) -> int:
+        removed = self._drop(peer, upto, set(sack))
+        if removed:
+            self._journal.append({"op": "ack", "peer": peer, "upto": upto, "sack": list(sack)})
+            self._maybe_compact()
+        return removed
+
+    def unacked(self, peer: str) -> List[int]:
+        return sorted(self.pending.get(peer, {}))
+
+    def _maybe_compact(self) -> None:
+        live = sum(len(b) for b in self.pending.values())
+        if self._journal.records < COMPACT_MIN or self._journal.records < COMPACT_RATIO * (live + 1):
+            return
+        records: List[Dict[str, Any]] = [{"op": "epoch", "epoch": self.epoch}]
+        records += [{"op": "seq", "peer": peer, "next": nxt} for peer, nxt in self.next_seq.items()]
+        for peer, box in self.pending.items():
+            for seq in sorted(box):
+                records.append({"op": "send", "peer": peer, "seq": seq, "msg": box[seq]})
+        self._journal.rewrite(records)
+
+    def close(self) -> None:
+        self._journal.close()
+
+
+# ────────────────────────────── DELIVERED SET ─────────────────────────────────
+class DeliveredLog:
+    """
+    Receiver‑side dedupe state: for each peer its current epoch, the highest
+    contiguous delivered sequence number and the out‑of‑order ones above it.
+    """
+
+    def __init__(self, path: Path, fsync: bool = False) -> None:
+        self._journal = _Journal(path, fsync)
+        self.epoch: Dict[str, int] = {}
+        self.upto: Dict[str, int] = {}
+        self.above: Dict[str, Set[int]] = {}
+        for rec in self._journal.load():
+            if "epoch" in rec and rec["epoch"] != self.epoch.get(rec["peer"]):
+                self._reset(rec["peer"], rec["epoch"])
+            if "upto" in rec:
+                self.upto[rec["peer"]] = max(self.upto.get(rec["peer"], 0), rec["upto"])
+            for seq in rec.get("seqs", ()):
+                self._mark(rec["peer"], seq)
+
+    def _mark(self, peer: str, seq: int) -> None:
+        upto = self.upto.get(peer, 0)
+        if seq <= upto:
+            return
+        above = self.above.setdefault(peer, set())
+        above.add(seq)
+        while upto + 1 in above:
+            upto += 1
+            above.discard(upto)
+        self.upto[peer] = upto
+
+    def _reset(self, peer: str, epoch: int) -> None:
+        self.epoch[peer] = epoch
+        self.upto[peer] = 0
+        self.above.pop(peer, None)
+
+    def sync_epoch(self, peer: str, epoch: int) -> bool:
+        """
+        Track the sender's epoch.  A newer one means it lost its outbox and
+        restarted numbering, so forget its old sequence numbers.  False for
+        a stale epoch (stragglers from before the restart).
+        """
+        current = self.epoch.get(peer)
+        if current == epoch:
+            return True
+        if current is not None and epoch < current:
+            return False
+        self._reset(peer, epoch)
+        self._journal.append({"peer": peer, "epoch": epoch, "upto": 0})
+        return True
+
+    def seen(self, peer: str, seq: int) -> bool:
+        return seq <= self.upto.get(peer, 0) or seq in self.above.get(peer, ())
+
+    def mark(self, peer: str, seq: int) -> None:
+        self._mark(peer, seq)
+        self._journal.append({"peer": peer, "seqs": [seq]})
+        if self._journal.records >= COMPACT_MIN and self._journal.records > COMPACT_RATIO * len(self.upto):
+            records = []
+            for p, u in self.upto.items():
+                rec = {"peer": p, "upto": u, "seqs": sorted(self.above.get(p, ()))}
+                if p in self.epoch:
+                    rec["epoch"] = self.epoch[p]
+                records.append(rec)
+            self._journal.rewrite(records)
+
+    def ack_state(self, peer: str) -> Dict[str, Any]:
+        state = {"upto": self.upto.get(peer, 0), "sack": sorted(self.above.get(peer, ()))[:MAX_SACK]}
+        if peer in self.epoch:
+            state["epoch"] = self.epoch[peer]
+        return state
+
+    def close(self) -> None:
+        self._journal.close()
+
+
+# ───────────────────────────── RELIABLE CHANNEL ───────────────────────────────
+Handler = Callable[[Message], Union[None, Awaitable[None]]]
+
+
+class ReliableChannel:
+    """
+    Wraps a transport with sequence numbers, acks, dedupe and replay.
+
+        channel = ReliableChannel(transport, "assistant_a")
+        await channel.send("assistant_b", "hello", user_initiated=True)
+        await channel.poll(handler)          # call from the receive loop
+        await channel.replay("assistant_b")  # after a reconnect
+        asyncio.ensure_future(channel.run_retransmitter())
+
+    *transport* may also be a common.messenger.Messenger, which encrypts
+    data and acks end to end on the way through.
+    """
+
+    def __init__(self, transport: BaseTransport, self_id: str,
+                 state_dir: Optional[Union[str, Path]] = None,
+                 ack_every: int = ACK_EVERY, ack_delay: float = ACK_DELAY_S,
+                 fsync: bool = False) -> None:
+        self.transport = transport
+        self.self_id = self_id
+        self.ack_every = ack_every
+        self.ack_delay = ack_delay
+
+        state = Path(state_dir) if state_dir is not None else _default_state_dir()
+        state.mkdir(parents=True, exist_ok=True)
+        self.outbox = Outbox(state / f"{self_id}_outbox.jsonl", fsync)
+        self.delivered = DeliveredLog(state / f"{self_id}_delivered.jsonl", fsync)
+
+        self._owed: Dict[str, int] = {}                  # deliveries not yet acked
+        self._ack_timers: Dict[str, asyncio.TimerHandle] = {}
+        self._inflight: Set[tuple] = set()               # handler still running
+        self.stats = {"sent": 0, "retransmits": 0, "delivered": 0, "duplicates": 0,
+                      "stale": 0, "acks_sent": 0, "acks_received": 0}
+
+    # ── send side ──────────────────────────────────────────────────────────────
+    async def send(self, to: str, message: str, msg_type: str = "user",
+                   conversation_id: Optional[str] = None,
+                   user_initiated: bool = False,
+                   hmac_sig: Optional[str] = None) -> int:
+        """Persist, then transmit.  A transport error leaves it queued for replay."""
+        msg = {
+            "message": message,
+            "msg_type": msg_type,
+            "conversation_id": conversation_id,
+            "user_initiated": user_initiated,
+            "hmac_sig": hmac_sig,
+        }
+        seq = self.outbox.add(to, msg)
+        self.stats["sent"] += 1
+        await self._transmit(to, seq, msg)
+        return seq
+
+    async def _transmit(self, to: str, seq: int, msg: Dict[str, Any]) -> bool:
+        self.outbox.sent_at[(to, seq)] = time.monotonic()
+        try:
+            await maybe_await(self.transport.send_message(
+                to=to, sender=self.self_id,
+                headers={"seq": seq, "epoch": self.outbox.epoch}, **msg))
+            return True
+        except Exception as e:
+            print(f"[{self.self_id}] ⏳ seq {seq} → {to} queued for replay: {e}")
+            return False
+
+    async def replay(self, peer: str) -> int:
+        """Resend every unacked message to *peer* in order (e.g. after reconnect)."""
+        sent = 0
+        for seq in self.outbox.unacked(peer):
+            msg = self.outbox.pending[peer].get(seq)
+            if msg is None:
+                continue
+            if not await self._transmit(peer, seq, msg):
+                break
+            self.stats["retransmits"] += 1
+            sent += 1
+        return sent
+
+    async def retransmit_due(self, rto: float = RETRANSMIT_S) -> int:
+        """Resend anything that has waited longer than *rto* for its ack."""
+        now = time.monotonic()
+        sent = 0
+        for peer, box in list(self.outbox.pending.items()):
+            for seq in sorted(box):
+                msg = box.get(seq)          # may have been acked while we awaited
+                if msg is None or now - self.outbox.sent_at.get((peer, seq), 0.0) < rto:
+                    continue
+                if not await self._transmit(peer, seq, msg):
+                    break
+                self.stats["retransmits"] += 1
+                sent += 1
+        return sent
+
+    async def run_retransmitter(self, interval: float = RETRANSMIT_S / 2,
+                                rto: float = RETRANSMIT_S) -> None:
+        """Background task: retransmit_due() every *interval* seconds."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.retransmit_due(rto)
+            except Exception as e:
+                print(f"[{self.self_id}] ⚠️ retransmit failed: {e}")
+
+    # ── receive side ───────────────────────────────────────────────────────────
+    async def poll(self, handler: Handler) -> bool:
+        """Pull one message from the transport and run it through handle()."""
+        msg = await maybe_await(self.transport.receive_messages(self.self_id))
+        if not msg:
+            return False
+        await self.handle(msg, handler)
+        return True
+
+    async def handle(self, msg: Message, handler: Handler) -> None:
+        headers = msg.headers or {}
+        peer = msg.sender
+
+        if msg.type == ACK_TYPE:
+            self.stats["acks_received"] += 1
+            epoch = headers.get("epoch")
+            if epoch is None or epoch == self.outbox.epoch:    # else: acks a lost outbox
+                self.outbox.ack(peer, int(headers.get("upto", 0)), headers.get("sack", []))
+            return
+
+        seq = headers.get("seq")
+        if seq is None:                    # legacy sender without the delivery layer
+            await maybe_await(handler(msg))
+            return
+
+        epoch = headers.get("epoch")
+        if epoch is not None and not self.delivered.sync_epoch(peer, int(epoch)):
+            self.stats["stale"] += 1
+            return
+
+        key = (peer, epoch, seq)
+        if key in self._inflight:
+            self.stats["duplicates"] += 1      # retransmit of one we're still handling
+            return
+        if self.delivered.seen(peer, seq):
+            self.stats["duplicates"] += 1
+            self._owe_ack(peer, immediate=True)   # our earlier ack was probably lost
+            return
+
+        self._inflight.add(key)
+        try:
+            await maybe_await(handler(msg))   # raise ⇒ no mark, no ack ⇒ sender replays
+        finally:
+            self._inflight.discard(key)
+        if self.delivered.epoch.get(peer) != epoch and epoch is not None:
+            return                            # peer restarted while we were handling it
+        self.delivered.mark(peer, seq)
+        self.stats["delivered"] += 1
+        self._owe_ack(peer)
+
+    # ── batched acks ───────────────────────────────────────────────────────────
+    def _owe_ack(self, peer: str, immediate: bool = False) -> None:
+        self._owed[peer] = self._owed.get(peer, 0) + 1
+        if immediate or self._owed[peer] >= self.ack_every:
+            asyncio.ensure_future(self.flush_acks(peer))
+        elif peer not in self._ack_timers:
+            loop = asyncio.get_event_loop()
+            self._ack_timers[peer] = loop.call_later(
+                self.ack_delay, lambda: asyncio.ensure_future(self.flush_acks(peer)))
+
+    async def flush_acks(self, peer: Optional[str] = None) -> None:
+        for p in ([peer] if peer else list(self._owed)):
+            if not self._owed.pop(p, 0):
+                continue
+            timer = self._ack_timers.pop(p, None)
+            if timer is not None:
+                timer.cancel()
+            try:
+                await maybe_await(self.transport.send_message(
+                    to=p, sender=self.self_id, message="", msg_type=ACK_TYPE,
+                    headers=self.delivered.ack_state(p)))
+                self.stats["acks_sent"] += 1
+            except Exception as e:
+                print(f"[{self.self_id}] ⚠️ ack to {p} failed (peer will retransmit): {e}")
+
+    def close(self) -> None:
+        for timer in self._ack_timers.values():
+            timer.cancel()
+        self.outbox.close()
+        self.delivered.close()
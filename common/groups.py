@@ -0,0 +1,283 @@
+# common/groups.py
+"""
+Named groups with a shared group key.
+
+A broadcast is encrypted **once** with the group's AES‑GCM key and the same
+ciphertext is fanned out to every member, so sending to N peers costs one
+encryption plus N writes instead of N encryptions.
+
+    groups = GroupManager(NAME, SECRET_KEY)
+    await groups.create("ops", ["assistant_b", "assistant_c"], transport)
+    await groups.broadcast(transport, "ops", "deploy starts in 5 min")
+
+    # receiving side
+    msg = groups.open(msg)            # consumes "group_key", decrypts broadcasts
+
+Every membership change rotates the key (new random key, epoch + 1).  The
+new key is wrapped for each remaining member with that member's pairwise
+key and sent as a ``group_key`` control message; a removed member never
+sees it, and removal also drops every older key so nothing the removed
+member still holds opens or sends.  Key updates are only taken from the
+group's creator or a current member, and only for a newer epoch;
+broadcasts only from current members.  The cleartext headers (group,
+epoch, members…) are authenticated as GCM associated data.  By default pairwise keys are derived from the shared secret and
+the two peer names – pass ``key_for`` to use real per‑peer secrets, since
+anyone holding the shared secret can derive the default ones.
+
+File‑backed transports get all of a broadcast's writes in one batch
+(``FileTransport.deliver_many``): one read‑modify‑write per inbox.
+"""
+from __future__ import annotations
+
+import asyncio
+import base64
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Mapping, Optional, Union
+
+from common.message import Message
+from common.messenger import decrypt_payload, encrypt_payload, envelope_aad
+from common.transport import BaseTransport, maybe_await
+
+GROUP_KEY_TYPE = "group_key"
+KEEP_EPOCHS = 2        # older keys kept so in‑flight broadcasts still open
+DEFAULT_STATE_DIR = Path(__file__).resolve().parent.parent / "inbox" / "groups"
+
+Transports = Union[BaseTransport, Mapping[str, BaseTransport]]
+
+
+def pairwise_key(shared_secret: str, a: str, b: str) -> bytes:
+    """Same on both ends: sha256(secret | sorted names)."""
+    lo, hi = sorted((a, b))
+    return hashlib.sha256(f"{shared_secret}|{lo}|{hi}".encode()).digest()
+
+
+class Group:
+    __slots__ = ("name", "members", "epoch", "keys", "creator")
+
+    def __init__(self, name: str, members: Iterable[str], epoch: int = 0,
+                 keys: Optional[Dict[int, bytes]] = None,
+                 creator: Optional[str] = None) -> None:
+        self.name = name
+        self.members = sorted(set(members))
+        self.epoch = epoch
+        self.keys: Dict[int, bytes] = keys or {}
+        self.creator = creator
+
+    @property
+    def key(self) -> Optional[bytes]:
+        return self.keys.get(self.epoch)
+
+    def set_key(self, epoch: int, key: bytes, revoke: bool = False) -> None:
+        """``revoke`` forgets every older key (a member was removed)."""
+        if revoke:
+            self.keys.clear()
+        self.keys[epoch] = key
+        self.epoch = max(self.epoch, epoch)
+        for old in sorted(self.keys)[:-KEEP_EPOCHS]:
+            del self.keys[old]
+
+    def may_rekey(self, peer: str) -> bool:
+        return peer == self.creator or peer in self.members
+
+
+class GroupManager:
+    def __init__(self, self_name: str, shared_key: str,
+                 key_for: Optional[Callable[[str], bytes]] = None,
+                 state_dir: Optional[Union[str, Path]] = None, persist: bool = True) -> None:
+        self.self_name = self_name
+        self.key_for = key_for or (lambda peer: pairwise_key(shared_key, self_name, peer))
+        # at‑rest wrapping key for persisted group keys
+        self._local_key = hashlib.sha256(f"{shared_key}|groups|{self_name}".encode()).digest()
+        self.groups: Dict[str, Group] = {}
+        self.stats = {"broadcasts": 0, "encryptions": 0, "deliveries": 0, "rotations": 0}
+
+        self.state_path: Optional[Path] = None
+        if persist:
+            self.state_path = Path(state_dir or DEFAULT_STATE_DIR) / f"{self_name}.json"
+            self._load()
+
+    # ── persistence ────────────────────────────────────────────────────────────
+    def _load(self) -> None:
+        if not self.state_path.exists():
+            return
+        try:
+            raw = json.loads(self.state_path.read_text())
+            for name, g in raw.items():
+                keys = {int(e): base64.b64decode(decrypt_payload(self._local_key, k))
+                        for e, k in g["keys"].items()}
+                self.groups[name] = Group(name, g["members"], g["epoch"], keys, g.get("creator"))
+        except Exception as e:
+            print(f"[{self.self_name}] ⚠️ Could not load group state: {e}")
+
+    def _save(self) -> None:
+        if self.state_path is None:
+            return
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        raw = {name: {"members": g.members, "epoch": g.epoch, "creator": g.creator,
+                      "keys": {str(e): encrypt_payload(self._local_key, base64.b64encode(k).decode())
+                               for e, k in g.keys.items()}}
+               for name, g in self.groups.items()}
+        tmp = self.state_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(raw, indent=2))
+        os.replace(tmp, self.state_path)
+
+    # ── membership ─────────────────────────────────────────────────────────────
+    def _peers(self, group: Group) -> List[str]:
+        return [m for m in group.members if m != self.self_name]
+
+    async def create(self, name: str, members: Iterable[str], transports: Transports) -> Group:
+        group = Group(name, [*members, self.self_name], creator=self.self_name)
+        self.groups[name] = group
+        await self.rotate(name, transports)
+        return group
+
+    async def add_member(self, name: str, peer: str, transports: Transports) -> Group:
+        group = self.groups[name]
+        group.members = sorted({*group.members, peer})
+        await self.rotate(name, transports)
+        return group
+
+    async def remove_member(self, name: str, peer: str, transports: Transports) -> Group:
+        group = self.groups[name]
+        group.members = [m for m in group.members if m != peer]
+        await self.rotate(name, transports, revoke=True)
+        return group
+
+    async def rotate(self, name: str, transports: Transports, revoke: bool = False) -> int:
+        """
+        New random key, epoch + 1, wrapped individually for every member.
+        ``revoke`` makes everyone drop the older keys too.
+        """
+        group = self.groups[name]
+        epoch = group.epoch + 1 if group.keys else 1
+        key = os.urandom(32)
+        group.set_key(epoch, key, revoke)
+        self._save()
+        self.stats["rotations"] += 1
+
+        headers = {"group": name, "epoch": epoch, "members": group.members,
+                   "creator": group.creator or self.self_name}
+        if revoke:
+            headers["revoke"] = True
+        encoded = base64.b64encode(key).decode()
+        sends = []
+        for peer in self._peers(group):
+            msg = Message(self.self_name, peer, GROUP_KEY_TYPE, "", encrypted=True, headers=headers)
+            msg.body = encrypt_payload(self.key_for(peer), encoded, envelope_aad(msg))
+            sends.append(msg)
+        await self._fan_out(transports, sends)
+        return epoch
+
+    # ── broadcast ──────────────────────────────────────────────────────────────
+    def seal(self, name: str, message: str, msg_type: str = "user",
+             conversation_id: Optional[str] = None) -> List[Message]:
+        """Encrypt once; one Message per member sharing the same ciphertext."""
+        group = self.groups[name]
+        if group.key is None:
+            raise KeyError(f"no key for group {name!r} yet")
+        headers = {"group": name, "epoch": group.epoch}
+        envelope = Message(self.self_name, None, msg_type, "", conversation_id=conversation_id,
+                           headers=headers)
+        body = encrypt_payload(group.key, message, envelope_aad(envelope, recipient=False))
+        self.stats["encryptions"] += 1
+        self.stats["broadcasts"] += 1
+        return [Message(self.self_name, peer, msg_type, body, conversation_id=conversation_id,
+                        encrypted=True, headers=headers)
+                for peer in self._peers(group)]
+
+    async def broadcast(self, transports: Transports, name: str, message: str,
+                        msg_type: str = "user", conversation_id: Optional[str] = None) -> int:
+        sends = self.seal(name, message, msg_type, conversation_id)
+        await self._fan_out(transports, sends)
+        return len(sends)
+
+    async def _fan_out(self, transports: Transports, sends: List[Message]) -> None:
+        if not sends:
+            return
+        if not isinstance(transports, Mapping):
+            transports = {m.to: transports for m in sends}
+
+        batched: Dict[int, List[Message]] = {}
+        single = []
+        for msg in sends:
+            transport = transports.get(msg.to)
+            if transport is None:
+                print(f"[{self.self_name}] ⚠️ No transport for group member {msg.to}")
+                continue
+            if hasattr(transport, "deliver_many"):
+                batched.setdefault(id(transport), []).append(msg)
+            else:
+                single.append(transport.send_message(
+                    to=msg.to, sender=msg.sender, message=msg.body, msg_type=msg.type,
+                    conversation_id=msg.conversation_id, headers=msg.headers,
+                    encrypted=msg.encrypted))
+
+        by_id = {id(t): t for t in transports.values()}
+        for tid, msgs in batched.items():
+            by_id[tid].deliver_many(msgs)
+        await asyncio.gather(*(maybe_await(s) for s in single))
+        self.stats["deliveries"] += len(sends)
+
+    # ── receive ────────────────────────────────────────────────────────────────
+    def is_group_message(self, msg: Message) -> bool:
+        return msg.type == GROUP_KEY_TYPE or bool(msg.headers and "group" in msg.headers)
+
+    def open(self, msg: Message) -> Optional[Message]:
+        """
+        Handle a group message in place.  ``group_key`` messages update the
+        key store and return None; broadcasts come back decrypted.  Anything
+        else is returned untouched.
+        """
+        if not self.is_group_message(msg):
+            return msg
+        try:
+            headers = msg.headers or {}
+            name, epoch = headers.get("group"), headers.get("epoch")
+            if name is None or epoch is None:
+                print(f"[{self.self_name}] 🔐 Group message from {msg.sender} without group/epoch")
+                return None
+            epoch = int(epoch)
+            group = self.groups.get(name)
+            if msg.type == GROUP_KEY_TYPE:
+                return self._rekey(msg, name, epoch, group)
+
+            if group is None or msg.sender not in group.members:
+                print(f"[{self.self_name}] 🚨 Group {name!r} message from non‑member {msg.sender}")
+                return None
+            key = group.keys.get(epoch)
+            if key is None:
+                print(f"[{self.self_name}] 🔐 No key for group {name!r} epoch {epoch}")
+                return None
+            msg.body = decrypt_payload(key, msg.body, envelope_aad(msg, recipient=False))
+            msg.encrypted = False
+            return msg
+        except Exception as e:
+            print(f"[{self.self_name}] 🔐 Failed to open group message: {e}")
+            return None
+
+    def _rekey(self, msg: Message, name: str, epoch: int, group: Optional[Group]) -> None:
+        # headers are associated data: a bad tag means they were tampered with
+        key = base64.b64decode(decrypt_payload(self.key_for(msg.sender), msg.body,
+                                               envelope_aad(msg)))
+        headers = msg.headers
+        members = sorted(headers.get("members") or ())
+        if group is None:
+            if msg.sender not in members or self.self_name not in members:
+                print(f"[{self.self_name}] 🚨 Group {name!r} key from {msg.sender}, not a member")
+                return None
+            group = Group(name, members, creator=headers.get("creator") or msg.sender)
+        elif not group.may_rekey(msg.sender):
+            print(f"[{self.self_name}] 🚨 Group {name!r} key from non‑member {msg.sender}")
+            return None
+        elif epoch <= group.epoch:
+            print(f"[{self.self_name}] 🔐 Stale group {name!r} key epoch {epoch} from {msg.sender}")
+            return None
+        group.members = members
+        group.set_key(epoch, key, bool(headers.get("revoke")))
+        self.groups[name] = group
+        self._save()
+        print(f"[{self.self_name}] 🔑 Group {name!r} key epoch {epoch} from {msg.sender}")
+        return None
@@ -0,0 +1,104 @@
+# common/inbound.py
+"""
+The assistants' receive path:
+
+    poll → Messenger.areceive_raw()                        (admission, envelope only)
+         → Messenger.open_all() or ShardedProcessor.process()   (AES‑GCM)
+    control lane (acks, busy…) → ReliableChannel.handle() straight away
+    user / bot                 → AsyncPriorityQueue → ``workers`` handler tasks
+                                 → ReliableChannel.handle(msg, handler)
+
+A handler may take as long as an LLM call.  Control traffic never waits
+for one, and with more than one handler task a reply isn't stuck behind
+it either.  A retransmit of a message that is still being handled is
+dropped by the channel's in‑flight check.  Handlers can run concurrently,
+so per‑conversation order is only kept with ``workers=1``.
+
+    pipeline = InboundPipeline(messenger, channel, handle_incoming)
+    await pipeline.run()
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+from typing import Callable, List, Optional
+
+from common.message import Message
+from common.priority import CONTROL, AsyncPriorityQueue, lane_for
+
+POLL_S = 1.0
+HANDLER_WORKERS = int(os.getenv("PEERAI_HANDLERS", "2"))
+
+
+class InboundPipeline:
+    def __init__(self, messenger, channel, handler: Callable, processor=None,
+                 workers: int = HANDLER_WORKERS, poll_s: float = POLL_S) -> None:
+        self.messenger = messenger      # common.messenger.Messenger
+        self.channel = channel          # common.delivery.ReliableChannel
+        self.handler = handler          # async or sync, called once per new message
+        self.processor = processor      # optional common.sharding.ShardedProcessor
+        self.workers = max(1, workers)
+        self.poll_s = poll_s
+        self.name = messenger.self_name
+        self.queue = AsyncPriorityQueue()
+        self._busy = 0
+        self._tasks: List[asyncio.Task] = []
+
+    async def _open(self, raw: List[Message]) -> List[Message]:
+        if self.processor is None:
+            return self.messenger.open_all(raw)
+        loop = asyncio.get_running_loop()
+        opened = await loop.run_in_executor(None, self.processor.process, raw)
+        self.messenger.record_opened(opened)        # capture + known peers, as open() does
+        return opened
+
+    async def _handle(self, msg: Message) -> None:
+        try:
+            # dedupe + ack; a handler error leaves it unacked for the peer to resend
+            await self.channel.handle(msg, self.handler)
+        except Exception as e:
+            print(f"[{self.name}] ⚠️ dispatch: {e}")
+
+    async def poll(self) -> int:
+        """One fetch: control handled inline, the rest queued.  Returns how many opened."""
+        raw = await self.messenger.areceive_raw()
+        if not raw:
+            return 0
+        incoming = await self._open(raw)
+        for msg in incoming:
+            if lane_for(msg.type) == CONTROL:
+                await self._handle(msg)
+            else:
+                self.queue.put_nowait(msg)
+        return len(incoming)
+
+    async def _worker(self) -> None:
+        while True:
+            msg = await self.queue.get()
+            self._busy += 1
+            try:
+                await self._handle(msg)
+            finally:
+                self._busy -= 1
+
+    def idle(self) -> bool:
+        """Nothing queued and no handler running."""
+        return self.queue.empty() and not self._busy
+
+    def start_workers(self) -> None:
+        if not self._tasks:
+            self._tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+
+    def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    async def run(self) -> None:
+        self.start_workers()
+        while True:
+            try:
+                await self.poll()
+            except Exception as e:
+                print(f"[{self.name}] ⚠️ receive loop: {e}")
+            await asyncio.sleep(self.poll_s)
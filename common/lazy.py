@@ -0,0 +1,49 @@
+# common/lazy.py
+"""
+Deferred imports for heavy optional dependencies (aiortc, cryptography,
+PyCryptodome, requests, openai …).
+
+    aiortc = lazy_import("aiortc")        # nothing imported yet
+    pc = aiortc.RTCPeerConnection()       # first attribute access imports it
+
+Unlike importlib.util.LazyLoader this also works for dotted submodules
+without importing their parent packages up front.
+"""
+import importlib
+import threading
+from types import ModuleType
+from typing import Any, Optional
+
+
+class LazyModule(ModuleType):
+    def __init__(self, name: str) -> None:
+        super().__init__(name)
+        self.__dict__["_lazy_module"] = None
+        self.__dict__["_lazy_lock"] = threading.Lock()
+
+    def _load(self) -> ModuleType:
+        module: Optional[ModuleType] = self.__dict__["_lazy_module"]
+        if module is None:
+            with self.__dict__["_lazy_lock"]:
+                module = self.__dict__["_lazy_module"]
+                if module is None:
+                    module = importlib.import_module(self.__name__)
+                    self.__dict__["_lazy_module"] = module
+        return module
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr: str, value: Any) -> None:
+        setattr(self._load(), attr, value)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    @property
+    def loaded(self) -> bool:
+        return self.__dict__["_lazy_module"] is not None
+
+
+def lazy_import(name: str) -> LazyModule:
+    return LazyModule(name)
@@ -3,16 +3,20 @@ from pathlib import Path
 from datetime import datetime
 import json
 import os
+from typing import Union
 
-def log_conversation(message: dict, assistant_name: str):
+from common.message import Message
+
+def log_conversation(message: Union[Message, dict], assistant_name: str):
     log_dir = Path("logs")
     log_dir.mkdir(exist_ok=True)
 
     log_file = log_dir / f"{assistant_name}_conversation.log"
-    timestamp = message.get("timestamp", datetime.now().isoformat())
-    sender = message.get("from", "unknown")
-    content = message.get("message", "")
-    conv_id = message.get("conversation_id", "unknown")
+    message = Message.coerce(message)
+    timestamp = message.timestamp
+    sender = message.sender
+    content = message.body
+    conv_id = message.conversation_id or "unknown"
 
     log_line = f"{timestamp} {sender} [conversation: {conv_id}]: {content}\n"
 
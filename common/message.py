@@ -0,0 +1,237 @@
+# common/message.py
+"""
+One message type for every transport.
+
+    msg = Message("assistant_a", "assistant_b", "user", "hello", user_initiated=True)
+    raw = encode(msg, "binary")          # or "json" / "msgpack"
+    msg = decode(raw, "binary")
+
+• ``__slots__`` – no per‑instance __dict__
+• ``ts`` is an int of nanoseconds since the epoch, strictly increasing
+  within a thread (no lock); no datetime formatting on the hot path
+• ``sender`` / ``to`` / ``type`` are interned, so a million messages
+  between two peers share three or four string objects
+• ``body`` is either plaintext or ciphertext; ``encrypted`` says which
+  (this replaces the old ``message`` / ``encrypted`` / ``plaintext`` keys)
+
+from_dict() still understands the old dict layouts and ISO timestamps, so
+inboxes and logs written before this change keep loading.
+"""
+from __future__ import annotations
+
+import json
+import struct
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Union
+
+from common.lazy import lazy_import
+
+msgpack = lazy_import("msgpack")
+
+_intern = sys.intern
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_ts_local = threading.local()
+
+
+def now_ns(_time_ns=time.time_ns, _local=_ts_local) -> int:
+    """
+    Wall‑clock nanoseconds, never equal to or below this thread's previous
+    call.  Per‑thread state instead of a global lock keeps Message() cheap;
+    two threads can still land on the same nanosecond.
+    """
+    ts = _time_ns()
+    last = getattr(_local, "last", 0)
+    if ts <= last:
+        ts = last + 1
+    _local.last = ts
+    return ts
+
+
+def _parse_ts(value: Any) -> int:
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        return int(value * 1e9)
+    if isinstance(value, str) and value:
+        dt = datetime.fromisoformat(value)
+        if dt.tzinfo is None:                      # legacy utcnow().isoformat()
+            dt = dt.replace(tzinfo=timezone.utc)
+        delta = dt - _EPOCH
+        return (delta.days * 86400 + delta.seconds) * 1_000_000_000 + delta.microseconds * 1000
+    return now_ns()
+
+
+class Message:
+    __slots__ = ("sender", "to", "type", "body", "ts", "conversation_id",
+                 "user_initiated", "encrypted", "hmac_sig", "headers")
+
+    def __init__(self, sender: str, to: Optional[str], type: str, body: str,
+                 ts: Optional[int] = None, conversation_id: Optional[str] = None,
+                 user_initiated: bool = False, encrypted: bool = False,
+                 hmac_sig: Optional[str] = None,
+                 headers: Optional[Dict[str, Any]] = None) -> None:
+        self.sender = _intern(sender)
+        self.to = _intern(to) if to is not None else None
+        self.type = _intern(type)
+        self.body = body
+        self.ts = now_ns() if ts is None else ts
+        self.conversation_id = conversation_id
+        self.user_initiated = user_initiated
+        self.encrypted = encrypted
+        self.hmac_sig = hmac_sig
+        self.headers = headers
+
+    def __repr__(self) -> str:
+        body = self.body if len(self.body) <= 40 else self.body[:37] + "..."
+        return (f"Message({self.sender!r}→{self.to!r}, type={self.type!r}, "
+                f"body={body!r}, ts={self.ts})")
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Message):
+            return NotImplemented
+        return all(getattr(self, f) == getattr(other, f) for f in self.__slots__)
+
+    @property
+    def timestamp(self) -> str:
+        """ISO‑8601 rendering, only computed when someone asks (logs, UI)."""
+        return datetime.fromtimestamp(self.ts / 1e9, timezone.utc).isoformat()
+
+    # ── dict form (JSON files, legacy interop) ─────────────────────────────────
+    def to_dict(self) -> Dict[str, Any]:
+        d: Dict[str, Any] = {"from": self.sender, "type": self.type,
+                             "message": self.body, "ts": self.ts}
+        if self.to is not None:
+            d["to"] = self.to
+        if self.conversation_id is not None:
+            d["conversation_id"] = self.conversation_id
+        if self.user_initiated:
+            d["user_initiated"] = True
+        if self.encrypted:
+            d["encrypted"] = True
+        if self.hmac_sig is not None:
+            d["hmac_sig"] = self.hmac_sig
+        if self.headers:
+            d["headers"] = self.headers
+        return d
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "Message":
+        enc = d.get("encrypted")
+        if isinstance(enc, str):                     # old Messenger layout
+            body, encrypted = enc, True
+        elif "plaintext" in d:
+            body, encrypted = d["plaintext"], False
+        else:
+            body, encrypted = d.get("message") or "", bool(enc)
+        ts = d.get("ts")
+        if type(ts) is not int:
+            ts = _parse_ts(d["ts"] if "ts" in d else d.get("timestamp"))
+        return cls(
+            sender=d.get("from") or "unknown",
+            to=d.get("to"),
+            type=d.get("type") or "user",
+            body=body,
+            ts=ts,
+            conversation_id=d.get("conversation_id"),
+            user_initiated=bool(d.get("user_initiated", False)),
+            encrypted=encrypted,
+            hmac_sig=d.get("hmac_sig"),
+            headers=d.get("headers"),
+        )
+
+    @classmethod
+    def coerce(cls, obj: Union["Message", Dict[str, Any]]) -> "Message":
+        return obj if isinstance(obj, Message) else cls.from_dict(obj)
+
+
+# ───────────────────────────────── CODECS ─────────────────────────────────────
+#
+# binary layout (little endian):
+#   u8 version | u8 flags | u64 ts | u16 len + sender | u16 len + to
+#   u16 len + type | u16 len + conversation_id | u16 len + hmac_sig
+#   u32 len + headers (JSON) | u32 len + body
+#
+_BIN_VERSION = 1
+_F_USER, _F_ENC, _F_TO, _F_CONV, _F_SIG, _F_HDR = 1, 2, 4, 8, 16, 32
+_HEAD = struct.Struct("<BBQ")
+# json.dumps(..., separators=...) builds a new JSONEncoder per call
+_json_compact = json.JSONEncoder(separators=(",", ":")).encode
+_U16 = struct.Struct("<H")
+_U32 = struct.Struct("<I")
+
+
+def _encode_binary(m: Message) -> bytes:
+    flags = ((_F_USER if m.user_initiated else 0) | (_F_ENC if m.encrypted else 0)
+             | (_F_TO if m.to is not None else 0) | (_F_CONV if m.conversation_id is not None else 0)
+             | (_F_SIG if m.hmac_sig is not None else 0) | (_F_HDR if m.headers else 0))
+    parts = [_HEAD.pack(_BIN_VERSION, flags, m.ts)]
+    for s in (m.sender, m.to or "", m.type, m.conversation_id or "", m.hmac_sig or ""):
+        b = s.encode()
+        parts += [_U16.pack(len(b)), b]
+    hdr = _json_compact(m.headers).encode() if m.headers else b""
+    body = m.body.encode()
+    parts += [_U32.pack(len(hdr)), hdr, _U32.pack(len(body)), body]
+    return b"".join(parts)
+
+
+def _decode_binary(raw: bytes, _head=_HEAD.unpack_from, _u16=_U16.unpack_from,
+                   _u32=_U32.unpack_from) -> Message:
+    version, flags, ts = _head(raw, 0)
+    if version != _BIN_VERSION:
+        raise ValueError(f"unsupported binary message version {version}")
+    # unrolled: this runs once per received frame
+    off = _HEAD.size
+    (n,) = _u16(raw, off)
+    sender = raw[off + 2:off + 2 + n].decode()
+    off += 2 + n
+    (n,) = _u16(raw, off)
+    to = raw[off + 2:off + 2 + n].decode() if flags & _F_TO else None
+    off += 2 + n
+    (n,) = _u16(raw, off)
+    mtype = raw[off + 2:off + 2 + n].decode()
+    off += 2 + n
+    (n,) = _u16(raw, off)
+    conv = raw[off + 2:off + 2 + n].decode() if flags & _F_CONV else None
+    off += 2 + n
+    (n,) = _u16(raw, off)
+    sig = raw[off + 2:off + 2 + n].decode() if flags & _F_SIG else None
+    off += 2 + n
+    (n,) = _u32(raw, off)
+    headers = json.loads(raw[off + 4:off + 4 + n]) if n else None
+    off += 4 + n
+    (n,) = _u32(raw, off)
+    body = raw[off + 4:off + 4 + n].decode()
+    return Message(sender, to, mtype, body, ts, conv, bool(flags & _F_USER),
+                   bool(flags & _F_ENC), sig, headers)
+
+
+def _encode_msgpack(m: Message) -> bytes:
+    return msgpack.packb((m.sender, m.to, m.type, m.body, m.ts, m.conversation_id,
+                          m.user_initiated, m.encrypted, m.hmac_sig, m.headers))
+
+
+def _decode_msgpack(raw: bytes) -> Message:
+    return Message(*msgpack.unpackb(raw))
+
+
+def encode(msg: Message, codec: str = "json") -> Union[str, bytes]:
+    if codec == "json":
+        return _json_compact(msg.to_dict())
+    if codec == "binary":
+        return _encode_binary(msg)
+    if codec == "msgpack":
+        return _encode_msgpack(msg)
+    raise ValueError(f"unknown message codec {codec!r}")
+
+
+def decode(raw: Union[str, bytes], codec: str = "json") -> Message:
+    if codec == "json":
+        return Message.from_dict(json.loads(raw))
+    if codec == "binary":
+        return _decode_binary(raw)
+    if codec == "msgpack":
+        return _decode_msgpack(raw)
+    raise ValueError(f"unknown message codec {codec!r}")
@@ -1,11 +1,17 @@
-import os
-import json
+import asyncio
 import base64
 import hashlib
-from typing import List, Optional
-from Crypto.Cipher import AES
-from Crypto.Random import get_random_bytes
-from datetime import datetime
+import inspect
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+from common.lazy import lazy_import
+from common.message import Message
+from common.transport import FileTransport, maybe_await
+
+AES = lazy_import("Crypto.Cipher.AES")
+_random = lazy_import("Crypto.Random")
 
 INBOX_DIR = "inbox"
 
@@ -14,101 +20,223 @@ def _ensure_inbox():
     os.makedirs(INBOX_DIR, exist_ok=True)
 
 
-def _get_inbox_path(assistant_name: str) -> str:
-    return os.path.join(INBOX_DIR, f"{assistant_name}.json")
+_aad_json = json.JSONEncoder(separators=(",", ":"), sort_keys=True).encode
 
 
-class Messenger:
-    def __init__(self, self_name: str, shared_key: str):
-        _ensure_inbox()
-        self.self_name = self_name
-        self.shared_key = hashlib.sha256(shared_key.encode()).digest()
+def envelope_aad(msg: Message, recipient: bool = True) -> bytes:
+    """
+    The cleartext envelope fields a receiver acts on (routing, type,
+    delivery headers like seq / epoch / upto), bound into the GCM tag as
+    associated data so they can't be edited or moved onto another body.
+    ``recipient=False`` leaves out ``to``, for one ciphertext sent to many.
+    """
+    return _aad_json([msg.sender, msg.to if recipient else None, msg.type, msg.conversation_id,
+                      bool(msg.user_initiated), msg.headers or None]).encode()
 
-    def _encrypt(self, plaintext: str) -> str:
-        nonce = get_random_bytes(12)
-        cipher = AES.new(self.shared_key, AES.MODE_GCM, nonce=nonce)
-        ciphertext, tag = cipher.encrypt_and_digest(plaintext.encode())
-        payload = base64.b64encode(nonce + tag + ciphertext).decode()
-        return payload
 
-    def _decrypt(self, payload: str) -> Optional[str]:
-        try:
-            raw = base64.b64decode(payload.encode())
-            nonce, tag, ciphertext = raw[:12], raw[12:28], raw[28:]
-            cipher = AES.new(self.shared_key, AES.MODE_GCM, nonce=nonce)
-            plaintext = cipher.decrypt_and_verify(ciphertext, tag)
-            return plaintext.decode()
-        except Exception as e:
-            print(f"[{self.self_name}] 🔐 Failed to decrypt message: {e}")
-            return None
+def encrypt_payload(key: bytes, plaintext: str, aad: Optional[bytes] = None) -> str:
+    """AES‑GCM, base64(nonce | tag | ciphertext); *aad* is authenticated, not sent."""
+    nonce = _random.get_random_bytes(12)
+    cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
+    if aad is not None:
+        cipher.update(aad)
+    ciphertext, tag = cipher.encrypt_and_digest(plaintext.encode())
+    return base64.b64encode(nonce + tag + ciphertext).decode()
 
-    def send_message(self, to: str, message: str, msg_type: str = "user",
-                     conversation_id: Optional[str] = None, user_initiated: bool = False):
-        inbox_path = _get_inbox_path(to)
-        entry = {
-            "from": self.self_name,
-            "to": to,
-            "type": msg_type,
-            "encrypted": self._encrypt(message),
-            "timestamp": datetime.utcnow().isoformat(),
-            "conversation_id": conversation_id,
-            "user_initiated": user_initiated
-        }
 
-        try:
-            if os.path.exists(inbox_path):
-                with open(inbox_path, "r") as f:
-                    messages = json.load(f)
-            else:
-                messages = []
+def decrypt_payload(key: bytes, payload: str, aad: Optional[bytes] = None) -> str:
+    """Inverse of encrypt_payload(); raises on a bad tag (or *aad*) or malformed input."""
+    raw = base64.b64decode(payload.encode())
+    nonce, tag, ciphertext = raw[:12], raw[12:28], raw[28:]
+    cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
+    if aad is not None:
+        cipher.update(aad)
+    return cipher.decrypt_and_verify(ciphertext, tag).decode()
 
-            messages.append(entry)
 
-            with open(inbox_path, "w") as f:
-                json.dump(messages, f, indent=2)
-        except Exception as e:
-            print(f"[{self.self_name}] ❌ Failed to write to inbox: {e}")
+class Messenger:
+    """
+    End‑to‑end AES‑GCM on top of a transport.  Defaults to the shared
+    ``inbox/`` directory; the assistants hand it their CombinedTransport
+    (WebRTC with the inbox as fallback) once the link is up.
+
+    ``capture`` (a common.replay.Recorder) records plaintext: "out" before
+    encryption, "in" after decryption.
 
-    def receive_messages(self) -> List[dict]:
-        inbox_path = _get_inbox_path(self.self_name)
-        messages = []
+    ``peers`` holds everyone we have written to or heard from with a valid
+    tag; admission only sends ``busy`` notices to them.
+    """
 
-        if not os.path.exists(inbox_path):
-            return []
+    MAX_BATCH = 256     # messages taken per areceive_raw() from a one‑at‑a‑time transport
 
+    def __init__(self, self_name: str, shared_key: str, groups=None, admission=None,
+                 transport=None, capture=None):
+        if transport is None:
+            _ensure_inbox()
+            transport = FileTransport(INBOX_DIR)
+        self.self_name = self_name
+        self.shared_key = hashlib.sha256(shared_key.encode()).digest()
+        self.transport = transport      # any BaseTransport, sync or async
+        self.groups = groups            # optional common.groups.GroupManager
+        self.admission = admission      # optional common.admission.AdmissionController
+        self.capture = capture          # optional common.replay.Recorder
+        self.peers: set = set()
+        if admission is not None and admission.notify is None:
+            admission.notify = lambda peer, body: self.send_notice(peer, body)
+        if admission is not None and admission.reachable is None:
+            admission.reachable = self.peers.__contains__
+
+    def _encrypt(self, plaintext: str, aad: Optional[bytes] = None) -> str:
+        return encrypt_payload(self.shared_key, plaintext, aad)
+
+    def _decrypt(self, payload: str, aad: Optional[bytes] = None) -> Optional[str]:
         try:
-            with open(inbox_path, "r") as f:
-                content = f.read()
-                if not content.strip():  # ⛑ protect against empty file
-                    return []
-                all_messages = json.loads(content)
+            return decrypt_payload(self.shared_key, payload, aad)
         except Exception as e:
-            print(f"[{self.self_name}] ❌ Failed to read inbox: {e}")
-            return []
-
-        processed = []
-        remaining = []
-
-        for msg in all_messages:
-            if msg["to"] != self.self_name:
-                remaining.append(msg)
-                continue
-            if msg["from"] == self.self_name:
-                continue  # Skip messages sent by self (paranoia check)
-            decrypted = self._decrypt(msg["encrypted"])
-            if decrypted is not None:
-                msg["plaintext"] = decrypted
-                messages.append(msg)
-
-        # write back only remaining unprocessed messages
-        with open(inbox_path, "w") as f:
-            json.dump(remaining, f, indent=2)
-
-        # Remove processed messages
+            print(f"[{self.self_name}] 🔐 Failed to decrypt message: {e}")
+            return None
+
+    # ── send ───────────────────────────────────────────────────────────────────
+    def send_message(self, to: str, message: str, msg_type: str = "user",
+                     conversation_id: Optional[str] = None, user_initiated: bool = False,
+                     hmac_sig: Optional[str] = None,
+                     headers: Optional[Dict[str, Any]] = None,
+                     sender: Optional[str] = None, **_):
+        """
+        Encrypt and hand to the transport.  Returns whatever the transport
+        returns (a coroutine for async ones) and lets its errors propagate,
+        so common.delivery can keep the message queued for replay.  The
+        signature mirrors BaseTransport.send_message, so a Messenger can be
+        the transport of a ReliableChannel.  The envelope (including
+        ``headers``) is authenticated with the body, see envelope_aad().
+        """
+        msg = Message(self.self_name, to, msg_type, message, conversation_id=conversation_id,
+                      user_initiated=user_initiated, hmac_sig=hmac_sig, headers=headers)
+        if self.capture is not None:
+            self.capture.record("out", msg)
+        self.peers.add(to)
+        return self.transport.send_message(
+            to=to, sender=self.self_name, message=self._encrypt(message, envelope_aad(msg)),
+            msg_type=msg_type, conversation_id=conversation_id,
+            user_initiated=user_initiated, hmac_sig=hmac_sig, headers=headers,
+            encrypted=True)
+
+    def send_notice(self, to: str, body: str, msg_type: str = "busy"):
+        """
+        Fire‑and‑forget control notice (admission ``busy``).  Encrypted like
+        everything else, so a peer can't be fooled by a forged one.
+        """
         try:
-            with open(inbox_path, "w") as f:
-                json.dump(remaining, f, indent=2)
+            result = self.send_message(to, body, msg_type=msg_type)
+            if inspect.isawaitable(result):
+                try:
+                    asyncio.ensure_future(result)
+                except RuntimeError:        # no running loop in this thread
+                    result.close()
+                    raise
         except Exception as e:
-            print(f"[{self.self_name}] ❌ Failed to update inbox: {e}")
-
-        return messages
+            print(f"[{self.self_name}] ❌ Failed to send notice: {e}")
+
+    def send_group(self, group: str, message: str, msg_type: str = "user",
+                   conversation_id: Optional[str] = None) -> int:
+        """Encrypt once with the group key, write every member's inbox once."""
+        sends = self.groups.seal(group, message, msg_type, conversation_id)
+        if self.capture is not None:
+            for entry in sends:
+                self.capture.record("out", Message(entry.sender, entry.to, msg_type, message,
+                                                   conversation_id=conversation_id,
+                                                   headers=entry.headers))
+        try:
+            if hasattr(self.transport, "deliver_many"):
+                self.transport.deliver_many(sends)
+            else:
+                for entry in sends:
+                    result = self.transport.send_message(
+                        to=entry.to, sender=entry.sender, message=entry.body,
+                        msg_type=entry.type, conversation_id=entry.conversation_id,
+                        headers=entry.headers, encrypted=True)
+                    if inspect.isawaitable(result):
+                        asyncio.ensure_future(result)
+        except Exception as e:
+            print(f"[{self.self_name}] ❌ Failed to send group message: {e}")
+            return 0
+        return len(sends)
+
+    # ── receive ────────────────────────────────────────────────────────────────
+    def open(self, msg: Message) -> Optional[Message]:
+        """Decrypt one raw message; None if it was consumed or can't be opened."""
+        opened = self._open(msg)
+        if opened is not None:
+            self.record_opened([opened])
+        return opened
+
+    def record_opened(self, msgs: List[Message]) -> None:
+        """
+        Bookkeeping for opened messages – known peers and capture.  open()
+        does it itself; call it for messages opened elsewhere
+        (common.sharding.ShardedProcessor).
+        """
+        for msg in msgs:
+            self.peers.add(msg.sender)
+            if self.capture is not None:
+                self.capture.record("in", msg)
+
+    def _open(self, msg: Message) -> Optional[Message]:
+        if not msg.encrypted:           # nothing is trusted without authentication
+            print(f"[{self.self_name}] 🚨 Dropped unencrypted {msg.type!r} message from {msg.sender}")
+            return None
+        if self.groups is not None and self.groups.is_group_message(msg):
+            opened = self.groups.open(msg)
+        else:
+            decrypted = self._decrypt(msg.body, envelope_aad(msg))
+            if decrypted is None:
+                return None
+            msg.body, msg.encrypted = decrypted, False
+            opened = msg
+        return opened
+
+    def open_all(self, msgs: List[Message]) -> List[Message]:
+        return [m for m in map(self.open, msgs) if m is not None]
+
+    def receive_messages(self) -> List[Message]:
+        return self.open_all(self.receive_raw())
+
+    async def areceive_messages(self) -> List[Message]:
+        return self.open_all(await self.areceive_raw())
+
+    def receive_raw(self) -> List[Message]:
+        """
+        Take this assistant's messages off a sync transport *without*
+        decrypting them, e.g. to hand the crypto to
+        common.sharding.ShardedProcessor.
+        """
+        take = getattr(self.transport, "receive_many", None)
+        if take is not None:
+            msgs = take(self.self_name)
+        else:
+            msgs = []
+            while len(msgs) < self.MAX_BATCH:
+                msg = self.transport.receive_messages(self.self_name)
+                if not msg:
+                    break
+                msgs.append(msg)
+        return self._admit(msgs)
+
+    async def areceive_raw(self) -> List[Message]:
+        """receive_raw() for async transports (CombinedTransport, WebRTC)."""
+        take = getattr(self.transport, "receive_many", None)
+        if take is not None:
+            return self._admit(take(self.self_name))
+        msgs: List[Message] = []
+        while len(msgs) < self.MAX_BATCH:
+            msg = await maybe_await(self.transport.receive_messages(self.self_name))
+            if not msg:
+                break
+            msgs.append(msg)
+        return self._admit(msgs)
+
+    def _admit(self, msgs: List[Message]) -> List[Message]:
+        # rate limits / load shedding on the cleartext envelope, before any crypto
+        if self.admission is not None:
+            return self.admission.filter(msgs)
+        return [m for m in msgs if m.sender != self.self_name]   # paranoia check
@@ -0,0 +1,176 @@
+# common/priority.py
+"""
+Priority lanes for inbound messages.
+
+Handshakes, acks and other control traffic go to the ``control`` lane,
+human‑typed messages to ``interactive`` and LLM replies to ``bulk``.
+Lanes are served by weighted round‑robin.  A lane whose oldest message
+has waited longer than ``max_wait`` gets one extra turn per round, but
+never ahead of waiting control traffic – bulk can be slowed down but
+never starved, and a bulk backlog can't delay acks.
+
+PriorityInbox       – thread‑safe, used by the synchronous dispatcher
+AsyncPriorityQueue  – asyncio.Queue‑compatible, used by WebRTCTransport
+"""
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from common.message import Message
+
+CONTROL, INTERACTIVE, BULK = "control", "interactive", "bulk"
+LANES = (CONTROL, INTERACTIVE, BULK)
+
+CONTROL_TYPES = frozenset({"handshake", "ack", "control", "busy", "group_key", "ping", "pong"})
+
+DEFAULT_WEIGHTS = {CONTROL: 8, INTERACTIVE: 3, BULK: 1}
+DEFAULT_MAX_WAIT_S = 2.0
+
+
+def lane_for(msg_type: Optional[str], user_initiated: bool = False) -> str:
+    if msg_type in CONTROL_TYPES:
+        return CONTROL
+    if msg_type == "user" or user_initiated:
+        return INTERACTIVE
+    return BULK
+
+
+# ───────────────────────────────── SCHEDULER ──────────────────────────────────
+class LaneScheduler:
+    """Weighted round‑robin over per‑lane deques with starvation protection."""
+
+    def __init__(self, weights: Optional[Dict[str, int]] = None,
+                 max_wait: float = DEFAULT_MAX_WAIT_S) -> None:
+        self.weights = dict(DEFAULT_WEIGHTS if weights is None else weights)
+        self.max_wait = max_wait
+        self._lanes: Dict[str, Deque[Tuple[float, Any]]] = {lane: deque() for lane in self.weights}
+        self._credit: Dict[str, int] = dict(self.weights)
+        self._promoted: set = set()        # lanes that already jumped the queue this round
+        self._metrics: Dict[str, Dict[str, float]] = {
+            lane: {"enqueued": 0, "dequeued": 0, "promoted": 0, "max_wait_ms": 0.0}
+            for lane in self.weights
+        }
+
+    def __len__(self) -> int:
+        return sum(len(q) for q in self._lanes.values())
+
+    def push(self, item: Any, lane: str) -> None:
+        if lane not in self._lanes:
+            lane = BULK
+        self._lanes[lane].append((time.monotonic(), item))
+        self._metrics[lane]["enqueued"] += 1
+
+    def pop(self) -> Optional[Any]:
+        if not len(self):
+            return None
+        now = time.monotonic()
+
+        # starvation guard: one extra turn per round for an over‑due lane,
+        # and only while no control traffic is waiting
+        if not self._lanes.get(CONTROL):
+            overdue = [(q[0][0], lane) for lane, q in self._lanes.items()
+                       if q and lane not in self._promoted and now - q[0][0] > self.max_wait]
+            if overdue:
+                _, lane = min(overdue)
+                self._promoted.add(lane)
+                self._metrics[lane]["promoted"] += 1
+                return self._take(lane, now)
+
+        # weighted round‑robin: highest‑priority non‑empty lane with credit left
+        for _ in range(2):
+            for lane, q in self._lanes.items():
+                if q and self._credit[lane] > 0:
+                    self._credit[lane] -= 1
+                    return self._take(lane, now)
+            self._credit = dict(self.weights)   # everyone spent – new round
+            self._promoted.clear()
+        return None
+
+    def _take(self, lane: str, now: float) -> Any:
+        ts, item = self._lanes[lane].popleft()
+        m = self._metrics[lane]
+        m["dequeued"] += 1
+        m["max_wait_ms"] = max(m["max_wait_ms"], (now - ts) * 1000)
+        return item
+
+    def depths(self) -> Dict[str, int]:
+        return {lane: len(q) for lane, q in self._lanes.items()}
+
+    def metrics(self) -> Dict[str, Dict[str, float]]:
+        return {lane: dict(m, depth=len(self._lanes[lane])) for lane, m in self._metrics.items()}
+
+
+# ──────────────────────────────── SYNC INBOX ──────────────────────────────────
+class PriorityInbox:
+    def __init__(self, weights: Optional[Dict[str, int]] = None,
+                 max_wait: float = DEFAULT_MAX_WAIT_S) -> None:
+        self._sched = LaneScheduler(weights, max_wait)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._sched)
+
+    def push(self, msg: Message) -> None:
+        with self._lock:
+            self._sched.push(msg, lane_for(msg.type, msg.user_initiated))
+
+    def pop(self) -> Optional[Message]:
+        with self._lock:
+            return self._sched.pop()
+
+    def depths(self) -> Dict[str, int]:
+        with self._lock:
+            return self._sched.depths()
+
+    def metrics(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return self._sched.metrics()
+
+
+# ──────────────────────────────── ASYNC QUEUE ─────────────────────────────────
+class AsyncPriorityQueue:
+    """Drop‑in for ``asyncio.Queue`` (put / put_nowait / get / get_nowait)."""
+
+    def __init__(self, weights: Optional[Dict[str, int]] = None,
+                 max_wait: float = DEFAULT_MAX_WAIT_S) -> None:
+        self._sched = LaneScheduler(weights, max_wait)
+        self._not_empty = asyncio.Event()
+
+    def qsize(self) -> int:
+        return len(self._sched)
+
+    def empty(self) -> bool:
+        return not len(self._sched)
+
+    def put_nowait(self, msg: Message) -> None:
+        self._sched.push(msg, lane_for(msg.type, msg.user_initiated))
+        self._not_empty.set()
+
+    async def put(self, msg: Message) -> None:
+        self.put_nowait(msg)
+
+    def get_nowait(self) -> Message:
+        item = self._sched.pop()
+        if item is None:
+            raise asyncio.QueueEmpty
+        if not len(self._sched):
+            self._not_empty.clear()
+        return item
+
+    async def get(self) -> Message:
+        while True:
+            try:
+                return self.get_nowait()
+            except asyncio.QueueEmpty:
+                await self._not_empty.wait()
+
+    def depths(self) -> Dict[str, int]:
+        return self._sched.depths()
+
+    def metrics(self) -> Dict[str, Dict[str, float]]:
+        return self._sched.metrics()
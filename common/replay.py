@@ -0,0 +1,440 @@
+# common/replay.py
+"""
+Traffic capture and deterministic replay.
+
+Capture – append every message to a recording (jsonl, one
+``{"t": ns, "dir": "in"|"out", "msg": {...}}`` per line).  The assistants
+record plaintext at the Messenger (``PEERAI_CAPTURE``):
+
+    messenger = Messenger(NAME, SECRET_KEY, capture=Recorder("captures/run1.jsonl"))
+
+or wrap a bare transport (whatever bodies it carries get recorded):
+
+    transport = CaptureTransport(transport, "captures/run1.jsonl")
+
+or turn the log FileTransport already writes into a recording – its
+bodies are ciphertext, so they are opened with the shared key
+(``--key``, default ``$SECRET_KEY``) through Messenger.open on import:
+
+    python -m common.replay import inbox/logs/assistant_a.pza -o run1.jsonl
+
+Replay – re‑encrypt the recorded inbound traffic as its original senders
+and feed it through the assistants' receive path (common/inbound.py:
+Messenger with admission, AES‑GCM, optional sharding, priority lanes,
+ReliableChannel dedupe/acks) into a handler with the intent router and a
+stub LLM, at recorded speed, N× or flat out, and print a per‑stage
+latency profile:
+
+    python -m common.replay run run1.jsonl --speed 10 --transport file
+    python -m common.replay run run1.jsonl --speed 0 --shards 4
+    python -m common.replay run run1.jsonl --speed 0 --cprofile run1.pstats
+    py-spy record -o run1.svg -- python -m common.replay run run1.jsonl --speed 0
+
+Stages: ``send`` (peer encrypts and writes), ``receive`` (poll, admission,
+decrypt, lanes), ``route`` (intent router), ``llm`` (stub or real model),
+``reply`` (ReliableChannel.send of the answer), ``total``.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import cProfile
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Union
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from common.message import Message
+from common.priority import CONTROL, lane_for
+from common.transport import BaseTransport, FileTransport, maybe_await
+
+REPLAY_SELF = "replay_target"
+REPLAY_KEY = "replay"       # re‑encryption key when no shared key is given
+
+
+# ───────────────────────────────── CAPTURE ────────────────────────────────────
+class Recorder:
+    """Appends recording lines; shared by Messenger(capture=…) and CaptureTransport."""
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._fh = self.path.open("a")
+        self._lock = threading.Lock()
+
+    def record(self, direction: str, msg: Message) -> None:
+        line = json.dumps({"t": time.time_ns(), "dir": direction, "msg": msg.to_dict()},
+                          separators=(",", ":")) + "\n"
+        with self._lock:
+            self._fh.write(line)
+            self._fh.flush()
+
+    def close(self) -> None:
+        self._fh.close()
+
+
+class CaptureTransport(BaseTransport):
+    """Transparent wrapper that records traffic flowing through *inner*."""
+
+    def __init__(self, inner: BaseTransport, path: Union[str, Path]) -> None:
+        self.inner = inner
+        self.recorder = Recorder(path)
+        self.path = self.recorder.path
+
+    def _record(self, direction: str, msg: Message) -> None:
+        self.recorder.record(direction, msg)
+
+    async def send_message(self, to: str, sender: str, message: str, msg_type: str = "user",
+                           conversation_id: Optional[str] = None,
+                           user_initiated: bool = False,
+                           hmac_sig: Optional[str] = None,
+                           headers: Optional[Dict[str, Any]] = None,
+                           encrypted: bool = False):
+        self._record("out", Message(sender, to, msg_type, message, conversation_id=conversation_id,
+                                    user_initiated=user_initiated, encrypted=encrypted,
+                                    hmac_sig=hmac_sig, headers=headers))
+        return await maybe_await(self.inner.send_message(
+            to=to, sender=sender, message=message, msg_type=msg_type,
+            conversation_id=conversation_id, user_initiated=user_initiated,
+            hmac_sig=hmac_sig, headers=headers, encrypted=encrypted))
+
+    async def receive_messages(self, recipient: str) -> Optional[Message]:
+        msg = await maybe_await(self.inner.receive_messages(recipient))
+        if msg is not None:
+            self._record("in", msg)
+        return msg
+
+    def peek_messages(self, recipient: str):
+        return self.inner.peek_messages(recipient)
+
+    def clear_inbox(self, recipient: str):
+        return self.inner.clear_inbox(recipient)
+
+    def archive_inbox(self, recipient: str):
+        return self.inner.archive_inbox(recipient)
+
+    def close(self) -> None:
+        self.recorder.close()
+
+
+# ───────────────────────────────── RECORDINGS ─────────────────────────────────
+class Record:
+    __slots__ = ("t", "direction", "msg")
+
+    def __init__(self, t: int, direction: str, msg: Message) -> None:
+        self.t = t
+        self.direction = direction
+        self.msg = msg
+
+
+def load_recording(path: Union[str, Path], shared_key: Optional[str] = None) -> List[Record]:
+    """
+    Read a recording.  .pza archives (FileTransport's logs) and bare
+    message lines (older logs/*.jsonl) are accepted too and treated as
+    inbound, timed by their timestamp.  Encrypted bodies are opened with
+    *shared_key* through Messenger.open; ones that don't open are dropped.
+    Without a key they stay ciphertext.
+    """
+    if Path(path).suffix == ".pza":
+        from common.archive import ArchiveReader
+        records = sorted((Record(m.ts, "in", m) for m in ArchiveReader(path)),
+                         key=lambda r: r.t)
+        return _open_records(records, shared_key)
+
+    records = []
+    with Path(path).open() as fh:
+        for line in fh:
+            line = line.strip()
+            if not line:
+                continue
+            raw = json.loads(line)
+            if "dir" in raw and "msg" in raw:
+                records.append(Record(raw["t"], raw["dir"], Message.from_dict(raw["msg"])))
+            else:
+                msg = Message.from_dict(raw)
+                records.append(Record(msg.ts, "in", msg))
+    records.sort(key=lambda r: r.t)
+    return _open_records(records, shared_key)
+
+
+def _open_records(records: List[Record], shared_key: Optional[str]) -> List[Record]:
+    if shared_key is None or not any(r.msg.encrypted for r in records):
+        return records
+    from common.messenger import Messenger
+
+    messenger = Messenger(REPLAY_SELF, shared_key, transport=MemoryTransport())
+    opened = [r for r in records if not r.msg.encrypted or messenger.open(r.msg) is not None]
+    if len(opened) < len(records):
+        print(f"⚠️ {len(records) - len(opened)} of {len(records)} records could not be opened")
+    return opened
+
+
+def write_recording(records: List[Record], path: Union[str, Path]) -> None:
+    with Path(path).open("w") as fh:
+        for r in records:
+            fh.write(json.dumps({"t": r.t, "dir": r.direction, "msg": r.msg.to_dict()},
+                                separators=(",", ":")) + "\n")
+
+
+# ───────────────────────────────── PROFILE ────────────────────────────────────
+class StageProfile:
+    def __init__(self) -> None:
+        self.samples: Dict[str, List[float]] = {}
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.samples.setdefault(stage, []).append(seconds)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        out = {}
+        for stage, xs in self.samples.items():
+            xs = sorted(xs)
+            pick = lambda q: xs[min(len(xs) - 1, int(q * len(xs)))] * 1000
+            out[stage] = {
+                "count": len(xs),
+                "mean_ms": statistics.fmean(xs) * 1000,
+                "p50_ms": pick(0.50),
+                "p95_ms": pick(0.95),
+                "p99_ms": pick(0.99),
+                "max_ms": xs[-1] * 1000,
+            }
+        return out
+
+    def print(self, wall: float, replayed: int) -> None:
+        print(f"\nreplayed {replayed} messages in {wall:.3f}s "
+              f"({replayed / wall if wall else 0:.0f} msg/s)")
+        print(f"{'stage':<10}{'count':>8}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}  (ms)")
+        for stage, s in self.summary().items():
+            print(f"{stage:<10}{s['count']:>8}{s['mean_ms']:>10.3f}{s['p50_ms']:>10.3f}"
+                  f"{s['p95_ms']:>10.3f}{s['p99_ms']:>10.3f}{s['max_ms']:>10.3f}")
+
+
+# ───────────────────────────────── TRANSPORTS ─────────────────────────────────
+class MemoryTransport(BaseTransport):
+    """In‑process transport: isolates dispatch cost from any I/O."""
+
+    def __init__(self) -> None:
+        self._boxes: Dict[str, Deque[Message]] = {}
+
+    def send_message(self, to: str, sender: str, message: str, msg_type: str = "user",
+                     conversation_id: Optional[str] = None,
+                     user_initiated: bool = False,
+                     hmac_sig: Optional[str] = None,
+                     headers: Optional[Dict[str, Any]] = None,
+                     encrypted: bool = False):
+        self._boxes.setdefault(to, deque()).append(
+            Message(sender, to, msg_type, message, conversation_id=conversation_id,
+                    user_initiated=user_initiated, encrypted=encrypted,
+                    hmac_sig=hmac_sig, headers=headers))
+
+    def receive_messages(self, recipient: str) -> Optional[Message]:
+        box = self._boxes.get(recipient)
+        return box.popleft() if box else None
+
+    def peek_messages(self, recipient: str):
+        return [m.to_dict() for m in self._boxes.get(recipient, ())] or None
+
+    def clear_inbox(self, recipient: str):
+        self._boxes.pop(recipient, None)
+
+    def archive_inbox(self, recipient: str):
+        self.clear_inbox(recipient)
+
+
+def make_transport(kind: str) -> BaseTransport:
+    if kind == "memory":
+        return MemoryTransport()
+    if kind == "file":
+        return FileTransport(tempfile.mkdtemp(prefix="peerai-replay-"))
+    raise ValueError(f"unknown replay transport {kind!r} (expected 'memory' or 'file')")
+
+
+def stub_llm(latency_s: float) -> Callable[[str], str]:
+    def generate(prompt: str) -> str:
+        if latency_s:
+            time.sleep(latency_s)
+        return f"stub reply to: {prompt[:40]}"
+    return generate
+
+
+# ───────────────────────────────── REPLAY ─────────────────────────────────────
+def _inbound(records: List[Record]) -> Iterator[Record]:
+    # acks / busy belonged to the recorded session's outbox, not to this one
+    return (r for r in records if r.direction == "in" and lane_for(r.msg.type) != CONTROL
+            and not r.msg.encrypted and r.msg.body.strip())
+
+
+async def _drain(transport: BaseTransport, name: str) -> None:
+    while await maybe_await(transport.receive_messages(name)) is not None:
+        pass
+
+
+async def replay(records: List[Record], transport: BaseTransport,
+                 llm: Callable[[str], str], speed: float = 1.0,
+                 shared_key: str = REPLAY_KEY, processor=None) -> StageProfile:
+    """
+    Re‑deliver every inbound record through the receive path the
+    assistants run.  ``speed`` scales the recorded gaps: 1 = real time,
+    10 = ten times faster, 0 = no waiting at all.  Records are replayed one
+    at a time, each until its handler is done.
+    """
+    from common.admission import DEFAULT_RATE, AdmissionController
+    from common.delivery import ReliableChannel
+    from common.inbound import InboundPipeline
+    from common.messenger import Messenger
+    from utils.nlp import router
+
+    profile = StageProfile()
+    inbound = list(_inbound(records))
+    if not inbound:
+        return profile
+
+    loop = asyncio.get_running_loop()
+    state_dir = tempfile.mkdtemp(prefix="peerai-replay-state-")
+    # per‑peer rate limits scaled with the replay speed, so admission decides as it did live
+    rate = DEFAULT_RATE * speed if speed > 0 else 1e9
+    target = Messenger(REPLAY_SELF, shared_key, transport=transport,
+                       admission=AdmissionController(REPLAY_SELF, rate=rate))
+    channel = ReliableChannel(target, REPLAY_SELF, state_dir=state_dir)
+    peers: Dict[str, Messenger] = {}
+
+    async def handle(msg: Message) -> None:
+        if not msg.user_initiated:
+            return
+        t1 = time.perf_counter()
+        hit = router.route(msg.body, assistant_name=REPLAY_SELF)
+        t2 = time.perf_counter()
+        profile.add("route", t2 - t1)
+        if hit is not None:
+            response = hit.response
+        else:
+            response = await loop.run_in_executor(None, llm, msg.body)
+            t2 = time.perf_counter()
+            profile.add("llm", t2 - t1)
+        await channel.send(msg.sender, response, user_initiated=False)
+        profile.add("reply", time.perf_counter() - t2)
+
+    pipeline = InboundPipeline(target, channel, handle, processor, poll_s=0)
+    pipeline.start_workers()
+    try:
+        origin_rec = inbound[0].t
+        origin_wall = time.perf_counter()
+        for rec in inbound:
+            if speed > 0:
+                due = origin_wall + (rec.t - origin_rec) / 1e9 / speed
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+            m = rec.msg
+            peer = peers.get(m.sender)
+            if peer is None:
+                peer = peers[m.sender] = Messenger(m.sender, shared_key, transport=transport)
+            target.peers.add(m.sender)
+            t0 = time.perf_counter()
+            # recorded seq / epoch headers go along, so ReliableChannel dedupes as it did live
+            await maybe_await(peer.send_message(
+                REPLAY_SELF, m.body, msg_type=m.type, conversation_id=m.conversation_id,
+                user_initiated=m.user_initiated, hmac_sig=m.hmac_sig, headers=m.headers))
+            t1 = time.perf_counter()
+            profile.add("send", t1 - t0)
+            await pipeline.poll()
+            profile.add("receive", time.perf_counter() - t1)
+            while not pipeline.idle():
+                await asyncio.sleep(0.0005)
+            profile.add("total", time.perf_counter() - t0)
+            await _drain(transport, m.sender)           # replies and acks
+    finally:
+        pipeline.stop()
+        await channel.flush_acks()
+        channel.close()
+        for name in peers:
+            await _drain(transport, name)
+    return profile
+
+
+# ───────────────────────────────── CLI ────────────────────────────────────────
+def _cmd_import(args) -> None:
+    records = []
+    for path in args.logs:
+        records += load_recording(path, args.key)
+    records.sort(key=lambda r: r.t)
+    write_recording(records, args.output)
+    print(f"wrote {len(records)} records to {args.output}")
+
+
+def _cmd_run(args) -> None:
+    records = load_recording(args.recording, args.key)
+    transport = make_transport(args.transport)
+    processor = None
+    if args.shards:
+        from common.sharding import ShardedProcessor
+        processor = ShardedProcessor(args.shards, shared_key=args.key or REPLAY_KEY)
+    if args.llm == "real":
+        from common.agent import get_response_from_phi
+        llm = get_response_from_phi
+    else:
+        llm = stub_llm(args.llm_latency / 1000)
+
+    profiler = cProfile.Profile() if args.cprofile else None
+    t0 = time.perf_counter()
+    if profiler:
+        profiler.enable()
+    try:
+        profile = asyncio.run(replay(records, transport, llm, args.speed,
+                                     args.key or REPLAY_KEY, processor))
+    finally:
+        if processor is not None:
+            processor.close()
+    if profiler:
+        profiler.disable()
+        profiler.dump_stats(args.cprofile)
+    wall = time.perf_counter() - t0
+
+    replayed = len(profile.samples.get("total", []))
+    profile.print(wall, replayed)
+    if args.json:
+        Path(args.json).write_text(json.dumps({"wall_s": wall, "messages": replayed,
+                                               "stages": profile.summary()}, indent=2))
+    if args.cprofile:
+        print(f"cProfile stats written to {args.cprofile} (python -m pstats {args.cprofile})")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m common.replay")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    imp = sub.add_parser("import", help="turn FileTransport logs into a recording")
+    imp.add_argument("logs", nargs="+")
+    imp.add_argument("-o", "--output", required=True)
+    imp.add_argument("--key", default=os.getenv("SECRET_KEY"),
+                     help="shared key to open encrypted logs (default $SECRET_KEY)")
+    imp.set_defaults(func=_cmd_import)
+
+    run = sub.add_parser("run", help="replay a recording and profile each stage")
+    run.add_argument("recording")
+    run.add_argument("--speed", type=float, default=1.0, help="1 = real time, N = N× faster, 0 = max")
+    run.add_argument("--transport", choices=("memory", "file"), default="memory")
+    run.add_argument("--shards", type=int, default=0, help="decrypt on N worker processes")
+    run.add_argument("--key", default=os.getenv("SECRET_KEY"),
+                     help="shared key: opens encrypted records, re‑encrypts the replay")
+    run.add_argument("--llm", choices=("stub", "real"), default="stub")
+    run.add_argument("--llm-latency", type=float, default=0.0, metavar="MS",
+                     help="simulated stub LLM latency in milliseconds")
+    run.add_argument("--json", metavar="FILE", help="also write the profile as JSON")
+    run.add_argument("--cprofile", metavar="FILE", help="write cProfile stats (pstats format)")
+    run.set_defaults(func=_cmd_run)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+# common/sharding.py
+"""
+Multi‑core inbound processing with per‑conversation ordering.
+
+Decrypt, HMAC verification and parsing run in a pool of worker processes.
+Each shard is a *single‑worker* process pool, and messages are routed to a
+shard by consistent hashing on ``conversation_id`` (falling back to the
+sender), so everything in one conversation is handled by the same worker in
+arrival order while different conversations run in parallel.
+
+    proc = ShardedProcessor(shared_key=SECRET_KEY, hmac_key=SECRET_KEY.encode())
+    for msg in proc.process(messenger.receive_raw()):       # blocking API
+        ...
+    proc.submit_many(raws)                                   # asyncio API,
+                                                             # results → on_result
+
+Work is shipped to workers in per‑shard batches so the IPC overhead is paid
+once per poll, not once per message.  A worker that dies is replaced and its
+batch retried on the new process.
+
+With a ``shared_key`` only encrypted messages are accepted, exactly like
+Messenger.receive_messages().  Group traffic (common/groups.py) is opened in
+the parent by the ``groups`` manager, with no shard ordering; without a
+manager it is rejected.
+"""
+from __future__ import annotations
+
+import asyncio
+import bisect
+import hashlib
+import hmac
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from common.groups import GROUP_KEY_TYPE
+from common.message import Message
+
+VNODES = 64          # virtual nodes per shard on the hash ring
+MAX_RETRIES = 2      # resubmissions of one batch after a worker crash
+
+ResultCallback = Callable[[Message], Optional[Awaitable[None]]]
+
+
+# ───────────────────────────────── HASH RING ──────────────────────────────────
+class HashRing:
+    """Consistent hashing: adding a shard only moves ~1/N of the keys."""
+
+    def __init__(self, shards: int, vnodes: int = VNODES) -> None:
+        points = []
+        for shard in range(shards):
+            for v in range(vnodes):
+                points.append((self._hash(f"{shard}:{v}"), shard))
+        points.sort()
+        self._keys = [p for p, _ in points]
+        self._shards = [s for _, s in points]
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+    def shard_for(self, key: str) -> int:
+        i = bisect.bisect(self._keys, self._hash(key)) % len(self._keys)
+        return self._shards[i]
+
+
+def routing_key(msg: Message) -> str:
+    return msg.conversation_id or msg.sender
+
+
+# ───────────────────────────────── WORKER SIDE ────────────────────────────────
+def _process_batch(batch: List[Message], aes_key: Optional[bytes],
+                   hmac_key: Optional[bytes]) -> List[Tuple[Optional[Message], Optional[str]]]:
+    """Runs in a worker process.  Returns (message, None) or (None, reason)."""
+    from common.messenger import decrypt_payload, envelope_aad
+
+    out: List[Tuple[Optional[Message], Optional[str]]] = []
+    for msg in batch:
+        try:
+            if aes_key is not None:
+                if not msg.encrypted:
+                    out.append((None, f"unencrypted {msg.type!r} message from {msg.sender}"))
+                    continue
+                msg.body = decrypt_payload(aes_key, msg.body, envelope_aad(msg))
+                msg.encrypted = False
+            if msg.hmac_sig is not None and hmac_key is not None:
+                expected = hmac.new(hmac_key, msg.body.encode(), hashlib.sha256).hexdigest()
+                if not hmac.compare_digest(expected, msg.hmac_sig):
+                    out.append((None, f"HMAC mismatch from {msg.sender}"))
+                    continue
+            out.append((msg, None))
+        except Exception as e:
+            out.append((None, f"{type(e).__name__} from {msg.sender}: {e}"))
+    return out
+
+
+# ───────────────────────────────── PROCESSOR ──────────────────────────────────
+class ShardedProcessor:
+    def __init__(self, shards: Optional[int] = None, shared_key: Optional[str] = None,
+                 hmac_key: Optional[bytes] = None,
+                 on_result: Optional[ResultCallback] = None,
+                 admission=None, groups=None) -> None:
+        self.shards = shards or os.cpu_count() or 1
+        # same key derivation as Messenger
+        self.aes_key = hashlib.sha256(shared_key.encode()).digest() if shared_key else None
+        self.hmac_key = hmac_key
+        self.on_result = on_result
+        self.admission = admission      # optional common.admission.AdmissionController
+        self.groups = groups            # optional common.groups.GroupManager
+
+        self.ring = HashRing(self.shards)
+        self._pools: List[ProcessPoolExecutor] = [self._new_pool() for _ in range(self.shards)]
+        self._generation = [0] * self.shards
+        self.stats: Dict[str, int] = {"processed": 0, "rejected": 0, "restarts": 0}
+        self.per_shard = [0] * self.shards
+
+        # asyncio side: one ordered queue + consumer task per shard
+        self._queues: Optional[List[asyncio.Queue]] = None
+        self._consumers: List[asyncio.Task] = []
+        self._in_flight = 0             # submitted, not yet delivered (async API)
+
+    @staticmethod
+    def _new_pool() -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=1)
+
+    def _restart(self, shard: int, generation: int) -> None:
+        """Replace a dead worker once, however many batches noticed it."""
+        if self._generation[shard] != generation:
+            return
+        self._pools[shard].shutdown(wait=False)
+        self._pools[shard] = self._new_pool()
+        self._generation[shard] += 1
+        self.stats["restarts"] += 1
+        print(f"♻️  shard {shard} worker restarted")
+
+    def _open_groups(self, messages: Sequence[Message]) -> Tuple[List[Message], List[Message]]:
+        """
+        Split off group traffic and open it here: it is sealed with a group
+        key, which the workers don't have.  Returns (rest, opened).
+        """
+        rest: List[Message] = []
+        opened: List[Message] = []
+        for msg in messages:
+            if not (msg.type == GROUP_KEY_TYPE or (msg.headers and "group" in msg.headers)):
+                rest.append(msg)
+            elif self.groups is None:
+                self.stats["rejected"] += 1
+                print(f"🚨 group message from {msg.sender} but no GroupManager configured")
+            else:
+                msg = self.groups.open(msg)     # None for key updates and failures
+                if msg is not None:
+                    opened.append(msg)
+        self.stats["processed"] += len(opened)
+        return rest, opened
+
+    def _partition(self, messages: Sequence[Message]) -> Dict[int, List[Message]]:
+        batches: Dict[int, List[Message]] = {}
+        for msg in messages:
+            batches.setdefault(self.ring.shard_for(routing_key(msg)), []).append(msg)
+        return batches
+
+    def _submit(self, shard: int, batch: List[Message]) -> Tuple[Future, int]:
+        gen = self._generation[shard]
+        return self._pools[shard].submit(_process_batch, batch, self.aes_key, self.hmac_key), gen
+
+    def _collect(self, shard: int, results) -> List[Message]:
+        done = []
+        for msg, error in results:
+            if msg is None:
+                self.stats["rejected"] += 1
+                print(f"🚨 shard {shard}: {error}")
+            else:
+                done.append(msg)
+        self.stats["processed"] += len(done)
+        self.per_shard[shard] += len(done)
+        return done
+
+    # ── blocking API ───────────────────────────────────────────────────────────
+    def process(self, messages: Sequence[Message]) -> List[Message]:
+        """
+        Process one poll's worth of messages across all shards and return
+        them.  Order is preserved within every conversation; across
+        conversations results are grouped by shard.
+        """
+        if self.admission is not None:
+            messages = self.admission.filter(list(messages))
+        messages, out = self._open_groups(messages)
+        pending = {shard: (batch, *self._submit(shard, batch))
+                   for shard, batch in self._partition(messages).items()}
+        for shard, (batch, fut, gen) in pending.items():
+            for attempt in range(MAX_RETRIES + 1):
+                try:
+                    out.extend(self._collect(shard, fut.result()))
+                    break
+                except BrokenProcessPool:
+                    self._restart(shard, gen)
+                    if attempt == MAX_RETRIES:
+                        self.stats["rejected"] += len(batch)
+                        print(f"🚨 shard {shard}: dropped batch of {len(batch)} after repeated crashes")
+                        break
+                    fut, gen = self._submit(shard, batch)
+        return out
+
+    # ── asyncio API ────────────────────────────────────────────────────────────
+    def start(self) -> None:
+        """Spawn the per‑shard consumers on the running loop."""
+        if self._queues is not None:
+            return
+        self._queues = [asyncio.Queue() for _ in range(self.shards)]
+        self._consumers = [asyncio.ensure_future(self._consume(s)) for s in range(self.shards)]
+
+    def submit_many(self, messages: Sequence[Message]) -> None:
+        self.start()
+        if self.admission is not None:
+            messages = self.admission.filter(list(messages), pending=self._in_flight)
+        messages, opened = self._open_groups(messages)
+        for msg in opened:
+            if self.on_result is not None:
+                res = self.on_result(msg)
+                if asyncio.iscoroutine(res):
+                    asyncio.ensure_future(res)
+        self._in_flight += len(messages)
+        for shard, batch in self._partition(messages).items():
+            fut, gen = self._submit(shard, batch)
+            self._queues[shard].put_nowait((batch, asyncio.wrap_future(fut), gen))
+
+    def submit(self, msg: Message) -> None:
+        self.submit_many([msg])
+
+    async def _consume(self, shard: int) -> None:
+        queue = self._queues[shard]
+        while True:
+            batch, fut, gen = await queue.get()
+            for attempt in range(MAX_RETRIES + 1):
+                try:
+                    results = await fut
+                    break
+                except BrokenProcessPool:
+                    self._restart(shard, gen)
+                    if attempt == MAX_RETRIES:
+                        results = [(None, "worker crashed repeatedly")] * len(batch)
+                        break
+                    cfut, gen = self._submit(shard, batch)
+                    fut = asyncio.wrap_future(cfut)
+            self._in_flight -= len(batch)
+            for msg in self._collect(shard, results):
+                if self.on_result is not None:
+                    res = self.on_result(msg)
+                    if asyncio.iscoroutine(res):
+                        await res
+            queue.task_done()
+
+    async def drain(self) -> None:
+        """Wait until everything submitted so far has been delivered to on_result."""
+        if self._queues is not None:
+            await asyncio.gather(*(q.join() for q in self._queues))
+
+    def close(self) -> None:
+        for task in self._consumers:
+            task.cancel()
+        for pool in self._pools:
+            pool.shutdown(wait=False)
@@ -1,11 +1,23 @@
 # common/transport.py
+import atexit
+import inspect
 from abc import ABC, abstractmethod
 from pathlib import Path
-from datetime import datetime
-from typing import List, Optional, Union, Dict
+from typing import Any, List, Optional, Union, Dict
 import json
 import os
 
+from common.message import Message
+from common.priority import CONTROL, lane_for
+
+LOG_FLUSH_S = 30.0      # longest a delivered message sits in the log's frame buffer
+
+async def maybe_await(result: Any) -> Any:
+    """FileTransport is sync, WebRTCTransport is async – callers accept both."""
+    if inspect.isawaitable(result):
+        return await result
+    return result
+
 # ───────────────────────────────── ABSTRACT BASE ──────────────────────────────
 class BaseTransport(ABC):
     """Abstract base class for transport layers."""
@@ -14,11 +26,13 @@ class BaseTransport(ABC):
     def send_message(self, to: str, sender: str, message: str, msg_type: str = "user",
                      conversation_id: Optional[str] = None,
                      user_initiated: bool = False,
-                     hmac_sig: Optional[str] = None):
+                     hmac_sig: Optional[str] = None,
+                     headers: Optional[Dict[str, Any]] = None,
+                     encrypted: bool = False):
         ...
 
     @abstractmethod
-    def receive_messages(self, recipient: str) -> Optional[Dict[str, any]]:
+    def receive_messages(self, recipient: str) -> Optional[Message]:
         ...
 
     @abstractmethod
@@ -38,6 +52,10 @@ class FileTransport(BaseTransport):
     """
     Disk‑backed transport: each recipient has <inbox_dir>/<name>.json
     All assistants **must** point to the same inbox_dir.
+
+    Delivered messages are logged to <inbox_dir>/logs/<name>.pza through
+    one long‑lived streaming ArchiveWriter per recipient (common/archive.py):
+    a compressed frame every 256 messages or LOG_FLUSH_S seconds, and on exit.
     """
 
     def __init__(self, inbox_dir: Optional[Union[str, Path]] = None):
@@ -49,40 +67,72 @@ class FileTransport(BaseTransport):
 
         self.log_dir: Path = self.inbox_dir / "logs"
         self.log_dir.mkdir(exist_ok=True)
+        self._logs: Dict[str, Any] = {}            # recipient → ArchiveWriter
+        atexit.register(self.close_logs)
 
     # ── helpers ────────────────────────────────────────────────────────────────
     def _inbox_path(self, name: str) -> Path:
         return self.inbox_dir / f"{name}.json"
 
+    def _log(self, recipient: str):
+        writer = self._logs.get(recipient)
+        if writer is None:
+            from common.archive import ArchiveWriter
+            writer = self._logs[recipient] = ArchiveWriter(self.log_dir / f"{recipient}.pza")
+        return writer
+
+    def flush_logs(self, max_age: float = 0.0) -> None:
+        for writer in self._logs.values():
+            writer.flush_if_older(max_age)
+
+    def close_logs(self) -> None:
+        for writer in self._logs.values():
+            writer.close()
+        self._logs.clear()
+
     # ── send ───────────────────────────────────────────────────────────────────
     def send_message(self, to: str, sender: str, message: str, msg_type: str = "user",
                      conversation_id: Optional[str] = None,
                      user_initiated: bool = False,
-                     hmac_sig: Optional[str] = None):
-        path = self._inbox_path(to)
-        entry = {
-            "from": sender,
-            "message": message,
-            "timestamp": datetime.utcnow().isoformat(),
-            "type": msg_type,
-            "conversation_id": conversation_id,
-            "user_initiated": user_initiated,
-            "hmac_sig": hmac_sig,
-        }
-
-        try:
-            messages = json.loads(path.read_text()) if path.exists() else []
-        except json.JSONDecodeError:
-            messages = []
-
-        messages.append(entry)
-        path.write_text(json.dumps(messages, indent=2))
-
-    # ── receive (pop 1st message + log) ────────────────────────────────────────
-    def receive_messages(self, recipient: str) -> Optional[Dict[str, any]]:
+                     hmac_sig: Optional[str] = None,
+                     headers: Optional[Dict[str, Any]] = None,
+                     encrypted: bool = False):
+        self.deliver(Message(sender, to, msg_type, message,
+                             conversation_id=conversation_id,
+                             user_initiated=user_initiated, encrypted=encrypted,
+                             hmac_sig=hmac_sig, headers=headers))
+
+    def deliver(self, msg: Message):
+        """Append an already‑built Message to its recipient's inbox."""
+        self.deliver_many([msg])
+
+    def deliver_many(self, msgs: List[Message]):
+        """Batched deliver: one read‑modify‑write per recipient inbox."""
+        by_recipient: Dict[str, List[dict]] = {}
+        for msg in msgs:
+            by_recipient.setdefault(msg.to, []).append(msg.to_dict())
+
+        for recipient, entries in by_recipient.items():
+            path = self._inbox_path(recipient)
+            try:
+                messages = json.loads(path.read_text()) if path.exists() else []
+            except json.JSONDecodeError:
+                messages = []
+
+            messages.extend(entries)
+            path.write_text(json.dumps(messages, indent=2))
+
+    # ── receive (pop + log; control traffic first) ────────────────────────────
+    def receive_messages(self, recipient: str) -> Optional[Message]:
+        msgs = self.receive_many(recipient, limit=1)
+        return msgs[0] if msgs else None
+
+    def receive_many(self, recipient: str, limit: Optional[int] = None) -> List[Message]:
+        """Pop up to *limit* messages (all by default) in one read‑modify‑write."""
+        self.flush_logs(LOG_FLUSH_S)
         inbox = self._inbox_path(recipient)
         if not inbox.exists():
-            return None
+            return []
 
         try:
             messages = json.loads(inbox.read_text())
@@ -91,21 +141,23 @@ class FileTransport(BaseTransport):
 
         if not messages:
             inbox.unlink(missing_ok=True)
-            return None
+            return []
 
-        message = messages.pop(0)
+        # stable: control entries first, everything else in arrival order
+        order = sorted(range(len(messages)),
+                       key=lambda i: lane_for(messages[i].get("type")) != CONTROL)
+        take = set(order[:limit] if limit is not None else order)
+        entries = [messages[i] for i in order if i in take]
+        rest = [m for i, m in enumerate(messages) if i not in take]
 
-        if messages:
-            inbox.write_text(json.dumps(messages, indent=2))
+        if rest:
+            inbox.write_text(json.dumps(rest, indent=2))
         else:
             inbox.unlink(missing_ok=True)
 
-        # append to rolling log
-        with (self.log_dir / f"{recipient}.jsonl").open("a") as lf:
-            json.dump(message, lf)
-            lf.write("\n")
-
-        return message
+        # the raw entries, not the returned Messages – callers decrypt those in place
+        self._log(recipient).extend(entries)
+        return [Message.from_dict(e) for e in entries]
 
     # ── util helpers ───────────────────────────────────────────────────────────
     def peek_messages(self, recipient: str) -> Optional[List[dict]]:
@@ -121,9 +173,11 @@ class FileTransport(BaseTransport):
         self._inbox_path(recipient).write_text("[]")
 
     def archive_inbox(self, recipient: str):
+        """Append the inbox to logs/<recipient>.pza (see common/archive.py)."""
         msgs = self.peek_messages(recipient)
         if not msgs:
             return
-        ts = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-        (self.log_dir / f"{recipient}_{ts}.json").write_text(json.dumps(msgs, indent=2))
+        log = self._log(recipient)
+        log.extend(msgs)
+        log.flush()
         self.clear_inbox(recipient)
@@ -2,21 +2,36 @@
 
 import asyncio
 import json
-from typing import Any, Dict, Optional
+import os
+import time
+from typing import Any, Dict, Optional, Union
 
-from aiortc import RTCPeerConnection
-from aiortc.contrib.signaling import object_from_string, object_to_string
-from cryptography.fernet import Fernet
+from common.lazy import lazy_import
+from common.message import Message, decode, encode
+from common.priority import AsyncPriorityQueue
 from common.transport import BaseTransport
 
+# aiortc + cryptography cost most of the entry points' import time
+aiortc = lazy_import("aiortc")
+signaling = lazy_import("aiortc.contrib.signaling")
+fernet = lazy_import("cryptography.fernet")
+
 
 class WebRTCTransport(BaseTransport):
-    def __init__(self, name: str, secret_key: str) -> None:
+    def __init__(self, name: str, secret_key: str, codec: str = "binary", admission=None) -> None:
         self.name = name
-        self._cipher = Fernet(secret_key)
-        self.pc = RTCPeerConnection()
-        self._recv_queue: asyncio.Queue[str] = asyncio.Queue()
+        # "binary" → bytes frames (fastest, see benchmarks/message_bench.py),
+        # "json" → text frames; the receiver accepts either
+        self.codec = codec
+        self._cipher = fernet.Fernet(secret_key)
+        self.pc = aiortc.RTCPeerConnection()
+        self._recv_queue = AsyncPriorityQueue()     # control lane overtakes bulk replies
         self.channel_ready = asyncio.Event()
+        self._pings: Dict[str, asyncio.Future] = {}   # nonce → pong waiter
+        # optional common.admission.AdmissionController, checked before Fernet
+        self.admission = admission
+        if admission is not None and admission.notify is None:
+            admission.notify = self._notify_busy
 
     def create_datachannel(self):
         """Only the offerer calls this before create_offer()"""
@@ -32,8 +47,9 @@ class WebRTCTransport(BaseTransport):
         @channel.on("message")
         def on_message(message):
             try:
-                plaintext = self._cipher.decrypt(message.encode()).decode()
-                asyncio.create_task(self._recv_queue.put(plaintext))
+                msg = self._open_envelope(message)
+                if msg is not None and not self._handle_ping(msg):
+                    self._recv_queue.put_nowait(msg)
             except Exception:
                 print(f"[{self.name}] ⚠️ Could not decrypt incoming message.")
 
@@ -46,7 +62,7 @@ class WebRTCTransport(BaseTransport):
 
         offer = await self.pc.createOffer()
         await self.pc.setLocalDescription(offer)
-        self.local_description = json.loads(object_to_string(self.pc.localDescription))
+        self.local_description = json.loads(signaling.object_to_string(self.pc.localDescription))
         return self
 
     @classmethod
@@ -64,17 +80,48 @@ class WebRTCTransport(BaseTransport):
         else:
             raise TypeError(f"[{name}] ❌ Unexpected peer_offer type: {type(peer_offer)}")
 
-        offer_obj = object_from_string(sdp_string)
+        offer_obj = signaling.object_from_string(sdp_string)
         await self.pc.setRemoteDescription(offer_obj)
         answer = await self.pc.createAnswer()
         await self.pc.setLocalDescription(answer)
-        self.local_description = json.loads(object_to_string(self.pc.localDescription))
+        self.local_description = json.loads(signaling.object_to_string(self.pc.localDescription))
         return self
 
     async def set_remote_description(self, peer_answer: Dict[str, str]) -> None:
-        answer_obj = object_from_string(json.dumps(peer_answer))
+        answer_obj = signaling.object_from_string(json.dumps(peer_answer))
         await self.pc.setRemoteDescription(answer_obj)
 
+    # ── envelope: clear‑text routing header, encrypted body ────────────────────
+    def _seal_envelope(self, msg: Message) -> Union[str, bytes]:
+        # group traffic is already end‑to‑end encrypted once for all members
+        # ``encrypted`` keeps describing the inner body (e.g. Messenger AES‑GCM)
+        if not (msg.headers and "group" in msg.headers):
+            msg.body = self._cipher.encrypt(msg.body.encode()).decode()
+        return encode(msg, self.codec)
+
+    def _notify_busy(self, peer: str, body: str) -> None:
+        asyncio.ensure_future(self.send_message(peer, self.name, body, msg_type="busy"))
+
+    def _open_envelope(self, raw: Union[str, bytes]) -> Optional[Message]:
+        if isinstance(raw, bytes):
+            msg = decode(raw, "binary")
+        else:
+            try:
+                msg = decode(raw, "json")
+            except (json.JSONDecodeError, AttributeError):
+                # e.g. a pre‑envelope peer's bare Fernet token: no AES‑GCM
+                # inside, so Messenger would drop it anyway
+                print(f"[{self.name}] 🚨 Dropped a frame without a message envelope")
+                return None
+        # admission runs on the cleartext envelope; rejected frames never hit Fernet
+        if self.admission is not None and \
+                self.admission.check(msg, self._recv_queue.qsize()) is not None:
+            return None
+        if msg.headers and "group" in msg.headers:
+            return msg                      # opened by common.groups
+        msg.body = self._cipher.decrypt(msg.body.encode()).decode()
+        return msg
+
     async def send_message(
         self,
         to: str,
@@ -83,22 +130,23 @@ class WebRTCTransport(BaseTransport):
         msg_type: str = "user",
         conversation_id: Optional[str] = None,
         user_initiated: bool = False,
+        hmac_sig: Optional[str] = None,
+        headers: Optional[Dict[str, Any]] = None,
+        encrypted: bool = False,
     ) -> None:
         if not self.channel_ready.is_set():
             print(f"[{self.name}] ⏳ Waiting for channel to open...")
             await self.channel_ready.wait()
-        payload = self._cipher.encrypt(message.encode()).decode()
+        payload = self._seal_envelope(Message(sender, to, msg_type, message,
+                                              conversation_id=conversation_id,
+                                              user_initiated=user_initiated,
+                                              encrypted=encrypted,
+                                              hmac_sig=hmac_sig, headers=headers))
         self.channel.send(payload)
 
-    async def receive_messages(self, self_id: str) -> Optional[Dict[str, Any]]:
+    async def receive_messages(self, self_id: str) -> Optional[Message]:
         try:
-            plaintext = self._recv_queue.get_nowait()
-            return {
-                "from": "peer",
-                "message": plaintext,
-                "type": "user",
-                "user_initiated": True,
-            }
+            return self._recv_queue.get_nowait()
         except asyncio.QueueEmpty:
             return None
 # ------------------------------------------------------------
@@ -112,7 +160,7 @@ class WebRTCTransport(BaseTransport):
             sdp_json = json.dumps(sdp_dict)
         else:
             sdp_json = sdp_dict
-        answer_obj = object_from_string(sdp_json)
+        answer_obj = signaling.object_from_string(sdp_json)
         await self.pc.setRemoteDescription(answer_obj)
 
     async def apply_remote_offer(self, sdp_dict: dict | str):
@@ -124,7 +172,7 @@ class WebRTCTransport(BaseTransport):
             sdp_json = json.dumps(sdp_dict)
         else:
             sdp_json = sdp_dict
-        offer_obj = object_from_string(sdp_json)
+        offer_obj = signaling.object_from_string(sdp_json)
         await self.pc.setRemoteDescription(offer_obj)
     # ------------------------------------------------------------
     @classmethod
@@ -133,8 +181,41 @@ class WebRTCTransport(BaseTransport):
         self.create_datachannel()                   # must happen before offer
         offer = await self.pc.createOffer()
         await self.pc.setLocalDescription(offer)
-        self.local_description = json.loads(object_to_string(self.pc.localDescription))
+        self.local_description = json.loads(signaling.object_to_string(self.pc.localDescription))
         return self
+    async def ping(self, peer: str, timeout: float = 5.0) -> float:
+        """
+        Round trip over the DataChannel: send an (encrypted) ``ping`` and wait
+        for the peer's ``pong``.  Returns the RTT in seconds; used by
+        CombinedTransport.probe().
+        """
+        if not self.channel_ready.is_set() or self.pc.connectionState in ("failed", "closed"):
+            raise ConnectionError(f"[{self.name}] DataChannel to {peer} is not open")
+        nonce = os.urandom(8).hex()
+        waiter = asyncio.get_running_loop().create_future()
+        self._pings[nonce] = waiter
+        t0 = time.perf_counter()
+        try:
+            await self.send_message(peer, self.name, nonce, msg_type="ping")
+            await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            raise ConnectionError(f"[{self.name}] no pong from {peer} within {timeout}s")
+        finally:
+            self._pings.pop(nonce, None)
+        return time.perf_counter() - t0
+
+    def _handle_ping(self, msg: Message) -> bool:
+        """Answer pings and resolve pongs right here; True if consumed."""
+        if msg.type == "ping":
+            asyncio.ensure_future(self.send_message(msg.sender, self.name, msg.body, msg_type="pong"))
+            return True
+        if msg.type == "pong":
+            waiter = self._pings.get(msg.body)
+            if waiter is not None and not waiter.done():
+                waiter.set_result(None)
+            return True
+        return False
+
     # No-op compatibility methods
     def archive_inbox(self, self_id: str) -> None:
         pass
@@ -145,11 +226,5 @@ class WebRTCTransport(BaseTransport):
     def peek_messages(self, self_id: str) -> list:
         return []
 
-    async def receive_messages_async(self, self_id: str) -> Optional[Dict[str, Any]]:
-        plaintext = await self._recv_queue.get()
-        return {
-            "from": "peer",
-            "message": plaintext,
-            "type": "user",
-            "user_initiated": True,
-        }
\ No newline at end of file
+    async def receive_messages_async(self, self_id: str) -> Optional[Message]:
+        return await self._recv_queue.get()
@@ -0,0 +1,51 @@
+# tests/test_admission.py
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from common.admission import AdmissionController
+from common.message import Message
+
+
+def _msg(sender, body="x"):
+    return Message(sender, "me", "user", body, encrypted=True)
+
+
+def test_many_senders_still_admit_known_peer():
+    notices = []
+    admission = AdmissionController("me", max_pending=256,
+                                    notify=lambda peer, body: notices.append(peer),
+                                    reachable=lambda peer: peer == "polite")
+    admitted = admission.filter([_msg(f"fake{i}") for i in range(300)] + [_msg("polite")])
+    senders = [m.sender for m in admitted]
+    assert "polite" in senders
+    assert len(admitted) == 256
+    assert len(set(senders)) == len(senders)       # one each, nobody crowds the rest out
+    # shed fakes have no known inbox: no notice, no encrypt, no inbox write
+    assert notices == []
+
+
+def test_known_bucket_preferred_over_new_senders():
+    admission = AdmissionController("me", max_pending=10)
+    assert admission.filter([_msg("polite")])
+    admitted = admission.filter([_msg(f"fake{i}") for i in range(50)] + [_msg("polite")])
+    assert "polite" in [m.sender for m in admitted]
+    assert len(admitted) == 10
+
+
+def test_busy_notices_capped_per_interval():
+    notices = []
+    admission = AdmissionController("me", max_pending=0, max_notices=3,
+                                    notify=lambda peer, body: notices.append(peer))
+    admission.filter([_msg(f"peer{i}") for i in range(20)])
+    assert len(notices) == 3
+    assert admission.counters["overload"] == 20
+
+
+def test_fair_share_unchanged_with_few_senders():
+    admission = AdmissionController("me", max_pending=10, burst=100)
+    msgs = [_msg("flooder") for _ in range(50)] + [_msg("polite") for _ in range(3)]
+    admitted = admission.filter(msgs)
+    assert sum(m.sender == "polite" for m in admitted) == 3
+    assert sum(m.sender == "flooder" for m in admitted) == 5
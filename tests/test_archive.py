@@ -0,0 +1,55 @@
+# tests/test_archive.py
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from common.archive import ArchiveReader, ArchiveWriter, compact, index_path, read_index
+from common.message import Message
+
+
+def _write_frames(path, frames=3, per_frame=4):
+    with ArchiveWriter(path, frame_messages=per_frame, codec="zlib") as w:
+        for i in range(frames * per_frame):
+            w.append(Message("a", "b", "user", f"m{i}"))
+
+
+def test_frames_with_missing_index_lines_are_reindexed(tmp_path):
+    path = tmp_path / "a.pza"
+    _write_frames(path)
+    idx = index_path(path)
+    lines = idx.read_text().splitlines(keepends=True)
+    idx.write_text(lines[0] + lines[1][:10])          # one good line, one torn, one missing
+    size = path.stat().st_size
+
+    ArchiveWriter(path).close()
+    assert path.stat().st_size == size
+    assert len(read_index(path)) == 3
+    assert [m.body for m in ArchiveReader(path)] == [f"m{i}" for i in range(12)]
+
+
+def test_only_torn_frame_is_cut(tmp_path):
+    path = tmp_path / "a.pza"
+    _write_frames(path)
+    good = path.stat().st_size
+    index_path(path).write_text("")                   # index lost entirely
+    with path.open("ab") as fh:
+        fh.write(b"PZF1\x02\x00\x00\x00\x04\x00\x00\x10\x00half")   # header promises more
+
+    with ArchiveWriter(path) as w:
+        w.append(Message("a", "b", "user", "after"))
+    assert len(read_index(path)) == 4
+    assert [m.body for m in ArchiveReader(path)][-2:] == ["m11", "after"]
+    assert read_index(path)[3]["off"] == good
+
+
+def test_compact_refuses_live_writer(tmp_path):
+    path = tmp_path / "a.pza"
+    _write_frames(path)
+    writer = ArchiveWriter(path)
+    with pytest.raises(RuntimeError):
+        compact(path)
+    writer.close()
+    assert compact(path) == 12
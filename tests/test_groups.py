@@ -0,0 +1,66 @@
+# tests/test_groups.py
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from common.groups import GroupManager
+
+
+class Collect:
+    def __init__(self):
+        self.out = []
+
+    def deliver_many(self, msgs):
+        self.out += msgs
+
+
+def _managers(*names):
+    return {n: GroupManager(n, "secret", persist=False) for n in names}
+
+
+def _deliver(managers, msgs):
+    opened = []
+    for msg in msgs:
+        result = managers[msg.to].open(msg)
+        if result is not None:
+            opened.append((msg.to, result.body))
+    return opened
+
+
+def test_removed_member_cannot_inject_or_rekey():
+    g = _managers("a", "b", "c")
+    wire = Collect()
+    asyncio.run(g["a"].create("team", ["b", "c"], wire))
+    _deliver(g, wire.out)
+    old_sealed = g["c"].seal("team", "from c, before removal")
+
+    wire.out = []
+    asyncio.run(g["a"].remove_member("team", "c", wire))
+    _deliver(g, wire.out)
+    assert sorted(g["b"].groups["team"].keys) == [2]       # pre‑removal key dropped
+
+    # c still holds epoch 1: neither its old broadcasts nor new ones get through
+    assert _deliver(g, [m for m in old_sealed if m.to == "b"]) == []
+    g["c"].groups["team"].members = ["a", "b", "c"]
+    assert _deliver(g, [m for m in g["c"].seal("team", "late") if m.to == "b"]) == []
+
+    # nor can it push a key of its own
+    rogue = Collect()
+    asyncio.run(g["c"].rotate("team", rogue))
+    assert _deliver(g, [m for m in rogue.out if m.to == "b"]) == []
+    assert g["b"].groups["team"].epoch == 2
+
+    sealed = g["a"].seal("team", "hello")
+    assert _deliver(g, sealed) == [("b", "hello")]
+
+
+def test_group_headers_are_authenticated():
+    g = _managers("a", "b")
+    wire = Collect()
+    asyncio.run(g["a"].create("team", ["b"], wire))
+    key_update = wire.out[0]
+    key_update.headers = {**key_update.headers, "members": ["a", "b", "mallory"]}
+    assert _deliver(g, [key_update]) == []
+    assert "team" not in g["b"].groups
@@ -0,0 +1,63 @@
+# tests/test_inbound.py
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from common.delivery import ReliableChannel
+from common.inbound import InboundPipeline
+from common.messenger import Messenger
+from common.transport import FileTransport
+
+
+def _pair(tmp_path):
+    ft = FileTransport(tmp_path / "inbox")
+    ma, mb = Messenger("a", "k", transport=ft), Messenger("b", "k", transport=ft)
+    ca = ReliableChannel(ma, "a", state_dir=tmp_path / "state", ack_delay=0.01)
+    cb = ReliableChannel(mb, "b", state_dir=tmp_path / "state", ack_delay=0.01)
+    return ma, mb, ca, cb
+
+
+def test_control_and_replies_not_stuck_behind_slow_handler(tmp_path):
+    async def main():
+        ma, mb, ca, cb = _pair(tmp_path)
+        release = asyncio.Event()
+        seen = []
+
+        async def handler(msg):
+            seen.append(msg.body)
+            if msg.body == "slow question":
+                await release.wait()            # an LLM call that takes its time
+
+        pipeline = InboundPipeline(mb, cb, handler)
+        pipeline.start_workers()
+        await ca.send("b", "slow question", user_initiated=True)
+        await pipeline.poll()
+        await asyncio.sleep(0.01)
+
+        # b sends something, a acks it, b must take the ack while the handler is stuck
+        await cb.send("a", "ping", user_initiated=False)
+        await ca.handle((await ma.areceive_messages())[0], lambda m: None)
+        await ca.flush_acks("b")
+        await ca.send("b", "quick reply")
+        await pipeline.poll()
+        await asyncio.sleep(0.01)
+        assert cb.outbox.unacked("a") == []
+        assert "quick reply" in seen
+
+        # the peer retransmits the slow one: dropped as in flight, not handled twice
+        await ca.retransmit_due(0)
+        await pipeline.poll()
+        await asyncio.sleep(0.01)
+        assert seen.count("slow question") == 1
+        assert cb.stats["duplicates"] >= 1
+
+        release.set()
+        await asyncio.sleep(0.01)
+        assert pipeline.idle()
+        pipeline.stop()
+        ca.close()
+        cb.close()
+
+    asyncio.run(main())
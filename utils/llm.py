@@ -1,9 +1,18 @@
 # utils/llm.py
-import openai
+import os
+
+from common.lazy import lazy_import
+
+# openai is only imported the first time generate_response() runs
+openai = lazy_import("openai")
 
-openai.api_key = "your-api-key"  # Or read from env
 
 def generate_response(message, assistant_name="assistant"):
+    if os.getenv("LLM_BACKEND") == "local":
+        from utils.local_llm import generate_response as local_generate
+        return local_generate(message, assistant_name)
+
+    openai.api_key = os.getenv("OPENAI_API_KEY", "your-api-key")
     system_prompt = f"You are {assistant_name}. Respond intelligently to the other assistant."
     messages = [
         {"role": "system", "content": system_prompt},
@@ -0,0 +1,115 @@
+# utils/local_llm.py
+"""
+In‑process CPU inference via llama.cpp (``pip install llama-cpp-python``).
+
+Select it with ``LLM_BACKEND=local`` and point ``LOCAL_MODEL_PATH`` at a
+GGUF file.  The model is loaded once per process and stays resident; up to
+``LOCAL_MODEL_POOL`` independent sessions (llama.cpp contexts) serve
+concurrent requests, callers beyond that wait for a free one.
+"""
+import contextlib
+import os
+import queue
+import threading
+from typing import Dict, Iterator, List, Optional
+
+from common.lazy import lazy_import
+
+llama_cpp = lazy_import("llama_cpp")
+
+MODEL_PATH = os.getenv("LOCAL_MODEL_PATH")
+POOL_SIZE = int(os.getenv("LOCAL_MODEL_POOL", "1"))
+N_CTX = int(os.getenv("LOCAL_MODEL_CTX", "2048"))
+N_THREADS = int(os.getenv("LOCAL_MODEL_THREADS", "0")) or None   # None → llama.cpp default
+ACQUIRE_TIMEOUT_S = 120
+
+
+class LocalModel:
+    """A resident GGUF model with a bounded pool of inference sessions."""
+
+    def __init__(self, model_path: str, pool_size: int = POOL_SIZE,
+                 n_ctx: int = N_CTX, n_threads: Optional[int] = N_THREADS) -> None:
+        if not model_path or not os.path.exists(model_path):
+            raise FileNotFoundError(f"Local model not found: {model_path!r} (set LOCAL_MODEL_PATH)")
+        self.model_path = model_path
+        self.pool_size = max(1, pool_size)
+        self.n_ctx = n_ctx
+        self.n_threads = n_threads
+
+        self._idle: "queue.Queue" = queue.Queue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _new_session(self):
+        # weights are mmap'd, so extra sessions mostly cost KV‑cache memory
+        return llama_cpp.Llama(model_path=self.model_path, n_ctx=self.n_ctx,
+                               n_threads=self.n_threads, verbose=False)
+
+    @contextlib.contextmanager
+    def session(self):
+        try:
+            llm = self._idle.get_nowait()
+        except queue.Empty:
+            llm = None
+            with self._lock:
+                if self._created < self.pool_size:
+                    self._created += 1
+                    create = True
+                else:
+                    create = False
+            if create:
+                try:
+                    llm = self._new_session()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                llm = self._idle.get(timeout=ACQUIRE_TIMEOUT_S)
+        try:
+            yield llm
+        finally:
+            self._idle.put(llm)
+
+    def warm(self) -> None:
+        """Load the weights now instead of on the first request."""
+        with self.session():
+            pass
+
+    def generate(self, prompt: str, max_tokens: int = 80, temperature: float = 0.6,
+                 top_p: float = 0.9, stop: Optional[List[str]] = None) -> str:
+        with self.session() as llm:
+            out = llm(prompt, max_tokens=max_tokens, temperature=temperature,
+                      top_p=top_p, stop=stop or ["\nUser:"])
+        return out["choices"][0]["text"].strip()
+
+    def stream(self, prompt: str, max_tokens: int = 80, temperature: float = 0.6,
+               top_p: float = 0.9, stop: Optional[List[str]] = None) -> Iterator[str]:
+        """Yield text chunks as they are produced; the session is held until exhausted."""
+        with self.session() as llm:
+            for chunk in llm(prompt, max_tokens=max_tokens, temperature=temperature,
+                             top_p=top_p, stop=stop or ["\nUser:"], stream=True):
+                text = chunk["choices"][0]["text"]
+                if text:
+                    yield text
+
+
+_MODELS: Dict[str, LocalModel] = {}
+_MODELS_LOCK = threading.Lock()
+
+
+def get_model(model_path: Optional[str] = None) -> LocalModel:
+    """Process‑wide cache: each GGUF path is loaded at most once."""
+    path = model_path or MODEL_PATH
+    with _MODELS_LOCK:
+        model = _MODELS.get(path)
+        if model is None:
+            model = _MODELS[path] = LocalModel(path)
+        return model
+
+
+def generate_response(message, assistant_name="assistant"):
+    """Same signature as utils.llm.generate_response, served in‑process."""
+    prompt = (f"You are {assistant_name}. Respond intelligently to the other assistant.\n\n"
+              f"User: {message}\nAssistant:")
+    return get_model().generate(prompt, max_tokens=256, temperature=0.7)
@@ -1,6 +1,144 @@
 from datetime import datetime
-import requests
+import re
+import threading
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional
 
+from common.lazy import lazy_import
+
+requests = lazy_import("requests")
+
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+# ───────────────────────────────── INTENT ROUTER ──────────────────────────────
+class IntentMatch(NamedTuple):
+    intent: str
+    response: str
+    confidence: float
+
+
+class IntentRouter:
+    """
+    Answers cheap deterministic intents before anything reaches the LLM.
+
+    All registered patterns are compiled into ONE alternation regex with a
+    named group per intent, so a message is scanned once no matter how many
+    intents exist.  Confidence grows with how much of the message the match
+    covers – "status" scores 1.0, "what's the status of the deploy on
+    friday" scores low and falls through to the LLM.
+    """
+
+    def __init__(self, min_confidence: float = 0.75) -> None:
+        self.min_confidence = min_confidence
+        self._intents: List[tuple] = []          # (name, pattern, handler, weight)
+        self._regex: Optional[re.Pattern] = None
+        self._lock = threading.Lock()
+        self.hits: Dict[str, int] = {}
+        self.misses = 0
+        self.route_seconds = 0.0
+        self.llm_calls = 0
+        self.llm_seconds = 0.0
+
+    def register(self, name: str, patterns: List[str],
+                 handler: Callable[..., str], weight: float = 1.0) -> None:
+        with self._lock:
+            self._intents.append((name, "|".join(f"(?:{p})" for p in patterns), handler, weight))
+            self._regex = None
+
+    def intent(self, name: str, patterns: List[str], weight: float = 1.0):
+        """Decorator form of register()."""
+        def wrap(handler: Callable[..., str]) -> Callable[..., str]:
+            self.register(name, patterns, handler, weight)
+            return handler
+        return wrap
+
+    def _compiled(self) -> re.Pattern:
+        regex = self._regex
+        if regex is None:
+            with self._lock:
+                body = "|".join(f"(?P<i{i}>{pat})" for i, (_, pat, _, _) in enumerate(self._intents))
+                regex = self._regex = re.compile(body or r"(?!)", re.IGNORECASE)
+        return regex
+
+    def match(self, message: str) -> Optional[tuple]:
+        """Best (intent index, confidence) for *message*, or None."""
+        text = message.strip()
+        if not text:
+            return None
+        letters = max(1, len(_NON_WORD.sub("", text)))
+        best = None
+        for m in self._compiled().finditer(text):
+            idx = int(m.lastgroup[1:])
+            covered = len(_NON_WORD.sub("", m.group()))
+            confidence = min(1.0, 0.5 + 0.5 * covered / letters) * self._intents[idx][3]
+            if best is None or confidence > best[1]:
+                best = (idx, confidence)
+        return best
+
+    def route(self, message: str, min_confidence: Optional[float] = None, **context) -> Optional[IntentMatch]:
+        t0 = time.perf_counter()
+        threshold = self.min_confidence if min_confidence is None else min_confidence
+        best = self.match(message)
+        result = None
+        if best is not None and best[1] >= threshold:
+            name, _, handler, _ = self._intents[best[0]]
+            result = IntentMatch(name, handler(message, **context), round(best[1], 3))
+            self.hits[name] = self.hits.get(name, 0) + 1
+        else:
+            self.misses += 1
+        self.route_seconds += time.perf_counter() - t0
+        return result
+
+    def record_llm_call(self, seconds: float) -> None:
+        self.llm_calls += 1
+        self.llm_seconds += seconds
+
+    def stats(self) -> Dict[str, float]:
+        hits = sum(self.hits.values())
+        total = hits + self.misses
+        avg_llm = self.llm_seconds / self.llm_calls if self.llm_calls else 0.0
+        return {
+            "hits": hits,
+            "misses": self.misses,
+            "hit_rate": hits / total if total else 0.0,
+            "by_intent": dict(self.hits),
+            "avg_route_us": self.route_seconds / total * 1e6 if total else 0.0,
+            "avg_llm_s": avg_llm,
+            "llm_seconds_saved": hits * avg_llm,
+        }
+
+
+router = IntentRouter()
+
+
+@router.intent("identity", [r"\bwho\s+are\s+you\b"])
+def _identity(message: str, assistant_name: str = "assistant", **_) -> str:
+    return f"I'm {assistant_name}, your personal assistant."
+
+
+@router.intent("wellbeing", [r"\bhow\s+are\s+you(?:\s+doing)?(?:\s+today)?\b"])
+def _wellbeing(message: str, **_) -> str:
+    return "I'm doing well, thanks! How about you?"
+
+
+@router.intent("time", [r"\bwhat(?:'s|\s+is)\s+the\s+time\b", r"\bwhat\s+time\s+is\s+it\b",
+                        r"\b(?:current|local)\s+time\b"])
+def _time(message: str, **_) -> str:
+    return f"The time is {datetime.now().strftime('%H:%M:%S')}."
+
+
+@router.intent("status", [r"\b(?:system\s+)?status\b"])
+def _status(message: str, **_) -> str:
+    return "All systems are functioning normally."
+
+
+@router.intent("bye", [r"\b(?:good)?bye\b", r"\bsee\s+you(?:\s+later)?\b"])
+def _bye(message: str, **_) -> str:
+    return "Goodbye! Talk to you later."
+
+
+# ───────────────────────────────── LEGACY HELPERS ─────────────────────────────
 def parse_command(message: str) -> str:
     """
     Fallback command parser if needed.
@@ -16,33 +154,15 @@ def generate_response(message: str, assistant_name: str) -> str:
     """
     Simulated NLP-based response generation based on message content and assistant identity.
     """
-    msg = message.lower()
-
-    if "who are you" in msg:
-        return f"I'm {assistant_name}, your personal assistant."
-    elif "how are you" in msg:
-        return "I'm doing well, thanks! How about you?"
-    elif "time" in msg:
-        return f"The time is {datetime.now().strftime('%H:%M:%S')}."
-    elif "status" in msg:
-        return "All systems are functioning normally."
-    elif "bye" in msg:
-        return "Goodbye! Talk to you later."
-    else:
-        return f"You said: {message}"
+    hit = router.route(message, min_confidence=0.0, assistant_name=assistant_name)
+    if hit:
+        return hit.response
+    return f"You said: {message}"
 
 def query_llm(prompt: str, model: str = "phi3") -> str:
-    url = "http://localhost:11434/api/generate"
-    headers = {"Content-Type": "application/json"}
-    data = {
-        "model": model,
-        "prompt": prompt,
-        "stream": False
-    }
+    from utils.ollama_models import get_manager
 
     try:
-        response = requests.post(url, headers=headers, json=data)
-        response.raise_for_status()
-        return response.json().get("response", "").strip()
+        return get_manager().generate(prompt, model=model)
     except requests.exceptions.RequestException as e:
-        return f"Error contacting LLM: {e}"
\ No newline at end of file
+        return f"Error contacting LLM: {e}"
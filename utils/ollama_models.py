@@ -0,0 +1,332 @@
+# utils/ollama_models.py
+"""
+Keeps Ollama models resident and schedules requests around model swaps.
+
+Without ``keep_alive`` Ollama unloads a model after a few idle minutes and
+the next message pays a multi‑second load.  The manager
+
+* preloads the configured models at startup (in the background),
+* re‑sends ``keep_alive`` every ``refresh_s`` and reloads a configured model
+  that fell out while there is room,
+* tracks what is actually loaded via ``/api/ps``,
+* routes a request to a model that is already resident when the caller
+  accepts several (``prefer=[...]``),
+* lets requests for resident models drain before evicting one of them to
+  make room for another (at most ``max_loaded`` models at once), and
+* records cold (model had to load) vs warm latency per model.
+
+    manager = get_manager()
+    manager.start()
+    text = manager.generate(prompt, model="mistral", options={"num_predict": 80})
+
+Environment: ``OLLAMA_HOST`` (default http://localhost:11434),
+``OLLAMA_MODELS`` (default "mistral,phi3"), ``OLLAMA_KEEP_ALIVE``
+(default "30m"), ``OLLAMA_MAX_LOADED`` (default 2).
+"""
+from __future__ import annotations
+
+import os
+import statistics
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Sequence, Tuple
+
+from common.lazy import lazy_import
+
+requests = lazy_import("requests")
+
+DEFAULT_HOST = "http://localhost:11434"
+DEFAULT_MODELS = "mistral,phi3"
+DEFAULT_KEEP_ALIVE = "30m"
+REFRESH_S = 60.0          # keep‑alive / load‑state poll interval
+MAX_SWAP_WAIT_S = 5.0     # longest a request waits for resident work to drain
+COLD_LOAD_S = 0.25        # load_duration above this counts as a cold call
+SAMPLES = 1000            # latency samples kept per model and kind
+
+
+def _host(value: Optional[str]) -> str:
+    host = (value or DEFAULT_HOST).rstrip("/")
+    return host if host.startswith(("http://", "https://")) else f"http://{host}"
+
+
+def _base(name: str) -> str:
+    return name[:-len(":latest")] if name.endswith(":latest") else name
+
+
+def _ms(xs: Sequence[float]) -> Dict[str, float]:
+    if not xs:
+        return {"count": 0}
+    s = sorted(xs)
+    return {"count": len(s), "mean_ms": statistics.fmean(s) * 1000,
+            "p50_ms": s[len(s) // 2] * 1000, "max_ms": s[-1] * 1000}
+
+
+class ModelState:
+    __slots__ = ("name", "resident", "loading", "evicting", "expires_at", "last_used",
+                 "inflight", "pending", "cold", "warm", "loads")
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.resident = False       # confirmed by the server (a 2xx reply or /api/ps)
+        self.loading = 0            # requests that will load it – each holds a slot
+        self.evicting = False       # picked as a victim, unload in progress
+        self.expires_at: Optional[str] = None
+        self.last_used = 0.0
+        self.inflight = 0
+        self.pending = 0
+        self.cold: Deque[float] = deque(maxlen=SAMPLES)
+        self.warm: Deque[float] = deque(maxlen=SAMPLES)
+        self.loads: Deque[float] = deque(maxlen=SAMPLES)
+
+
+class ModelManager:
+    def __init__(self, host: Optional[str] = None, models: Optional[Sequence[str]] = None,
+                 keep_alive: str = DEFAULT_KEEP_ALIVE, max_loaded: int = 2,
+                 refresh_s: float = REFRESH_S, max_swap_wait_s: float = MAX_SWAP_WAIT_S) -> None:
+        self.host = _host(host)
+        self.models = [_base(m) for m in (models or DEFAULT_MODELS.split(","))]
+        self.keep_alive = keep_alive
+        self.max_loaded = max(1, max_loaded)
+        self.refresh_s = refresh_s
+        self.max_swap_wait_s = max_swap_wait_s
+
+        self._states: Dict[str, ModelState] = {}
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.swaps = 0
+
+    # ── state ──────────────────────────────────────────────────────────────────
+    def _state(self, name: str) -> ModelState:
+        st = self._states.get(name)
+        if st is None:
+            st = self._states[name] = ModelState(name)
+        return st
+
+    def resident(self) -> List[str]:
+        with self._cond:
+            return [s.name for s in self._states.values() if s.resident]
+
+    def refresh(self) -> List[str]:
+        """Sync load state with the server (``/api/ps``)."""
+        resp = requests.get(f"{self.host}/api/ps", timeout=5)
+        resp.raise_for_status()
+        loaded = {_base(m["name"]): m for m in resp.json().get("models", [])}
+        with self._cond:
+            for name in set(self._states) | set(loaded):
+                st = self._state(name)
+                st.resident = name in loaded
+                st.expires_at = loaded.get(name, {}).get("expires_at")
+            self._cond.notify_all()
+        return list(loaded)
+
+    # ── load / unload ──────────────────────────────────────────────────────────
+    def _post(self, payload: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+        resp = requests.post(f"{self.host}/api/generate", json=payload, timeout=timeout)
+        resp.raise_for_status()
+        return resp.json()
+
+    def load(self, name: str) -> float:
+        """Load (or just refresh keep_alive of) a model; returns seconds taken."""
+        t0 = time.perf_counter()
+        data = self._post({"model": name, "keep_alive": self.keep_alive}, timeout=300)
+        elapsed = time.perf_counter() - t0
+        with self._cond:
+            st = self._state(name)
+            if data.get("load_duration", 0) / 1e9 > COLD_LOAD_S or not st.resident:
+                st.loads.append(elapsed)
+            st.resident = True
+            self._cond.notify_all()
+        return elapsed
+
+    def unload(self, name: str) -> None:
+        self._post({"model": name, "keep_alive": 0}, timeout=30)
+        with self._cond:
+            st = self._state(name)
+            st.resident = False
+            st.evicting = False
+            self.swaps += 1
+            self._cond.notify_all()
+
+    def preload(self) -> None:
+        for name in self.models[:self.max_loaded]:
+            try:
+                print(f"🔥 Loaded {name} in {self.load(name):.1f}s (keep_alive={self.keep_alive})")
+            except Exception as e:
+                print(f"⚠️ Could not preload {name}: {e}")
+
+    # ── background keep‑alive ──────────────────────────────────────────────────
+    def start(self) -> None:
+        """Preload in the background, then keep the configured models warm."""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="ollama-keepalive", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        self.preload()
+        while not self._stop.wait(self.refresh_s):
+            try:
+                self.refresh()
+                resident = self.resident()
+                room = self.max_loaded - len(resident)
+                for name in self.models:
+                    if name in resident:
+                        self.load(name)                 # extends keep_alive, cheap
+                    elif room > 0 and self._idle():
+                        self.load(name)
+                        room -= 1
+            except Exception as e:
+                print(f"⚠️ Ollama keep-alive failed: {e}")
+
+    def _idle(self) -> bool:
+        with self._cond:
+            return not any(s.inflight or s.pending for s in self._states.values())
+
+    # ── scheduling ─────────────────────────────────────────────────────────────
+    def pick(self, candidates: Sequence[str]) -> str:
+        """First candidate that is already loaded, else the first one."""
+        with self._cond:
+            for name in candidates:
+                st = self._states.get(_base(name))
+                if st is not None and st.resident and not st.evicting:
+                    return st.name
+        return _base(candidates[0])
+
+    def _occupied(self) -> int:
+        """Slots in use: resident models (evicting ones too, until unloaded) and pending loads."""
+        return sum(1 for s in self._states.values() if s.resident or s.loading)
+
+    def _victim(self, name: str) -> Optional[ModelState]:
+        """LRU resident model with nothing queued, if we are at capacity."""
+        if self._occupied() < self.max_loaded:
+            return None
+        free = [s for s in self._states.values()
+                if s.resident and not s.evicting and s.name != name
+                and not s.inflight and not s.pending and not s.loading]
+        return min(free, key=lambda s: s.last_used) if free else None
+
+    def _acquire(self, name: str) -> Tuple[Optional[str], bool]:
+        """
+        Wait until *name* can run without evicting a model that still has
+        queued work (bounded by max_swap_wait_s).  Returns a model to unload
+        first, if any, and whether this request holds a load reservation.
+        Nothing is marked resident here – only a successful call does that.
+        A request that finds *name* already being loaded waits for that load
+        instead of reserving a second slot (and picking a second victim).
+        """
+        with self._cond:
+            st = self._state(name)
+            st.pending += 1
+            deadline = time.monotonic() + self.max_swap_wait_s
+            while not st.resident:
+                if st.loading:              # released (and notified) when that call ends
+                    self._cond.wait()
+                    continue
+                if self._occupied() < self.max_loaded or self._victim(name) is not None:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            victim = None
+            loading = not st.resident
+            if loading:
+                victim = self._victim(name)
+                if victim is not None:
+                    victim.evicting = True  # out of pick() / _victim() until unloaded
+                st.loading += 1             # holds a slot until the load succeeds or fails
+            st.pending -= 1
+            st.inflight += 1
+            return (victim.name if victim else None), loading
+
+    def _release(self, name: str, loading: bool) -> None:
+        with self._cond:
+            st = self._state(name)
+            st.inflight -= 1
+            if loading:
+                st.loading -= 1
+            st.last_used = time.monotonic()
+            self._cond.notify_all()
+
+    # ── generate ───────────────────────────────────────────────────────────────
+    def generate(self, prompt: str, model: Optional[str] = None,
+                 prefer: Optional[Sequence[str]] = None,
+                 options: Optional[Dict[str, Any]] = None, timeout: float = 60.0) -> str:
+        """
+        Non‑streaming /api/generate.  ``prefer`` lists interchangeable models;
+        one that is already loaded wins.  Raises on HTTP errors.
+        """
+        name = self.pick(prefer or [model or self.models[0]])
+        victim, loading = self._acquire(name)
+        try:
+            if victim is not None:
+                try:
+                    self.unload(victim)
+                except Exception as e:
+                    print(f"⚠️ Could not unload {victim}: {e}")
+                    with self._cond:            # still loaded – give it back
+                        self._state(victim).evicting = False
+                        self._cond.notify_all()
+            payload: Dict[str, Any] = {"model": name, "prompt": prompt, "stream": False,
+                                       "keep_alive": self.keep_alive}
+            if options:
+                payload["options"] = options
+            t0 = time.perf_counter()
+            data = self._post(payload, timeout)
+            elapsed = time.perf_counter() - t0
+            with self._cond:
+                st = self._state(name)
+                if data.get("load_duration", 0) / 1e9 > COLD_LOAD_S:
+                    st.cold.append(elapsed)
+                else:
+                    st.warm.append(elapsed)
+                st.resident = True
+            return data.get("response", "").strip()
+        finally:
+            self._release(name, loading)
+
+    # ── metrics ────────────────────────────────────────────────────────────────
+    def metrics(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "swaps": self.swaps,
+                "models": {s.name: {"resident": s.resident, "expires_at": s.expires_at,
+                                    "cold": _ms(s.cold), "warm": _ms(s.warm),
+                                    "loads": _ms(s.loads)}
+                           for s in self._states.values()},
+            }
+
+    def summary(self) -> str:
+        lines = []
+        for name, m in self.metrics()["models"].items():
+            cold, warm = m["cold"], m["warm"]
+            if not cold["count"] and not warm["count"]:
+                continue
+            lines.append(f"{name}: {warm['count']} warm"
+                         + (f" (~{warm['mean_ms']:.0f} ms)" if warm["count"] else "")
+                         + f", {cold['count']} cold"
+                         + (f" (~{cold['mean_ms']:.0f} ms)" if cold["count"] else ""))
+        return "; ".join(lines) + (f"; {self.swaps} swaps" if self.swaps else "")
+
+
+_manager: Optional[ModelManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_manager() -> ModelManager:
+    """Process‑wide manager configured from the environment."""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = ModelManager(
+                host=os.getenv("OLLAMA_HOST"),
+                models=os.getenv("OLLAMA_MODELS", DEFAULT_MODELS).split(","),
+                keep_alive=os.getenv("OLLAMA_KEEP_ALIVE", DEFAULT_KEEP_ALIVE),
+                max_loaded=int(os.getenv("OLLAMA_MAX_LOADED", "2")),
+            )
+        return _manager
@@ -0,0 +1,351 @@
+# utils/semantic_cache.py
+"""
+Near‑duplicate response cache for get_response_from_phi().
+
+Prompts are embedded (Ollama's /api/embeddings, or a hashing embedder that
+needs no model at all), L2‑normalised and kept in a float32 matrix, so a
+lookup is one matrix‑vector product: cosine similarity == dot product.
+
+Past ``ivf_min`` entries the matrix is partitioned IVF‑style: rows are
+bucketed by their nearest of ~sqrt(N) centroids and a query only scans
+the ``nprobe`` closest buckets, each cached as a contiguous block.  That
+keeps lookups well under a millisecond at 100k entries, where a full scan
+costs several (benchmarks/semantic_cache_bench.py).
+
+Vectors live in a memory‑mapped ``.npy`` file, the prompt/response text
+in a JSON sidecar written by save().  Next to every vector a 64‑bit hash
+of its prompt is written (``.key.npy``); on load, rows whose hash doesn't
+match the sidecar – overwritten after the last save, then crashed – are
+dropped instead of pairing a new vector with an old response.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import zlib
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Union
+
+import numpy as np
+
+from common.lazy import lazy_import
+
+requests = lazy_import("requests")
+
+DEFAULT_CAPACITY = 100_000
+DEFAULT_THRESHOLD = 0.90
+IVF_MIN = 4096            # below this a brute‑force scan is already fast
+NPROBE = 8
+KMEANS_ITERS = 8
+
+_TOKEN = re.compile(r"[a-z0-9']+")
+
+
+# ───────────────────────────────── EMBEDDERS ──────────────────────────────────
+class HashingEmbedder:
+    """
+    Model‑free CPU embedder: word unigrams, bigrams and character trigrams
+    hashed into a fixed number of signed buckets.  Good enough to catch
+    re‑phrasings that share most of their words, and deterministic, so it
+    doubles as the local stand‑in for tests.
+    """
+
+    def __init__(self, dim: int = 256) -> None:
+        self.dim = dim
+
+    def _features(self, text: str) -> List[str]:
+        words = _TOKEN.findall(text.lower())
+        feats = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        for w in words:
+            padded = f"#{w}#"
+            feats += [padded[i:i + 3] for i in range(len(padded) - 2)]
+        return feats
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for f in self._features(text):
+                h = zlib.crc32(f.encode())
+                out[row, h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        return out
+
+
+class OllamaEmbedder:
+    def __init__(self, model: str = "nomic-embed-text",
+                 host: str = "http://localhost:11434") -> None:
+        self.model = model
+        self.url = f"{host}/api/embeddings"
+        self.dim: Optional[int] = None
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        rows = []
+        for text in texts:
+            resp = requests.post(self.url, json={"model": self.model, "prompt": text}, timeout=30)
+            resp.raise_for_status()
+            rows.append(resp.json()["embedding"])
+        out = np.asarray(rows, dtype=np.float32)
+        self.dim = out.shape[1]
+        return out
+
+
+def _prompt_key(prompt: str) -> int:
+    return int.from_bytes(hashlib.blake2b(prompt.encode(), digest_size=8).digest(), "little")
+
+
+def _normalise(mat: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return mat / norms
+
+
+# ───────────────────────────────── CACHE ──────────────────────────────────────
+class SemanticCache:
+    def __init__(self, embedder=None, capacity: int = DEFAULT_CAPACITY,
+                 threshold: float = DEFAULT_THRESHOLD,
+                 path: Optional[Union[str, Path]] = None,
+                 ivf_min: int = IVF_MIN, nprobe: int = NPROBE,
+                 autosave_every: int = 50) -> None:
+        self.embedder = embedder or HashingEmbedder()
+        self.capacity = capacity
+        self.threshold = threshold
+        self.path = Path(path) if path is not None else None
+        self.ivf_min = ivf_min
+        self.nprobe = nprobe
+        self.autosave_every = autosave_every
+        self._unsaved = 0
+
+        self._lock = threading.RLock()
+        self.vectors: Optional[np.ndarray] = None
+        self.keys: Optional[np.ndarray] = None      # prompt hash per row
+        self.size = 0
+        self.prompts: List[Optional[str]] = []
+        self.responses: List[Optional[str]] = []
+        self.last_used = np.zeros(capacity, dtype=np.int64)
+        self._clock = 0
+
+        # IVF state (rebuilt, never persisted)
+        self._centroids: Optional[np.ndarray] = None
+        self._row_list = np.full(capacity, -1, dtype=np.int32)
+        self._lists: List[List[int]] = []
+        self._list_blocks: Dict[int, tuple] = {}   # list id → (row ids, contiguous vectors)
+        self._trained_at = 0
+
+        self.stats = {"hits": 0, "misses": 0, "inserts": 0, "evictions": 0}
+
+        if self.path is not None and self._vec_path.exists():
+            self._load()
+
+    # ── persistence ────────────────────────────────────────────────────────────
+    @property
+    def _vec_path(self) -> Path:
+        return self.path.with_suffix(".vec.npy")
+
+    @property
+    def _meta_path(self) -> Path:
+        return self.path.with_suffix(".meta.json")
+
+    @property
+    def _key_path(self) -> Path:
+        return self.path.with_suffix(".key.npy")
+
+    def _allocate(self, dim: int) -> None:
+        if self.path is not None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.vectors = np.lib.format.open_memmap(
+                self._vec_path, mode="w+", dtype=np.float32, shape=(self.capacity, dim))
+        else:
+            self.vectors = np.zeros((self.capacity, dim), dtype=np.float32)
+        self._allocate_keys()
+
+    def _allocate_keys(self) -> None:
+        if self.path is not None:
+            self.keys = np.lib.format.open_memmap(
+                self._key_path, mode="w+", dtype=np.uint64, shape=(self.capacity,))
+        else:
+            self.keys = np.zeros(self.capacity, dtype=np.uint64)
+
+    def _load(self) -> None:
+        self.vectors = np.load(self._vec_path, mmap_mode="r+")
+        if self.vectors.shape[0] != self.capacity:
+            raise ValueError(f"{self._vec_path} holds {self.vectors.shape[0]} rows, "
+                             f"cache capacity is {self.capacity}")
+        meta = json.loads(self._meta_path.read_text()) if self._meta_path.exists() else {}
+        self.size = meta.get("size", 0)
+        self.prompts = meta.get("prompts", [])[:self.size]
+        self.responses = meta.get("responses", [])[:self.size]
+        self.size = min(self.size, len(self.responses))
+        self._clock = meta.get("clock", 0)
+        used = meta.get("last_used", [])
+        self.last_used[:len(used)] = used
+
+        if self._key_path.exists():
+            self.keys = np.load(self._key_path, mmap_mode="r+")
+            stale = [row for row in range(self.size)
+                     if self.prompts[row] is None
+                     or int(self.keys[row]) != _prompt_key(self.prompts[row])]
+            for row in stale:       # vector rewritten after the last save()
+                self.vectors[row] = 0.0
+                self.prompts[row] = self.responses[row] = None
+                self.last_used[row] = 0             # first in line for reuse
+            if stale:
+                print(f"⚠️ semantic cache: dropped {len(stale)} rows changed since the last save")
+        else:                       # cache written before prompt hashes existed
+            self._allocate_keys()
+            for row, prompt in enumerate(self.prompts):
+                if prompt is not None:
+                    self.keys[row] = _prompt_key(prompt)
+        self._rebuild_ivf()
+
+    def save(self) -> None:
+        if self.path is None or self.vectors is None:
+            return
+        with self._lock:
+            for arr in (self.vectors, self.keys):
+                if isinstance(arr, np.memmap):
+                    arr.flush()
+            meta = {
+                "size": self.size,
+                "clock": self._clock,
+                "prompts": self.prompts,
+                "responses": self.responses,
+                "last_used": self.last_used[:self.size].tolist(),
+            }
+            tmp = self._meta_path.with_suffix(".tmp")
+            tmp.write_text(json.dumps(meta))
+            os.replace(tmp, self._meta_path)
+            self._unsaved = 0
+
+    # ── IVF partitioning ───────────────────────────────────────────────────────
+    def _rebuild_ivf(self) -> None:
+        self._centroids = None
+        self._lists = []
+        self._list_blocks = {}
+        self._row_list[:] = -1
+        if self.size < self.ivf_min:
+            return
+
+        data = self.vectors[:self.size]
+        n_lists = max(16, int(np.sqrt(self.size)))
+        rng = np.random.default_rng(0)
+        sample = data[rng.choice(self.size, size=min(self.size, n_lists * 32), replace=False)]
+        centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)].copy()
+        for _ in range(KMEANS_ITERS):                       # spherical k‑means
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(n_lists):
+                members = sample[assign == c]
+                if len(members):
+                    centroids[c] = members.sum(axis=0)
+            centroids = _normalise(centroids)
+
+        self._centroids = centroids
+        self._lists = [[] for _ in range(n_lists)]
+        for start in range(0, self.size, 8192):
+            block = np.argmax(data[start:start + 8192] @ centroids.T, axis=1)
+            for offset, c in enumerate(block):
+                self._lists[c].append(start + offset)
+                self._row_list[start + offset] = c
+        self._trained_at = self.size
+
+    def _assign(self, row: int) -> None:
+        if self._centroids is None:
+            if self.size >= self.ivf_min:
+                self._rebuild_ivf()
+            return
+        old = self._row_list[row]
+        if old >= 0:
+            self._lists[old].remove(row)
+            self._list_blocks.pop(int(old), None)
+        c = int(np.argmax(self._centroids @ self.vectors[row]))
+        self._lists[c].append(row)
+        self._list_blocks.pop(c, None)
+        self._row_list[row] = c
+        if self.size >= 4 * self._trained_at:               # centroids drifted – retrain
+            self._rebuild_ivf()
+
+    def _block(self, c: int) -> tuple:
+        """Row ids and a contiguous copy of their vectors for one list (cached)."""
+        block = self._list_blocks.get(c)
+        if block is None:
+            ids = np.asarray(self._lists[c], dtype=np.int64)
+            block = self._list_blocks[c] = (ids, np.ascontiguousarray(self.vectors[ids]))
+        return block
+
+    # ── search ─────────────────────────────────────────────────────────────────
+    def _search(self, q: np.ndarray):
+        if self.size == 0:
+            return -1, 0.0
+        if self._centroids is None:
+            sims = self.vectors[:self.size] @ q
+            best = int(np.argmax(sims))
+            return best, float(sims[best])
+
+        nprobe = min(self.nprobe, len(self._lists))
+        closest = np.argpartition(-(self._centroids @ q), nprobe - 1)[:nprobe]
+        best_row, best_score = -1, -1.0
+        for c in closest:
+            ids, vecs = self._block(int(c))
+            if not len(ids):
+                continue
+            sims = vecs @ q
+            i = int(np.argmax(sims))
+            if sims[i] > best_score:
+                best_row, best_score = int(ids[i]), float(sims[i])
+        return best_row, best_score
+
+    def lookup(self, prompt: str) -> Optional[str]:
+        return self.lookup_many([prompt])[0]
+
+    def lookup_many(self, prompts: Sequence[str]) -> List[Optional[str]]:
+        """Embed *prompts* as one batch, return the cached reply or None for each."""
+        queries = _normalise(self.embedder.embed(prompts))
+        out: List[Optional[str]] = []
+        with self._lock:
+            if self.vectors is not None and self._centroids is None and self.size:
+                # brute force: one (size × dim) @ (dim × batch) product for the batch
+                sims = self.vectors[:self.size] @ queries.T
+                best = np.argmax(sims, axis=0)
+                matches = [(int(r), float(sims[r, j])) for j, r in enumerate(best)]
+            else:
+                matches = [self._search(q) for q in queries] if self.vectors is not None \
+                    else [(-1, 0.0)] * len(prompts)
+            for row, score in matches:
+                if row >= 0 and score >= self.threshold:
+                    self._clock += 1
+                    self.last_used[row] = self._clock
+                    self.stats["hits"] += 1
+                    out.append(self.responses[row])
+                else:
+                    self.stats["misses"] += 1
+                    out.append(None)
+        return out
+
+    # ── insert / evict ─────────────────────────────────────────────────────────
+    def insert(self, prompt: str, response: str) -> None:
+        self.insert_many([prompt], [response])
+
+    def insert_many(self, prompts: Sequence[str], responses: Sequence[str]) -> None:
+        vecs = _normalise(self.embedder.embed(prompts))
+        with self._lock:
+            if self.vectors is None:
+                self._allocate(vecs.shape[1])
+            for vec, prompt, response in zip(vecs, prompts, responses):
+                if self.size < self.capacity:
+                    row = self.size
+                    self.size += 1
+                    self.prompts.append(prompt)
+                    self.responses.append(response)
+                else:
+                    row = int(np.argmin(self.last_used[:self.capacity]))   # LRU
+                    self.prompts[row] = prompt
+                    self.responses[row] = response
+                    self.stats["evictions"] += 1
+                self.vectors[row] = vec
+                self.keys[row] = _prompt_key(prompt)
+                self._clock += 1
+                self.last_used[row] = self._clock
+                self._assign(row)
+                self.stats["inserts"] += 1
+                self._unsaved += 1
+            if self.path is not None and self._unsaved >= self.autosave_every:
+                self.save()